@@ -0,0 +1,218 @@
+# Lightweight stand-ins for the ComfyUI modules which the extension imports at module level:
+#   nodes, server, folder_paths, execution, comfy.model_management (and torch, when it isn't installed)
+# install() must be called before anything from workflow_component is imported.
+# They only implement what the extension touches. Nothing is rendered, sent or loaded.
+
+import importlib.util
+import json
+import os
+import sys
+import types
+
+# node types of the component files which are provided by the editor or by this extension
+EDITOR_NODE_TYPES = {"ComponentInput", "ComponentInputOptional", "ComponentOutput", "Reroute", "Note", "PrimitiveNode"}
+
+
+class Routes:
+    def get(self, path):
+        return lambda handler: handler
+
+    def post(self, path):
+        return lambda handler: handler
+
+
+class PromptServer:
+    instance = None
+
+    def __init__(self):
+        self.client_id = None
+        self.last_node_id = None
+        self.routes = Routes()
+        self.on_prompt_handlers = []
+        self.sent = 0
+
+    def add_on_prompt_handler(self, handler):
+        self.on_prompt_handlers.append(handler)
+
+    def send_sync(self, event, data, sid=None):
+        self.sent += 1
+
+
+class InterruptProcessingException(Exception):
+    pass
+
+
+class InferenceMode:
+    def __init__(self, mode=True):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def new_module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    module.__file__ = f"<stand-in {name}>"
+    return module
+
+
+def make_nodes():
+    return new_module("nodes", NODE_CLASS_MAPPINGS={}, NODE_DISPLAY_NAME_MAPPINGS={}, EXTENSION_WEB_DIRS={},
+                      before_node_execution=lambda: None, interrupt_processing=lambda value=True: None)
+
+
+def make_folder_paths(work_dir):
+    def get_directory(name):
+        path = os.path.join(work_dir, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    module = new_module("folder_paths", folder_names_and_paths={},
+                        get_filename_list=lambda folder_name: [],
+                        get_user_directory=lambda: get_directory("user"),
+                        get_temp_directory=lambda: get_directory("temp"),
+                        get_output_directory=lambda: get_directory("output"),
+                        get_input_directory=lambda: get_directory("input"))
+    module.__file__ = os.path.join(work_dir, "folder_paths.py")
+    return module
+
+
+def make_execution():
+    return new_module("execution", format_value=lambda value: str(value),
+                      full_type_name=lambda klass: f"{klass.__module__}.{klass.__qualname__}")
+
+
+def make_model_management():
+    return new_module("comfy.model_management", InterruptProcessingException=InterruptProcessingException,
+                      soft_empty_cache=lambda force=False: None, cleanup_models=lambda: None,
+                      get_free_memory=lambda device=None, torch_free_too=False: 1 << 40)
+
+
+def make_torch():
+    class Tensor:
+        pass
+
+    def unavailable(*args, **kwargs):
+        raise NotImplementedError("torch is not installed")
+
+    return new_module("torch", Tensor=Tensor, inference_mode=InferenceMode, no_grad=InferenceMode, bfloat16=object(),
+                      is_tensor=lambda value: isinstance(value, Tensor), cat=unavailable, split=unavailable)
+
+
+# Returns True when torch is a stand-in, so the caller can record it with the results.
+def install(work_dir):
+    server = new_module("server", PromptServer=PromptServer)
+    PromptServer.instance = PromptServer()
+
+    model_management = make_model_management()
+    comfy = new_module("comfy", model_management=model_management)
+
+    sys.modules.update({
+        'nodes': make_nodes(),
+        'server': server,
+        'folder_paths': make_folder_paths(work_dir),
+        'execution': make_execution(),
+        'comfy': comfy,
+        'comfy.model_management': model_management,
+    })
+
+    # the real torch is imported by the extension itself
+    if 'torch' in sys.modules or importlib.util.find_spec("torch") is not None:
+        return False
+
+    sys.modules['torch'] = make_torch()
+    return True
+
+
+def get_widget_spec(value):
+    if isinstance(value, bool):
+        return "BOOLEAN", {"default": value}
+    if isinstance(value, int):
+        return "INT", {"default": value, "min": -(1 << 63), "max": 1 << 63}
+    if isinstance(value, float):
+        return "FLOAT", {"default": value, "min": -1e9, "max": 1e9, "step": 0.01}
+
+    return "STRING", {"default": str(value)}
+
+
+def make_standin_node(node_type, required, return_types, return_names):
+    def doit(self, **kwargs):
+        return (None, ) * len(return_types)
+
+    return type(node_type, (), {
+        'INPUT_TYPES': classmethod(lambda cls: {"required": dict(required)}),
+        'RETURN_TYPES': tuple(return_types),
+        'RETURN_NAMES': tuple(return_names),
+        'OUTPUT_NODE': len(return_types) == 0,
+        'FUNCTION': "doit",
+        'CATEGORY': "benchmark/stand-in",
+        'doit': doit,
+    })
+
+
+# Stand-in classes for the node types used by the component files, so the components can be analyzed without the node packs.
+# The input types are recovered from the saved workflows:
+#   the order of the API prompt inputs is the order of INPUT_TYPES (widgets first), the widget values give the types,
+#   and the converted widgets keep their original config.
+def collect_node_types(directory):
+    found = {}
+    for root, dirs, files in os.walk(directory):
+        for file in sorted(files):
+            if not file.endswith(".component.json"):
+                continue
+
+            with open(os.path.join(root, file), "rb") as f:
+                workflow = json.loads(f.read().decode("utf-8"))
+
+            prompt = workflow.get('output', {})
+            for node in workflow.get('nodes', []):
+                node_type = node['type']
+                if node_type in EDITOR_NODE_TYPES:
+                    continue
+
+                required, return_types, return_names = found.setdefault(node_type, ({}, [], []))
+
+                link_types = {}
+                widget_configs = {}
+                for node_input in node.get('inputs') or []:
+                    if 'widget' in node_input and 'config' in node_input['widget']:
+                        widget_configs[node_input['widget']['name']] = node_input['widget']['config']
+                    else:
+                        link_types[node_input['name']] = node_input['type']
+
+                prompt_inputs = prompt.get(str(node['id']), {}).get('inputs', {})
+                for name, value in prompt_inputs.items():
+                    if name in required:
+                        continue
+
+                    if name in widget_configs:
+                        config = widget_configs[name]
+                        required[name] = (config[0], config[1]) if len(config) > 1 else (config[0], )
+                    elif isinstance(value, list):
+                        required[name] = (link_types.get(name, "*"), )
+                    else:
+                        required[name] = get_widget_spec(value)
+
+                for name, link_type in link_types.items():
+                    required.setdefault(name, (link_type, ))
+
+                if len(return_types) == 0:
+                    for node_output in node.get('outputs') or []:
+                        return_types.append(node_output.get('type', "*"))
+                        return_names.append(node_output.get('name', node_output.get('type', "*")))
+
+    return found
+
+
+def register_standin_nodes(directory, node_class_mappings):
+    count = 0
+    for node_type, (required, return_types, return_names) in collect_node_types(directory).items():
+        if node_type not in node_class_mappings:
+            node_class_mappings[node_type] = make_standin_node(node_type, required, return_types, return_names)
+            count += 1
+
+    return count
@@ -0,0 +1,370 @@
+# Offline benchmark of the component loader and the executor.
+# ComfyUI is replaced by the stand-ins of comfy_standins.py and the graphs are made of cheap CPU nodes,
+# so it runs anywhere with a plain Python. (torch is optional)
+# Run from the repository root:
+#   python benchmark/offline_benchmark.py [--sizes 10,100,1000,10000,100000] [--repeat 3] [--output result.json] [--compare baseline.json]
+#
+# The results are written as JSON, to compare the versions:
+#   {"version", "git", "python", "torch", "settings", "results": {suite: [{"name", "nodes", "best_s", "median_s", ...}]}}
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import comfy_standins  # noqa: E402
+
+COMPONENTS_DIR = os.path.join(ROOT, "components")
+
+
+class BenchAdd:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"value": ("INT", {"default": 0})},
+                "optional": {"a": ("INT", ), "b": ("INT", ), "c": ("INT", )}}
+
+    RETURN_TYPES = ("INT", )
+    FUNCTION = "doit"
+    CATEGORY = "benchmark"
+
+    def doit(self, value, a=0, b=0, c=0):
+        return (value + a + b + c, )
+
+
+class BenchOutput(BenchAdd):
+    RETURN_TYPES = ()
+    OUTPUT_NODE = True
+
+    def doit(self, value, a=0, b=0, c=0):
+        return {"ui": {"total": [value + a + b + c]}, "result": ()}
+
+
+# graph generators: n -> {unique_id: [source ids]}, at most 3 sources per node
+def make_chain(n):
+    return {str(i): [str(i-1)] if i > 0 else [] for i in range(n)}
+
+
+def make_wide(n):
+    # one source, fan-out to n-1 output nodes
+    return {str(i): ["0"] if i > 0 else [] for i in range(n)}
+
+
+def make_layered(n, width=50, fan_in=3, seed=0):
+    rnd = random.Random(seed)
+    inputs_of = {}
+    for i in range(n):
+        if i < width:
+            inputs_of[str(i)] = []
+        else:
+            layer_start = (i // width - 1) * width
+            inputs_of[str(i)] = [str(x) for x in rnd.sample(range(layer_start, layer_start + width), fan_in)]
+    return inputs_of
+
+
+GRAPHS = {'chain': make_chain, 'wide': make_wide, 'layered': make_layered}
+
+
+# nodes without consumers become the output nodes
+def make_prompt(inputs_of):
+    consumed = {x for sources in inputs_of.values() for x in sources}
+    prompt = {}
+    for i, (unique_id, sources) in enumerate(inputs_of.items()):
+        inputs = {"value": i}
+        for name, source_id in zip(("a", "b", "c"), sources):
+            inputs[name] = [source_id, 0]
+
+        prompt[unique_id] = {"class_type": "BenchAdd" if unique_id in consumed else "BenchOutput", "inputs": inputs}
+
+    return prompt
+
+
+def measure(func, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        func(state)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def make_result(name, times, nodes=None, **extra):
+    result = {'name': name, 'best_s': min(times), 'median_s': statistics.median(times), 'repeat': len(times)}
+    if nodes:
+        result['nodes'] = nodes
+        result['per_node_us'] = min(times) / nodes * 1e6
+        result['nodes_per_s'] = nodes / min(times) if min(times) > 0 else None
+    result.update(extra)
+    return result
+
+
+def reset_loader(cl, nodes):
+    for name in cl.NODE_CLASS_MAPPINGS:
+        nodes.NODE_CLASS_MAPPINGS.pop(name, None)
+
+    cl.NODE_CLASS_MAPPINGS.clear()
+    cl.workflow_components.clear()
+    cl.pending_workflows.clear()
+    cl.unresolved_map.clear()
+    cl.component_cache = None
+    cl.component_cache_dirty = False
+
+
+def bench_load_all(cl, nodes, repeat):
+    cache_path = cl.get_component_cache_path()
+
+    def load(lazy, use_cache, keep_cache):
+        def setup():
+            reset_loader(cl, nodes)
+            cl.USE_COMPONENT_CACHE = use_cache
+            if not keep_cache and os.path.exists(cache_path):
+                os.remove(cache_path)
+
+        def run(state):
+            cl.load_all(COMPONENTS_DIR, lazy=lazy)
+
+        return measure(run, repeat, setup)
+
+    results = [
+        make_result("eager_no_cache", load(False, False, False)),
+        make_result("lazy_cold_cache", load(True, True, False)),
+        make_result("lazy_warm_cache", load(True, True, True)),
+    ]
+
+    for result in results:
+        result['components'] = len(cl.NODE_CLASS_MAPPINGS)
+
+    cl.USE_COMPONENT_CACHE = True
+    return results
+
+
+def read_components():
+    workflows = []
+    for root, dirs, files in os.walk(COMPONENTS_DIR):
+        for file in sorted(files):
+            if file.endswith(".component.json"):
+                with open(os.path.join(root, file), "rb") as f:
+                    workflows.append((file[:-15], json.loads(f.read().decode("utf-8"))))
+    return workflows
+
+
+def bench_dynamic_class(cl, repeat):
+    workflows = read_components()
+    classes = []
+
+    def create(state):
+        classes[:] = [cl.create_dynamic_class(f"## bench {name}", workflow, lazy=False) for name, workflow in workflows]
+
+    def input_types(state):
+        for obj in classes:
+            obj.INPUT_TYPES()
+
+    def reset_memo():
+        # a new class has no memoized input types
+        create(None)
+
+    broken = 0
+    create(None)
+    for obj in classes:
+        if "BROKEN component" in obj.INPUT_TYPES()['required']:
+            broken += 1
+
+    calls = len(workflows)
+    return [
+        make_result("create_dynamic_class", measure(create, repeat), calls=calls),
+        make_result("input_types_first", measure(input_types, repeat, reset_memo), calls=calls),
+        make_result("input_types_memoized", measure(input_types, repeat), calls=calls),
+    ], broken
+
+
+def run_worklist(ee, server, prompt, output_ids):
+    outputs = {}
+    outputs_ui = {}
+    shared_refs = {}
+    to_execute = ee.worklist_will_execute(prompt, outputs, list(output_ids))
+    next_nodes = ee.get_next_nodes_map(prompt)
+    executed, success, error, ex = ee.worklist_execute(server, prompt, outputs, {}, "benchmark", outputs_ui, to_execute, next_nodes, {},
+                                                       shared_refs=shared_refs)
+    if success is not True:
+        raise RuntimeError(f"benchmark graph failed: {error}")
+
+    for key in shared_refs.values():
+        ee.shared_cache.release(key)
+
+    return outputs, outputs_ui, executed
+
+
+def bench_worklist_execute(ee, server, sizes, repeat):
+    results = []
+    for name, make in GRAPHS.items():
+        for n in sizes:
+            prompt = make_prompt(make(n))
+            output_ids = [x for x, value in prompt.items() if value['class_type'] == "BenchOutput"]
+
+            executed = []
+
+            def run(state):
+                executed[:] = [len(run_worklist(ee, server, prompt, output_ids)[2])]
+
+            results.append(make_result(f"{name}-{n}", measure(run, repeat), nodes=n, graph=name, executed=executed[0]))
+            print(f"  worklist_execute {name:<8}{n:>8} nodes {results[-1]['per_node_us']:>10.2f} us/node")
+    return results
+
+
+def bench_invalidation(ee, server, sizes, repeat):
+    results = []
+    for name, make in GRAPHS.items():
+        for n in sizes:
+            prompt = make_prompt(make(n))
+            output_ids = [x for x, value in prompt.items() if value['class_type'] == "BenchOutput"]
+            outputs, outputs_ui, _ = run_worklist(ee, server, prompt, output_ids)
+            keys = ee.worklist_output_delete_if_changed(prompt, {}, {}, dict(outputs), dict(outputs_ui), set(), {}, {}, released=set())
+
+            # "0" is a source of every graph
+            changed_prompt = dict(prompt)
+            changed_prompt["0"] = {"class_type": prompt["0"]['class_type'], "inputs": dict(prompt["0"]['inputs'], value=-1)}
+
+            for case, target_prompt in (("unchanged", prompt), ("source_changed", changed_prompt)):
+                retained = []
+
+                # (node_keys, outputs, outputs_ui) of the previous run
+                def setup():
+                    return dict(keys), dict(outputs), dict(outputs_ui)
+
+                def run(state):
+                    ee.worklist_output_delete_if_changed(target_prompt, state[0], {}, state[1], state[2], set(), {}, {}, released=set())
+                    retained[:] = [len(state[1])]
+
+                results.append(make_result(f"{name}-{n}-{case}", measure(run, repeat, setup), nodes=n, graph=name, case=case,
+                                           retained=retained[0]))
+                print(f"  invalidation     {name:<8}{n:>8} nodes {case:<15}{results[-1]['per_node_us']:>10.2f} us/node")
+    return results
+
+
+def get_version():
+    with open(os.path.join(ROOT, "__init__.py")) as f:
+        found = re.search(r"\(V([0-9.]+)\)", f.read())
+    return found.group(1) if found else None
+
+
+def get_git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+# prints the results which got slower than the baseline by more than 'threshold'
+def compare(report, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    regressions = 0
+    print(f"compared with {baseline_path} (version={baseline.get('version')}, git={baseline.get('git')})")
+    for suite, results in report['results'].items():
+        old_results = {x['name']: x for x in baseline.get('results', {}).get(suite, [])}
+        for result in results:
+            old = old_results.get(result['name'])
+            if old is None or old['best_s'] <= 0:
+                continue
+
+            ratio = result['best_s'] / old['best_s']
+            if ratio > 1 + threshold:
+                regressions += 1
+                print(f"  REGRESSION {suite}/{result['name']}: {old['best_s']*1e3:.3f}ms -> {result['best_s']*1e3:.3f}ms (x{ratio:.2f})")
+
+    print(f"  {regressions} regression(s)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default="10,100,1000,10000,100000", help="node counts of the generated graphs")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--suites', default="load_all,dynamic_class,worklist_execute,invalidation")
+    parser.add_argument('--output', default=None, help="JSON file of the results (default: stdout)")
+    parser.add_argument('--compare', default=None, help="JSON file of a previous run")
+    parser.add_argument('--threshold', type=float, default=0.2, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",") if x]
+    suites = set(args.suites.split(","))
+
+    work_dir = tempfile.mkdtemp(prefix="workflow-component-bench-")
+    try:
+        torch_standin = comfy_standins.install(work_dir)
+
+        import nodes
+        import server
+        import workflow_component.custom_nodes as custom_nodes
+        import workflow_component.component_loader as cl
+        import workflow_component.execution_experimental as ee
+
+        for name in ["ExecutionSwitch", "ExecutionBlocker", "ExecutionControlString", "ExecutionOneOf", "ComboToString", "TensorToCPU",
+                     "LoopControl", "LoopCounterCondition", "InputZip", "InputUnzip", "OptionalTest"]:
+            nodes.NODE_CLASS_MAPPINGS[name] = getattr(custom_nodes, name)
+
+        standins = comfy_standins.register_standin_nodes(COMPONENTS_DIR, nodes.NODE_CLASS_MAPPINGS)
+        nodes.NODE_CLASS_MAPPINGS.update(BenchAdd=BenchAdd, BenchOutput=BenchOutput)
+
+        report = {
+            'version': get_version(),
+            'git': get_git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'torch': None if torch_standin else sys.modules['torch'].__version__,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'settings': {
+                'repeat': args.repeat,
+                'sizes': sizes,
+                'standin_node_types': standins,
+                'lazy_control': ee.ENABLE_LAZY_CONTROL,
+                'parallel_execution': ee.PARALLEL_EXECUTION,
+                'shared_cache': ee.shared_cache.ENABLE_SHARED_CACHE,
+                'load_workers': cl.LOAD_WORKERS,
+            },
+            'results': {},
+        }
+
+        if "load_all" in suites:
+            print("load_all")
+            report['results']['load_all'] = bench_load_all(cl, nodes, args.repeat)
+
+        if "dynamic_class" in suites:
+            print("create_dynamic_class / INPUT_TYPES")
+            report['results']['dynamic_class'], report['settings']['broken_components'] = bench_dynamic_class(cl, args.repeat)
+
+        if "worklist_execute" in suites:
+            print("worklist_execute")
+            report['results']['worklist_execute'] = bench_worklist_execute(ee, server.PromptServer.instance, sizes, args.repeat)
+
+        if "invalidation" in suites:
+            print("worklist_output_delete_if_changed")
+            report['results']['invalidation'] = bench_invalidation(ee, server.PromptServer.instance, sizes, args.repeat)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"results: {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare is not None:
+        compare(report, args.compare, args.threshold)
+
+
+if __name__ == '__main__':
+    main()
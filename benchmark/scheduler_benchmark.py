@@ -0,0 +1,98 @@
+# Scheduling overhead of the component executor on synthetic graphs.
+# The graphs run through ExecutionPlan and ExpPromptExecutor as a component does, on the stand-ins of comfy_standins.py.
+# Run from the repository root:
+#   python benchmark/scheduler_benchmark.py [--nodes 10000] [--repeat 5]
+#
+#   plan: building the ExecutionPlan (priorities, liveness)
+#   fifo: execution without a plan, the ready nodes run in the insertion order
+#   heap / memory: execution with the plan, in the default and the memory-first schedule
+#   cached: execution of the unchanged prompt, every output is cached
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import comfy_standins  # noqa: E402
+from benchmark.offline_benchmark import GRAPHS, BenchAdd, BenchOutput, make_prompt  # noqa: E402
+
+
+def make_workflow(prompt):
+    return {'nodes': [{'id': int(unique_id), 'type': value['class_type']} for unique_id, value in prompt.items()]}
+
+
+def execute(ee, executor, prompt, output_ids, plan=None, schedule_mode='default'):
+    # the executor prints the time of every execution
+    with contextlib.redirect_stdout(io.StringIO()):
+        if plan is not None:
+            executor.execute(plan.new_prompt(()), "benchmark", execute_outputs=output_ids, plan=plan, schedule_mode=schedule_mode)
+        else:
+            executor.execute(prompt, "benchmark", execute_outputs=output_ids)
+
+
+# a new executor for every run, so nothing is cached from the previous one
+def run_cold(ee, server, prompt, output_ids, plan=None, schedule_mode='default'):
+    executor = ee.ExpPromptExecutor(server)
+    execute(ee, executor, prompt, output_ids, plan, schedule_mode)
+    executor.release_shared_refs()
+
+
+def measure(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    comfy_standins.install(tempfile.mkdtemp(prefix="workflow-component-bench-"))
+
+    import nodes
+    import server
+    import workflow_component.execution_experimental as ee
+    import workflow_component.reclaim as reclaim
+
+    nodes.NODE_CLASS_MAPPINGS.update(BenchAdd=BenchAdd, BenchOutput=BenchOutput)
+
+    # the collection after every execution isn't a part of the scheduling
+    reclaim.set_reclaim_mode('next-prompt')
+
+    n = args.nodes
+    prompt_server = server.PromptServer.instance
+
+    print(f"{'graph':<10}{'plan(ms)':>12}{'fifo(us/node)':>16}{'heap(us/node)':>16}{'memory(us/node)':>18}{'cached(us/node)':>18}")
+    for name, make in GRAPHS.items():
+        prompt = make_prompt(make(n))
+        workflow = make_workflow(prompt)
+        output_ids = [x for x, value in prompt.items() if value['class_type'] == "BenchOutput"]
+
+        plan = ee.ExecutionPlan(prompt, workflow)
+        t_plan = measure(lambda: ee.ExecutionPlan(prompt, workflow), args.repeat)
+        t_fifo = measure(lambda: run_cold(ee, prompt_server, prompt, output_ids), args.repeat)
+        t_heap = measure(lambda: run_cold(ee, prompt_server, prompt, output_ids, plan), args.repeat)
+        t_memory = measure(lambda: run_cold(ee, prompt_server, prompt, output_ids, plan, 'memory'), args.repeat)
+
+        executor = ee.ExpPromptExecutor(prompt_server)
+        execute(ee, executor, prompt, output_ids, plan)
+        t_cached = measure(lambda: execute(ee, executor, prompt, output_ids, plan), args.repeat)
+        executor.release_shared_refs()
+
+        print(f"{name:<10}{t_plan*1e3:>12.2f}{t_fifo/n*1e6:>16.2f}{t_heap/n*1e6:>16.2f}{t_memory/n*1e6:>18.2f}{t_cached/n*1e6:>18.2f}")
+
+
+if __name__ == '__main__':
+    main()
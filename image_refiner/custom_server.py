@@ -5,10 +5,12 @@ from aiohttp import web
 from PIL import Image, ImageOps
 import zipfile
 import datetime
+import time
 
 import server
 import folder_paths
 import image_refiner.imagerefiner as ir
+import workflow_component.metrics as metrics
 
 
 def get_path_from_fileitem(image):
@@ -66,7 +68,9 @@ async def imagerefiner_generate(request):
     for result_pil in images:
         base_pil = Image.alpha_composite(base_pil, result_pil)
 
+    generate_start = time.perf_counter()
     result = ir.generate(base_pil.convert('RGB'), mask_pil, prompt_data)
+    metrics.observe_refiner(time.perf_counter() - generate_start)
 
     return web.json_response(result, content_type='application/json')
 
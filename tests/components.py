@@ -0,0 +1,190 @@
+# Helpers to build and run the components in the tests.
+
+import itertools
+
+import folder_paths
+import nodes
+
+import workflow_component.custom_nodes as custom_nodes
+import workflow_component.component_loader as component_loader
+import workflow_component.workflow_execution as workflow_execution
+
+# node type -> number of the executions
+calls = {}
+
+
+def count_call(name):
+    calls[name] = calls.get(name, 0) + 1
+
+
+class ConstNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"value": ("INT", {"default": 0, "min": -1000, "max": 1000})}}
+
+    RETURN_TYPES = ("INT", )
+    FUNCTION = "doit"
+    CATEGORY = "tests"
+
+    def doit(self, value):
+        count_call("TestConst")
+        return (value, )
+
+
+class AddNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"a": ("INT", ), "b": ("INT", {"default": 0, "min": -1000, "max": 1000})}}
+
+    RETURN_TYPES = ("INT", )
+    FUNCTION = "doit"
+    CATEGORY = "tests"
+
+    def doit(self, a, b):
+        count_call("TestAdd")
+        return (a + b, )
+
+
+class MulNode(AddNode):
+    def doit(self, a, b):
+        count_call("TestMul")
+        return (a * b, )
+
+
+# lists the files of the 'tests' model folder, like the loader nodes
+class LoaderNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"name": (folder_paths.get_filename_list("tests"), )}}
+
+    RETURN_TYPES = ("STRING", )
+    FUNCTION = "doit"
+    CATEGORY = "tests"
+
+    def doit(self, name):
+        count_call("TestLoader")
+        return (name, )
+
+
+TEST_NODES = {
+    "TestConst": ConstNode,
+    "TestAdd": AddNode,
+    "TestMul": MulNode,
+    "TestLoader": LoaderNode,
+    "ExecutionSwitch": custom_nodes.ExecutionSwitch,
+    "ExecutionOneOf": custom_nodes.ExecutionOneOf,
+    "ExecutionControlString": custom_nodes.ExecutionControlString,
+}
+
+nodes.NODE_CLASS_MAPPINGS.update(TEST_NODES)
+
+component_counter = itertools.count(1)
+node_id_counter = itertools.count(1000)
+
+
+# the rule of the widget slots in component_loader.build_input_types
+def is_widget(spec):
+    return len(spec) >= 2 and 'default' in spec[1] or isinstance(spec[0], list) or spec[0] == "STRING"
+
+
+def get_slot_specs(class_def):
+    input_types = class_def.INPUT_TYPES()
+    return dict(input_types.get('required', {}), **input_types.get('optional', {}))
+
+
+# Builds a .component.json workflow from an API prompt.
+#   prompt: {node id: {"class_type", "inputs"}} with the links as [source id, slot] and the widget values as constants
+#   component_inputs: {name: node id} of the ComponentInput nodes
+#   component_outputs: {name: (source id, slot)}
+# A link into a widget slot is a converted widget, and the ComponentInput takes the type of the widget.
+def make_workflow(prompt, component_inputs, component_outputs):
+    prompt = {str(key): {'class_type': value['class_type'], 'inputs': dict(value['inputs'])} for key, value in prompt.items()}
+    next_id = max([int(x) for x in prompt] + [int(x) for x in component_inputs.values()]) + 1
+
+    for name, node_id in component_inputs.items():
+        prompt[str(node_id)] = {'inputs': {}, 'type': "ComponentInput", 'title': name}
+
+    for name, (source_id, slot) in component_outputs.items():
+        prompt[str(next_id)] = {'inputs': {name: [str(source_id), slot]}, 'type': "ComponentOutput", 'title': name}
+        next_id += 1
+
+    links = []
+    editor_nodes = {}
+    for node_id, value in prompt.items():
+        node_type = value.get('class_type', value.get('type'))
+        node = {'id': int(node_id), 'type': node_type, 'inputs': [], 'outputs': []}
+        if 'title' in value:
+            node['title'] = value['title']
+
+        class_def = nodes.NODE_CLASS_MAPPINGS.get(node_type)
+        if class_def is not None:
+            node['outputs'] = [{'name': name, 'type': output_type, 'links': []}
+                               for name, output_type in zip(getattr(class_def, 'RETURN_NAMES', class_def.RETURN_TYPES), class_def.RETURN_TYPES)]
+            node['widgets_values'] = []
+            for name, spec in get_slot_specs(class_def).items():
+                if is_widget(spec):
+                    default = (spec[0] or [""])[0] if isinstance(spec[0], list) else spec[1].get('default', "") if len(spec) > 1 else ""
+                    input_data = value['inputs'].get(name, default)
+                    node['widgets_values'].append(default if isinstance(input_data, list) else input_data)
+        elif node_type == "ComponentInput":
+            node['outputs'] = [{'name': value['title'], 'type': "INT", 'links': [], 'label': value['title']}]
+
+        editor_nodes[node_id] = node
+
+    for node_id, value in prompt.items():
+        node = editor_nodes[node_id]
+        class_def = nodes.NODE_CLASS_MAPPINGS.get(node['type'])
+        specs = get_slot_specs(class_def) if class_def is not None else {}
+
+        for name, input_data in value['inputs'].items():
+            if not isinstance(input_data, list):
+                continue
+
+            source_id, slot = input_data
+            link_id = len(links) + 1
+            node_input = {'name': name, 'type': "INT" if class_def is None else "*", 'link': link_id, 'label': name}
+
+            spec = specs.get(name)
+            if spec is not None and is_widget(spec):
+                node_input['type'] = "COMBO" if isinstance(spec[0], list) else spec[0]
+                node_input['widget'] = {'name': name, 'config': [spec[0], dict(spec[1]) if len(spec) > 1 else {}]}
+
+            source = editor_nodes[source_id]
+            if source['type'] == "ComponentInput" and 'widget' in node_input:
+                source['outputs'][0]['type'] = node_input['type']
+
+            links.append([link_id, int(source_id), slot, int(node_id), len(node['inputs']), node_input['type']])
+            node['inputs'].append(node_input)
+            source['outputs'][slot]['links'].append(link_id)
+
+    output = {}
+    for node_id, value in prompt.items():
+        output[node_id] = {'inputs': dict(value['inputs'])} if 'class_type' not in value else dict(value)
+
+    return {'nodes': list(editor_nodes.values()), 'links': links, 'output': output}
+
+
+def load_component(workflow):
+    ok, name = component_loader.load_component(f"test-{next(component_counter)}", False, workflow, direct_reflect=True)
+    assert ok
+    return nodes.NODE_CLASS_MAPPINGS[name]
+
+
+def get_component_name(component_class):
+    return next(name for name, value in nodes.NODE_CLASS_MAPPINGS.items() if value is component_class)
+
+
+# Executes a component node as the outer prompt would. The outer prompt has only this node.
+# The prompt validation of ComfyUI calls INPUT_TYPES first, which maps the input names of the component.
+def run_component(component_class, node_id=None, out_prompt=None, **inputs):
+    component_class.INPUT_TYPES()
+    node_id = str(next(node_id_counter)) if node_id is None else str(node_id)
+    class_type = get_component_name(component_class)
+
+    outputs = [{'links': [i + 1]} for i in range(len(component_class.RETURN_TYPES))]
+    extra_pnginfo = {'workflow': {'nodes': [{'id': int(node_id), 'type': class_type, 'outputs': outputs}]}}
+    if out_prompt is None:
+        out_prompt = {node_id: {'inputs': dict(inputs), 'class_type': class_type}}
+
+    workflow_execution.extra_pnginfo = extra_pnginfo
+    return component_class().doit(unique_id=node_id, extra_pnginfo=extra_pnginfo, out_prompt=out_prompt, **inputs)
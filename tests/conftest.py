@@ -0,0 +1,30 @@
+# The tests run without ComfyUI. The modules which the extension imports at module level are replaced by
+# the stand-ins of the benchmark suite, so they must be installed before anything from workflow_component is imported.
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import comfy_standins  # noqa: E402
+
+comfy_standins.install(tempfile.mkdtemp(prefix="workflow-component-tests-"))
+
+
+# The repository root is the extension package. pytest would import its __init__.py to set up the package,
+# which registers the server routes and loads the bundled components, so it is collected as a plain directory.
+class ExtensionRootDirectory:
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_collect_directory(self, path, parent):
+        if str(path) == ROOT:
+            return pytest.Dir.from_parent(parent, path=path)
+
+        return None
+
+
+def pytest_configure(config):
+    config.pluginmanager.register(ExtensionRootDirectory(), "workflow-component-root")
@@ -0,0 +1,56 @@
+import nodes
+import pytest
+
+import workflow_component.execution_experimental as execution_experimental
+import workflow_component.shared_cache as shared_cache
+
+from components import AddNode, calls, make_workflow, load_component, run_component
+
+input_types_calls = {'count': 0}
+
+
+class CountingAdd(AddNode):
+    @classmethod
+    def INPUT_TYPES(s):
+        input_types_calls['count'] += 1
+        return super().INPUT_TYPES()
+
+
+nodes.NODE_CLASS_MAPPINGS["TestCountingAdd"] = CountingAdd
+
+
+@pytest.fixture(autouse=True)
+def no_shared_cache(monkeypatch):
+    monkeypatch.setattr(shared_cache, "ENABLE_SHARED_CACHE", False)
+
+
+# a chain of 6 nodes of the same class: a + 1 + 2 + ... + 6
+def make_counting_chain(length=6):
+    prompt = {}
+    for i in range(length):
+        prompt[2 + i] = {'class_type': "TestCountingAdd", 'inputs': {'a': [str(1 + i), 0], 'b': i + 1}}
+
+    return load_component(make_workflow(prompt, {'a': 1}, {'out': (1 + length, 0)}))
+
+
+def test_input_types_are_read_once_per_class_in_a_run():
+    component = make_counting_chain()
+    # the classes are also inspected once per process, when their outputs are replaced first
+    assert run_component(component, node_id=1701, a=0) == (21, )
+    assert run_component(component, node_id=1701, a=50) == (71, )
+
+    count = input_types_calls['count']
+    executed = calls.get("TestAdd", 0)
+
+    assert run_component(component, node_id=1701, a=100) == (121, )
+    assert calls["TestAdd"] == executed + 6
+    assert input_types_calls['count'] == count + 1
+
+
+def test_metadata_follows_the_class_definition():
+    metadata_cache = {}
+    metadata = execution_experimental.get_class_metadata(CountingAdd, metadata_cache)
+
+    assert execution_experimental.get_class_metadata(CountingAdd, metadata_cache) is metadata
+    assert metadata.required == {"a", "b"} and metadata.optional == frozenset()
+    assert not metadata.is_one_of and not metadata.is_loop_control
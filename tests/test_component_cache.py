@@ -0,0 +1,113 @@
+import json
+import os
+
+import folder_paths
+import pytest
+
+import workflow_component.component_loader as component_loader
+
+from components import make_workflow, run_component
+from test_input_types_memo import list_files
+
+
+@pytest.fixture
+def loader(tmp_path, monkeypatch):
+    model_folder = tmp_path / "models"
+    model_folder.mkdir()
+    (model_folder / "a.ckpt").write_text("")
+    monkeypatch.setitem(folder_paths.folder_names_and_paths, "tests", ([str(model_folder)], set()))
+    monkeypatch.setattr(folder_paths, "get_filename_list", lambda folder_name: list_files(model_folder) if folder_name == "tests" else [])
+    monkeypatch.setattr(folder_paths, "get_user_directory", lambda: str(tmp_path / "user"))
+
+    components_dir = tmp_path / "components"
+    components_dir.mkdir()
+    prompt = {
+        2: {'class_type': "TestLoader", 'inputs': {'name': ["1", 0]}},
+        5: {'class_type': "TestAdd", 'inputs': {'a': ["3", 0], 'b': ["4", 0]}},
+    }
+    workflow = make_workflow(prompt, {'model': 1, 'a': 3, 'b': 4}, {'name': (2, 0), 'sum': (5, 0)})
+    (components_dir / "cached.component.json").write_text(json.dumps(workflow))
+
+    def load_all():
+        for name in component_loader.NODE_CLASS_MAPPINGS:
+            component_loader.comfy_nodes.NODE_CLASS_MAPPINGS.pop(name, None)
+        component_loader.NODE_CLASS_MAPPINGS.clear()
+        component_loader.component_cache = None
+
+        component_loader.load_all(str(components_dir), lazy=True, workers=1)
+        component_class = next(iter(component_loader.NODE_CLASS_MAPPINGS.values()))
+        component_loader.comfy_nodes.NODE_CLASS_MAPPINGS.update(component_loader.NODE_CLASS_MAPPINGS)
+        return component_class
+
+    yield load_all, model_folder
+
+    for name in component_loader.NODE_CLASS_MAPPINGS:
+        component_loader.comfy_nodes.NODE_CLASS_MAPPINGS.pop(name, None)
+    component_loader.NODE_CLASS_MAPPINGS.clear()
+    component_loader.component_cache = None
+    component_loader.component_cache_dirty = False
+
+
+def test_cache_is_plain_json_in_the_user_directory(loader):
+    load_all, _ = loader
+    input_types = load_all().INPUT_TYPES()
+    component_loader.save_component_cache()
+
+    path = component_loader.get_component_cache_path()
+    assert os.path.dirname(path) == folder_paths.get_user_directory()
+
+    with open(path, encoding="utf-8") as file:
+        entry = next(iter(json.load(file)['entries'].values()))
+
+    assert entry['name'] == "cached"
+    assert entry['interface']['return_types'] == ["INT", "INT"]
+    assert entry['interface']['input_types']['required']['model'] == [None]
+    assert list(entry['interface']['input_types']['required']) == list(input_types['required'])
+
+
+def test_cached_interface_is_used_without_parsing(loader):
+    load_all, model_folder = loader
+    input_types = load_all().INPUT_TYPES()
+    component_loader.save_component_cache()
+
+    component_class = load_all()
+    assert component_loader.component_cache_stats['hit'] == 1
+    assert component_class.INPUT_TYPES() == input_types
+    assert component_class.RETURN_TYPES == ("INT", "INT")
+    assert component_class.interface is None
+
+    # the combo lists are taken from the node classes, not from the cache
+    (model_folder / "b.ckpt").write_text("")
+    assert component_class.INPUT_TYPES()['required']['model'][0] == ["a.ckpt", "b.ckpt"]
+
+    # the execution analyzes the workflow and maps the input names which were served from the cache
+    assert run_component(component_class, model="b.ckpt", a=1, b=5) == ("b.ckpt", 6)
+    assert component_class.interface is not None
+
+
+def test_changed_node_signature_invalidates_the_cache(loader, monkeypatch):
+    load_all, _ = loader
+    load_all().INPUT_TYPES()
+    component_loader.save_component_cache()
+
+    class ChangedAdd(component_loader.comfy_nodes.NODE_CLASS_MAPPINGS["TestAdd"]):
+        @classmethod
+        def INPUT_TYPES(s):
+            return {"required": {"a": ("INT", ), "b": ("INT", {"default": 0, "min": -1000, "max": 2000})}}
+
+    monkeypatch.setitem(component_loader.comfy_nodes.NODE_CLASS_MAPPINGS, "TestAdd", ChangedAdd)
+    component_class = load_all()
+    component_class.INPUT_TYPES()
+    assert component_loader.component_cache_stats['invalidated'] == 1
+    assert component_class.interface is not None
+
+
+def test_no_cache_without_the_user_directory(loader, monkeypatch):
+    load_all, _ = loader
+    monkeypatch.delattr(folder_paths, "get_user_directory")
+
+    load_all().INPUT_TYPES()
+    component_loader.save_component_cache()
+
+    assert component_loader.get_component_cache_path() is None
+    assert component_loader.component_cache_stats == {'hit': 0, 'miss': 0, 'invalidated': 0}
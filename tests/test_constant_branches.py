@@ -0,0 +1,41 @@
+import workflow_component.component_loader as component_loader
+
+from components import make_workflow, load_component, run_component
+
+
+# a -> (a + 100, a + 200) -> ExecutionSwitch(select) -> ExecutionOneOf -> out
+def make_switch_one_of(select):
+    prompt = {
+        2: {'class_type': "TestAdd", 'inputs': {'a': ["1", 0], 'b': 100}},
+        3: {'class_type': "TestAdd", 'inputs': {'a': ["1", 0], 'b': 200}},
+        4: {'class_type': "ExecutionSwitch", 'inputs': {'select': select, 'input1': ["2", 0], 'input2_opt': ["3", 0]}},
+        5: {'class_type': "ExecutionOneOf", 'inputs': {'input1': ["4", 0], 'input2': ["4", 1]}},
+    }
+    return make_workflow(prompt, {'a': 1}, {'out': (5, 0)})
+
+
+def test_constant_select_keeps_the_required_one_of_input():
+    workflow = make_switch_one_of(2)
+    pruned, removed = component_loader.prune_constant_branches(workflow['output'])
+
+    assert "2" not in pruned and removed >= 1
+    assert pruned["5"]['inputs'] == {'input1': ["3", 0]}
+
+
+def test_constant_select_switch_to_one_of():
+    assert run_component(load_component(make_switch_one_of(2)), a=1) == (201, )
+    assert run_component(load_component(make_switch_one_of(1)), a=1) == (101, )
+
+
+def test_one_of_without_live_inputs_is_removed():
+    prompt = {
+        2: {'class_type': "TestAdd", 'inputs': {'a': ["1", 0], 'b': 100}},
+        3: {'class_type': "ExecutionSwitch", 'inputs': {'select': 2, 'input1': ["2", 0]}},
+        4: {'class_type': "ExecutionOneOf", 'inputs': {'input1': ["3", 0], 'input2': ["3", 2]}},
+        5: {'class_type': "TestAdd", 'inputs': {'a': ["4", 0], 'b': 1}},
+    }
+    workflow = make_workflow(prompt, {'a': 1}, {'out': (5, 0)})
+    pruned, _ = component_loader.prune_constant_branches(workflow['output'])
+
+    assert not {"2", "3", "4", "5"} & pruned.keys()
+    assert run_component(load_component(workflow), a=1) == (None, )
@@ -0,0 +1,75 @@
+import os
+
+import folder_paths
+import pytest
+
+import workflow_component.component_loader as component_loader
+
+from components import make_workflow, load_component
+
+
+def list_files(directory):
+    return sorted(os.path.relpath(os.path.join(root, file), directory).replace(os.sep, "/")
+                  for root, dirs, files in os.walk(directory) for file in files)
+
+
+# a 'tests' model folder which is listed recursively, like the folders of ComfyUI
+@pytest.fixture
+def model_folder(tmp_path, monkeypatch):
+    monkeypatch.setitem(folder_paths.folder_names_and_paths, "tests", ([str(tmp_path)], set()))
+    monkeypatch.setattr(folder_paths, "get_filename_list", lambda folder_name: list_files(tmp_path) if folder_name == "tests" else [])
+    return tmp_path
+
+
+def make_loader_component():
+    prompt = {2: {'class_type': "TestLoader", 'inputs': {'name': ["1", 0]}}}
+    return load_component(make_workflow(prompt, {'model': 1}, {'out': (2, 0)}))
+
+
+def test_input_types_are_memoized(model_folder):
+    (model_folder / "a.ckpt").write_text("")
+    component = make_loader_component()
+
+    first = component.INPUT_TYPES()
+    slow_path = component_loader.input_types_stats['slow_path']
+    second = component.INPUT_TYPES()
+
+    assert second == first
+    assert component_loader.input_types_stats['slow_path'] == slow_path
+    assert second['required']['model'][0] == ["a.ckpt"]
+
+
+def test_callers_can_modify_the_result(model_folder):
+    component = make_loader_component()
+
+    input_types = component.INPUT_TYPES()
+    input_types['required']['extra'] = ("INT", )
+    del input_types['hidden']
+
+    input_types = component.INPUT_TYPES()
+    assert 'extra' not in input_types['required']
+    assert 'hidden' in input_types
+
+
+def test_combo_follows_the_files_added_in_subfolders(model_folder):
+    (model_folder / "sub").mkdir()
+    (model_folder / "sub" / "a.ckpt").write_text("")
+    component = make_loader_component()
+    assert component.INPUT_TYPES()['required']['model'][0] == ["sub/a.ckpt"]
+
+    # the mtime of the folder itself doesn't change
+    (model_folder / "sub" / "b.ckpt").write_text("")
+    assert component.INPUT_TYPES()['required']['model'][0] == ["sub/a.ckpt", "sub/b.ckpt"]
+
+
+def test_registry_changes_invalidate_the_memo(model_folder, monkeypatch):
+    component = make_loader_component()
+    component.INPUT_TYPES()
+
+    class OtherLoader:
+        @classmethod
+        def INPUT_TYPES(s):
+            return {"required": {"name": (["other.ckpt"], )}}
+
+    monkeypatch.setitem(component_loader.comfy_nodes.NODE_CLASS_MAPPINGS, "TestLoader", OtherLoader)
+    assert component.INPUT_TYPES()['required']['model'][0] == ["other.ckpt"]
@@ -0,0 +1,55 @@
+import pytest
+
+import workflow_component.node_keys as node_keys
+import workflow_component.shared_cache as shared_cache
+
+from components import calls, make_workflow, load_component, run_component
+
+
+# the outputs must come from the executor itself, not from the other instances
+@pytest.fixture(autouse=True)
+def no_shared_cache(monkeypatch):
+    monkeypatch.setattr(shared_cache, "ENABLE_SHARED_CACHE", False)
+
+
+# (a + 1) * 2
+def make_chain():
+    prompt = {
+        2: {'class_type': "TestAdd", 'inputs': {'a': ["1", 0], 'b': 1}},
+        3: {'class_type': "TestMul", 'inputs': {'a': ["2", 0], 'b': 2}},
+    }
+    return load_component(make_workflow(prompt, {'a': 1}, {'out': (3, 0)}))
+
+
+def run_counted(component, node_id, a):
+    before = calls.get("TestAdd", 0) + calls.get("TestMul", 0)
+    result = run_component(component, node_id=node_id, a=a)
+    return result, calls.get("TestAdd", 0) + calls.get("TestMul", 0) - before
+
+
+def test_reverted_input_restores_the_earlier_outputs():
+    component = make_chain()
+
+    assert run_counted(component, 1901, 21) == ((44, ), 2)
+    assert run_counted(component, 1901, 22) == ((46, ), 2)
+
+    hit = node_keys.stats['hit']
+    assert run_counted(component, 1901, 21) == ((44, ), 0)
+    assert node_keys.stats['hit'] == hit + 2
+
+
+def test_unchanged_input_keeps_the_outputs():
+    component = make_chain()
+
+    assert run_counted(component, 1902, 23) == ((48, ), 2)
+    assert run_counted(component, 1902, 23) == ((48, ), 0)
+
+
+def test_without_history_the_reverted_input_is_executed_again(monkeypatch):
+    monkeypatch.setattr(node_keys, "KEY_HISTORY_SIZE", 0)
+    component = make_chain()
+
+    assert run_counted(component, 1903, 24) == ((50, ), 2)
+    assert run_counted(component, 1903, 25) == ((52, ), 2)
+    assert run_counted(component, 1903, 24) == ((50, ), 2)
+
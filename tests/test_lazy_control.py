@@ -0,0 +1,51 @@
+import workflow_component.execution_experimental as execution_experimental
+import workflow_component.workflow_execution as workflow_execution
+
+from components import calls, make_workflow, load_component, run_component
+
+
+# a -> (a + 100, a * 3) -> ExecutionSwitch(select) -> ExecutionOneOf -> out
+def make_selectable():
+    prompt = {
+        3: {'class_type': "TestAdd", 'inputs': {'a': ["1", 0], 'b': 100}},
+        4: {'class_type': "TestMul", 'inputs': {'a': ["1", 0], 'b': 3}},
+        5: {'class_type': "ExecutionSwitch", 'inputs': {'select': ["2", 0], 'input1': ["3", 0], 'input2_opt': ["4", 0]}},
+        6: {'class_type': "ExecutionOneOf", 'inputs': {'input1': ["5", 0], 'input2': ["5", 1]}},
+    }
+    return load_component(make_workflow(prompt, {'a': 1, 'select': 2}, {'out': (6, 0)}))
+
+
+def count_calls(func):
+    before = dict(calls)
+    result = func()
+    return result, {name: calls.get(name, 0) - before.get(name, 0) for name in ["TestAdd", "TestMul"]}
+
+
+def test_only_the_selected_branch_runs():
+    component = make_selectable()
+
+    result, counts = count_calls(lambda: run_component(component, node_id=1501, a=11, select=1))
+    assert result == (111, )
+    assert counts == {"TestAdd": 1, "TestMul": 0}
+
+    # the same executor, the other branch is executed now and the first one stays cached
+    result, counts = count_calls(lambda: run_component(component, node_id=1501, a=11, select=2))
+    assert result == (33, )
+    assert counts == {"TestAdd": 0, "TestMul": 1}
+
+
+def test_skipped_branch_is_counted_as_pruned():
+    component = make_selectable()
+
+    pruned = workflow_execution.lazy_stats['pruned']
+    assert run_component(component, a=12, select=2) == (36, )
+    assert workflow_execution.lazy_stats['pruned'] == pruned + 1
+
+
+def test_eager_control_runs_both_branches(monkeypatch):
+    monkeypatch.setattr(execution_experimental, "ENABLE_LAZY_CONTROL", False)
+    component = make_selectable()
+
+    result, counts = count_calls(lambda: run_component(component, a=13, select=1))
+    assert result == (113, )
+    assert counts == {"TestAdd": 1, "TestMul": 1}
@@ -0,0 +1,66 @@
+import pytest
+
+import workflow_component.execution_experimental as execution_experimental
+import workflow_component.shared_cache as shared_cache
+import workflow_component.workflow_execution as workflow_execution
+
+from components import calls, make_workflow, load_component, run_component
+
+
+@pytest.fixture(autouse=True)
+def no_shared_cache(monkeypatch):
+    monkeypatch.setattr(shared_cache, "ENABLE_SHARED_CACHE", False)
+
+
+# ((a + 1) * 2) + 3
+def make_chain():
+    prompt = {
+        2: {'class_type': "TestAdd", 'inputs': {'a': ["1", 0], 'b': 1}},
+        3: {'class_type': "TestMul", 'inputs': {'a': ["2", 0], 'b': 2}},
+        4: {'class_type': "TestAdd", 'inputs': {'a': ["3", 0], 'b': 3}},
+    }
+    return load_component(make_workflow(prompt, {'a': 1}, {'out': (4, 0)}))
+
+
+def run_changing(component, node_id, values):
+    return [run_component(component, node_id=node_id, a=a)[0] for a in values]
+
+
+def test_intermediates_of_a_volatile_input_are_released():
+    component = make_chain()
+    released = execution_experimental.liveness_stats['released']
+
+    # the input becomes volatile after VOLATILE_MIN_INVOCATIONS changes
+    assert run_changing(component, 1301, range(1, 6)) == [(a + 1) * 2 + 3 for a in range(1, 6)]
+
+    executor = workflow_execution.executor_dict["1301"][1]
+    assert "2" not in executor.outputs and "3" not in executor.outputs
+    assert {"2", "3"} <= executor.released
+    assert "4" in executor.outputs  # the source of the component output is kept
+    assert execution_experimental.liveness_stats['released'] > released
+
+
+def test_released_outputs_are_not_executed_again_for_the_same_input():
+    component = make_chain()
+    run_changing(component, 1302, range(11, 16))
+
+    before = dict(calls)
+    assert run_component(component, node_id=1302, a=15) == (35, )
+    assert calls == before
+
+
+def test_stable_input_keeps_the_intermediates():
+    component = make_chain()
+    assert run_changing(component, 1303, [21] * 5) == [47] * 5
+
+    executor = workflow_execution.executor_dict["1303"][1]
+    assert {"2", "3", "4"} <= executor.outputs.keys()
+
+
+def test_liveness_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(execution_experimental, "ENABLE_LIVENESS", False)
+    component = make_chain()
+    run_changing(component, 1304, range(31, 36))
+
+    executor = workflow_execution.executor_dict["1304"][1]
+    assert {"2", "3", "4"} <= executor.outputs.keys()
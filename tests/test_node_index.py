@@ -0,0 +1,31 @@
+import workflow_component.workflow_execution as workflow_execution
+
+from components import make_workflow, load_component, run_component, get_component_name
+
+
+def make_muted_workflow():
+    prompt = {
+        2: {'class_type': "TestAdd", 'inputs': {'a': ["1", 0], 'b': 3}},
+    }
+    workflow = make_workflow(prompt, {'a': 1}, {'out': (2, 0)})
+    workflow['nodes'].append({'id': 50, 'type': "TestAdd", 'mode': 2, 'inputs': [], 'outputs': []})  # not in the prompt
+    return workflow
+
+
+def test_muted_nodes_of_the_component_are_kept_in_the_plan():
+    component = load_component(make_muted_workflow())
+    assert run_component(component, a=1) == (4, )
+
+    plan = workflow_execution.execution_plans[get_component_name(component)]
+    assert plan.muted_nodes == {"50"}
+    assert run_component(component, a=2) == (5, )
+
+
+def test_node_index_is_shared_per_extra_pnginfo():
+    extra_pnginfo = {'workflow': {'nodes': [{'id': 7, 'type': "TestAdd"}]}}
+
+    index = workflow_execution.get_node_index(extra_pnginfo)
+    assert workflow_execution.get_node_index(extra_pnginfo) is index
+    assert index.get("7")['type'] == "TestAdd"
+    assert index.get_muted_nodes({}) == {"7"}
+    assert workflow_execution.get_node_index(dict(extra_pnginfo)) is not index
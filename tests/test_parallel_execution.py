@@ -0,0 +1,87 @@
+import threading
+
+import nodes
+import pytest
+import server
+
+import workflow_component.execution_experimental as execution_experimental
+import workflow_component.shared_cache as shared_cache
+
+from components import AddNode, make_workflow, load_component, run_component
+
+# node type -> names of the threads which executed it
+threads = {}
+
+
+class ThreadAdd(AddNode):
+    def doit(self, a, b):
+        threads.setdefault(type(self).__name__, []).append(threading.current_thread().name)
+        return (a + b, )
+
+
+class SafeAdd(ThreadAdd):
+    PARALLEL_SAFE = True
+
+
+# two of them must run at the same time, or the barrier breaks after the timeout
+class BarrierAdd(SafeAdd):
+    barrier = None
+
+    def doit(self, a, b):
+        BarrierAdd.barrier.wait()
+        return super().doit(a, b)
+
+
+class FailingAdd(SafeAdd):
+    def doit(self, a, b):
+        raise ValueError("failing branch")
+
+
+nodes.NODE_CLASS_MAPPINGS.update(TestThreadAdd=ThreadAdd, TestSafeAdd=SafeAdd, TestBarrierAdd=BarrierAdd, TestFailingAdd=FailingAdd)
+
+
+@pytest.fixture(autouse=True)
+def parallel(monkeypatch):
+    monkeypatch.setattr(execution_experimental, "PARALLEL_EXECUTION", True)
+    monkeypatch.setattr(shared_cache, "ENABLE_SHARED_CACHE", False)
+    threads.clear()
+
+
+# a -> (a + 1, a + 2, a + 3) -> sum
+def make_branches(branch_type, branches=3):
+    prompt = {}
+    for i in range(branches):
+        prompt[2 + i] = {'class_type': branch_type, 'inputs': {'a': ["1", 0], 'b': i + 1}}
+
+    prompt[10] = {'class_type': "TestAdd", 'inputs': {'a': ["2", 0], 'b': ["3", 0]}}
+    if branches > 2:
+        prompt[11] = {'class_type': "TestAdd", 'inputs': {'a': ["10", 0], 'b': ["4", 0]}}
+
+    return load_component(make_workflow(prompt, {'a': 1}, {'out': (10 if branches == 2 else 11, 0)}))
+
+
+def test_independent_safe_nodes_run_concurrently():
+    BarrierAdd.barrier = threading.Barrier(2, timeout=5)
+    assert run_component(make_branches("TestBarrierAdd", branches=2), a=10) == (23, )
+
+    assert len(threads["BarrierAdd"]) == 2
+    assert all(name.startswith("workflow-component") for name in threads["BarrierAdd"])
+
+
+def test_parallel_result_is_the_same_as_serial(monkeypatch):
+    parallel_result = run_component(make_branches("TestSafeAdd"), a=20)
+
+    monkeypatch.setattr(execution_experimental, "PARALLEL_EXECUTION", False)
+    assert run_component(make_branches("TestSafeAdd"), a=20) == parallel_result == (66, )
+
+
+def test_unsafe_nodes_run_on_the_executing_thread():
+    assert run_component(make_branches("TestThreadAdd"), a=30) == (96, )
+    assert set(threads["ThreadAdd"]) == {threading.current_thread().name}
+
+
+def test_error_in_a_parallel_batch_is_reported(monkeypatch):
+    # the errors are reported only to a client
+    monkeypatch.setattr(server.PromptServer.instance, "client_id", "tests")
+    with pytest.raises(Exception, match="failing branch"):
+        run_component(make_branches("TestFailingAdd"), a=40)
@@ -0,0 +1,22 @@
+import pytest
+import server
+
+from components import make_workflow, load_component, run_component
+
+
+@pytest.fixture
+def client(monkeypatch):
+    sent = []
+    monkeypatch.setattr(server.PromptServer.instance, "client_id", "tests")
+    monkeypatch.setattr(server.PromptServer.instance, "send_sync", lambda event, data, sid=None: sent.append((event, dict(data))))
+    return sent
+
+
+def test_progress_of_a_single_node_component(client):
+    prompt = {2: {'class_type': "TestAdd", 'inputs': {'a': ["1", 0], 'b': 7}}}
+    component = load_component(make_workflow(prompt, {'a': 1}, {'out': (2, 0)}))
+
+    assert run_component(component, a=501) == (508, )
+
+    progress = [data['progress'] for event, data in client if event == "component/update_status" and data.get('text') not in (None, "Begin (0%)")]
+    assert progress[0] == 0.0 and all(0 <= x < 1 for x in progress)
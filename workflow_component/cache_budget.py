@@ -0,0 +1,173 @@
+from collections import OrderedDict
+
+import torch
+
+
+# Upper bound of the bytes held in the 'outputs' of all component executors.
+# CPU tensors and device tensors are counted separately. None means unlimited.
+CACHE_BUDGET = {'cpu': None, 'device': None}
+
+# holder id -> {entry key: (stored, sizes, store, store key)}. The holders are kept in LRU order. (last: most recently used)
+# A holder is a component executor (its outputs and key history) or the plan of a component (its folded constants).
+# Eviction deletes store[store key] if it is still the stored value.
+executor_entries = OrderedDict()
+executor_components = {}  # holder id -> (component name, outputs or None)
+
+usage = {'cpu': 0, 'device': 0}
+stats = {'evictions': 0, 'evicted_bytes': 0}
+
+
+def set_cache_budget(cpu=None, device=None):
+    CACHE_BUDGET['cpu'] = cpu
+    CACHE_BUDGET['device'] = device
+
+
+def add_value_size(value, sizes, seen):
+    if isinstance(value, torch.Tensor):
+        storage = value.untyped_storage() if hasattr(value, 'untyped_storage') else value.storage()
+        key = (storage.data_ptr(), str(value.device))
+        if key not in seen:
+            seen.add(key)
+            kind = 'cpu' if value.device.type == 'cpu' else 'device'
+            sizes[kind] += storage.nbytes()
+
+    elif isinstance(value, (list, tuple)):
+        for x in value:
+            add_value_size(x, sizes, seen)
+
+    elif isinstance(value, dict):
+        for x in value.values():
+            add_value_size(x, sizes, seen)
+
+
+def get_output_size(output):
+    sizes = {'cpu': 0, 'device': 0}
+    add_value_size(output, sizes, set())
+    return sizes
+
+
+def add_entry(entries, old_entries, entry_key, stored, output, store, store_key):
+    old_entry = old_entries.get(entry_key)
+    if old_entry is not None and old_entry[0] is stored:
+        sizes = old_entry[1]
+    else:
+        sizes = get_output_size(output)
+
+    entries[entry_key] = stored, sizes, store, store_key
+    usage['cpu'] += sizes['cpu']
+    usage['device'] += sizes['device']
+
+
+def update_holder(holder_id, component_name, outputs, entries):
+    for _, sizes, _, _ in executor_entries.pop(holder_id, {}).values():
+        usage['cpu'] -= sizes['cpu']
+        usage['device'] -= sizes['device']
+
+    executor_entries[holder_id] = entries
+    executor_components[holder_id] = component_name, outputs
+
+
+# key_history: the outputs stashed under the previous node keys (node_keys.stash)
+def update_executor(executor_id, component_name, outputs, excluded=(), key_history=None):
+    old_entries = executor_entries.get(executor_id, {})
+
+    entries = {}
+    for unique_id, output in outputs.items():
+        if unique_id not in excluded:
+            add_entry(entries, old_entries, unique_id, output, output, outputs, unique_id)
+
+    for unique_id, history in (key_history or {}).items():
+        for key, entry in history.items():
+            add_entry(entries, old_entries, ('history', unique_id, key), entry, entry[0], history, key)
+
+    update_holder(executor_id, component_name, outputs, entries)
+
+
+# constant_outputs: unique_id -> (output, output_ui, node key), shared by the executors of a component
+def update_constants(component_name, constant_outputs):
+    holder_id = f"plan:{component_name}"
+    if len(constant_outputs) == 0 and holder_id not in executor_entries:
+        return
+
+    old_entries = executor_entries.get(holder_id, {})
+
+    entries = {}
+    for unique_id, entry in constant_outputs.items():
+        add_entry(entries, old_entries, unique_id, entry, entry[0], constant_outputs, unique_id)
+
+    update_holder(holder_id, component_name, None, entries)
+
+
+def forget_executor(executor_id):
+    entries = executor_entries.pop(executor_id, {})
+    executor_components.pop(executor_id, None)
+
+    for _, sizes, _, _ in entries.values():
+        usage['cpu'] -= sizes['cpu']
+        usage['device'] -= sizes['device']
+
+
+def is_over_budget(kind):
+    return CACHE_BUDGET[kind] is not None and usage[kind] > CACHE_BUDGET[kind]
+
+
+# Evict outputs starting from the least recently used holder, the largest outputs first.
+def enforce_budget():
+    evicted = []
+
+    for kind in ['cpu', 'device']:
+        if not is_over_budget(kind):
+            continue
+
+        for holder_id in list(executor_entries.keys()):
+            entries = executor_entries[holder_id]
+            _, outputs = executor_components[holder_id]
+
+            for entry_key in sorted(entries.keys(), key=lambda x: entries[x][1][kind], reverse=True):
+                if not is_over_budget(kind):
+                    break
+
+                stored, sizes, store, store_key = entries[entry_key]
+                if sizes[kind] == 0:
+                    break
+
+                del entries[entry_key]
+                if store.get(store_key) is stored:
+                    del store[store_key]
+
+                # the executors hold the seeded constants too
+                if outputs is None:
+                    for _, executor_outputs in executor_components.values():
+                        if executor_outputs is not None and executor_outputs.get(entry_key) is stored[0]:
+                            del executor_outputs[entry_key]
+
+                usage['cpu'] -= sizes['cpu']
+                usage['device'] -= sizes['device']
+                stats['evictions'] += 1
+                stats['evicted_bytes'] += sizes['cpu'] + sizes['device']
+                evicted.append((holder_id, entry_key))
+
+            if not is_over_budget(kind):
+                break
+
+    return evicted
+
+
+def get_cache_usage():
+    components = {}
+    for executor_id, entries in executor_entries.items():
+        component_name, _ = executor_components[executor_id]
+        components[executor_id] = {
+            'component': component_name,
+            'cpu': sum(sizes['cpu'] for _, sizes, _, _ in entries.values()),
+            'device': sum(sizes['device'] for _, sizes, _, _ in entries.values()),
+        }
+
+    return {
+        'budget': dict(CACHE_BUDGET),
+        'cpu': usage['cpu'],
+        'device': usage['device'],
+        'evictions': stats['evictions'],
+        'evicted_bytes': stats['evicted_bytes'],
+        'components': components,
+    }
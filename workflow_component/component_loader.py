@@ -3,12 +3,15 @@ import os
 import sys
 import json
 import traceback
-import copy
+import threading
+import concurrent.futures
+import atexit
 
 import workflow_component.workflow_execution as workflow_execution
 
 import nodes
 import nodes as comfy_nodes
+import folder_paths
 import hashlib
 
 import re
@@ -183,93 +186,591 @@ def get_linked_slots_config(json_data):
     return linked_slots_config, spec_map
 
 
-def create_dynamic_class(component_name, workflow, category=None):
-    nodes = workflow['nodes']
-    prompt = workflow['output']
+# Compile-time dead-branch pruning of the internal prompt.
+# When 'select' of an ExecutionSwitch or the condition of an ExecutionControlString is a widget constant,
+# the consumers of the taken output are linked to its source directly and the untaken outputs are dead (always None).
+# A node which requires a dead output never runs, so it is removed, and so are the nodes which lost all of their consumers.
+PRUNE_CONSTANT_BRANCHES = True
+
+CONTROL_STRING_CONDITIONS = {
+    "A = B": lambda a, b: a == b,
+    "A != B": lambda a, b: a != b,
+    "A in B": lambda a, b: a in b,
+    "A not in B": lambda a, b: a not in b,
+}
+
+
+SWITCH_OPTIONAL_INPUTS = ["input2_opt", "input3_opt", "input4_opt", "input5_opt"]
+ONEOF_OPTIONAL_INPUTS = ["input2", "input3", "input4", "input5"]
+
+
+def get_consumers(prompt):
+    consumers = {}
+    for key, value in prompt.items():
+        for name, input_data in value['inputs'].items():
+            if isinstance(input_data, list):
+                consumers.setdefault(str(input_data[0]), []).append((key, name, input_data[1]))
+
+    return consumers
+
+
+# -> {output slot: source link, or None if the output is dead}, None if the node can't be resolved statically
+def resolve_constant_control(value):
+    class_type = value.get('class_type')
+    inputs = value['inputs']
+
+    if class_type == "ExecutionSwitch":
+        select = inputs.get('select')
+        if isinstance(select, list):
+            return None
+
+        try:
+            select = int(select)
+        except (TypeError, ValueError):
+            return None
+
+        names = ["input1"] + SWITCH_OPTIONAL_INPUTS
+        resolved = {slot: None for slot in range(len(names))}
+        if 1 <= select <= len(names) and isinstance(inputs.get(names[select-1]), list):
+            resolved[select-1] = inputs[names[select-1]]
+        return resolved
+
+    if class_type == "ExecutionControlString":
+        a, b, condition_kind = inputs.get('A'), inputs.get('B_STR'), inputs.get('condition_kind')
+        if isinstance(a, list) or isinstance(b, list) or condition_kind not in CONTROL_STRING_CONDITIONS or 'B_STR' not in inputs:
+            return None
+
+        try:
+            taken = CONTROL_STRING_CONDITIONS[condition_kind](a, b)
+        except TypeError:
+            return None
+
+        pass_value = inputs.get('pass_value')
+        if taken and not isinstance(pass_value, list):
+            return None  # a constant value passes through. It is left to the node.
+
+        return {0: pass_value if taken else None}
+
+    return None
+
+
+def is_removable_node(value):
+    if 'class_type' not in value:
+        return False  # ComponentInput/ComponentOutput
+
+    class_def = nodes.NODE_CLASS_MAPPINGS.get(value['class_type'])
+    return class_def is not None and not getattr(class_def, 'OUTPUT_NODE', False)
+
+
+# Drops an input which is always None. Returns True if the node can never run.
+# An absent optional input is the same as None for ExecutionOneOf/ExecutionSwitch, but the required slots must stay.
+# The required 'input1' of ExecutionOneOf takes the first optional input which isn't known to be dead. The order of the candidates is kept.
+def drop_dead_input(value, name, dead):
+    inputs = value['inputs']
+    class_type = value.get('class_type')
+
+    if class_type is None:
+        del inputs[name]  # ComponentOutput: the output is None
+        return False
+
+    if class_type == "ExecutionOneOf":
+        if name != "input1":
+            del inputs[name]
+            return False
+
+        candidates = [x for x in ONEOF_OPTIONAL_INPUTS if isinstance(inputs.get(x), list) and (str(inputs[x][0]), inputs[x][1]) not in dead]
+        if len(candidates) == 0:
+            return True
+
+        inputs["input1"] = inputs.pop(candidates[0])
+        return False
+
+    if class_type == "ExecutionSwitch" and name in SWITCH_OPTIONAL_INPUTS:
+        del inputs[name]
+        return False
+
+    return True
+
+
+# returns (rewritten prompt, number of the removed nodes)
+def prune_constant_branches(prompt):
+    prompt = copy.deepcopy(prompt)
+    had_consumers = set(get_consumers(prompt).keys())
+    removed = set()
+
+    dead_slots = []
+    for key, value in list(prompt.items()):
+        resolved = resolve_constant_control(value)
+        if resolved is None:
+            continue
+
+        for consumer_id, name, slot in get_consumers(prompt).get(key, []):
+            if slot not in resolved:
+                continue
+
+            if resolved[slot] is None:
+                dead_slots.append((key, slot))
+            else:
+                prompt[consumer_id]['inputs'][name] = list(resolved[slot])
+
+    # propagate the dead outputs
+    dead = set(dead_slots)
+    while dead_slots:
+        node_id, slot = dead_slots.pop()
+        for consumer_id, name, input_slot in get_consumers(prompt).get(node_id, []):
+            if input_slot != slot or consumer_id in removed:
+                continue
+
+            consumer = prompt[consumer_id]
+            link = consumer['inputs'].get(name)
+            if not isinstance(link, list) or (str(link[0]), link[1]) != (node_id, slot):
+                continue  # already rewired
+
+            if consumer.get('class_type') == "LoopControl" or not drop_dead_input(consumer, name, dead):
+                continue
+
+            if is_removable_node(consumer):
+                removed.add(consumer_id)
+                del prompt[consumer_id]
+                for x in range(len(nodes.NODE_CLASS_MAPPINGS[consumer['class_type']].RETURN_TYPES)):
+                    dead_slots.append((consumer_id, x))
+                    dead.add((consumer_id, x))
+
+    # remove the nodes which lost all of their consumers
+    while True:
+        consumers = get_consumers(prompt)
+        unused = [key for key, value in prompt.items() if key in had_consumers and key not in consumers and is_removable_node(value)]
+        if len(unused) == 0:
+            break
+
+        for key in unused:
+            removed.add(key)
+            del prompt[key]
+
+    return prompt, len(removed)
+
+
+def optimize_workflow(component_name, workflow):
+    if not PRUNE_CONSTANT_BRANCHES or 'output' not in workflow:
+        return workflow
+
+    try:
+        prompt, pruned = prune_constant_branches(workflow['output'])
+    except Exception as e:
+        print(f"[WARN] Workflow-Component: Failed to prune the constant branches of '{component_name}'. ({e})")
+        return workflow
+
+    if pruned == 0:
+        return workflow
+
+    print(f"[Workflow-Component] '{component_name}': {pruned} node(s) pruned by constant switches")
+
+    # the original workflow is shared with the frontend
+    workflow = dict(workflow)
+    workflow['output'] = prompt
+    return workflow
+
+
+
+class ComponentInterface:
+    def __init__(self, workflow):
+        nodes = workflow['nodes']
+
+        input_nodes = [node for node in nodes if node['type'] == "ComponentInput"]
+        input_optional_nodes = [node for node in nodes if node['type'] == "ComponentInputOptional"]
+        output_nodes = [node for node in nodes if node['type'] == "ComponentOutput"]
+
+        self.input_mapping = {}
+        self.internal_id_name_map = {}
+
+        for node in nodes:
+            self.internal_id_name_map[str(node['id'])] = node['title'] if 'title' in node else node['type']
+
+        # get widget config infos for auto recognition of input setting
+        self.node_config_map, self.spec_map = get_linked_slots_config(workflow)
+
+        self.sorted_input_nodes = sorted(input_nodes, key=lambda x: (x.get('title', ''), x.get('title') is None))
+        self.sorted_input_optional_nodes = sorted(input_optional_nodes, key=lambda x: (x.get('title', ''), x.get('title') is None))
+
+        self.return_types = []
+        self.return_names = []
+        self.output_mapping = {}
+        self.optional_inputs = {str(node['id']) for node in input_optional_nodes}
+        self.input_sources = {}  # combo input label -> [node type, input slot]
+
+        sorted_nodes = sorted(output_nodes, key=lambda x: (x.get('title', ''), x.get('title') is None))
+        for i, node in enumerate(sorted_nodes):
+            build_output_types(i, node, self.node_config_map, self.output_mapping, self.return_names, self.return_types)
+
+        self.constant_nodes = get_input_independent_nodes(workflow['output'], [str(node['id']) for node in input_nodes + input_optional_nodes])
+
+
+# nodes which are not reachable from any component input. Their outputs don't depend on the inputs of the component.
+def get_input_independent_nodes(prompt, input_node_ids):
+    next_nodes = {}
+    for key, value in prompt.items():
+        for input_data in value.get('inputs', {}).values():
+            if isinstance(input_data, list):
+                next_nodes.setdefault(str(input_data[0]), set()).add(key)
+
+    reachable = set()
+    worklist = list(input_node_ids)
+    while worklist:
+        unique_id = worklist.pop()
+        if unique_id in reachable:
+            continue
+
+        reachable.add(unique_id)
+        worklist.extend(next_nodes.get(unique_id, []))
+
+    return frozenset(key for key, value in prompt.items() if key not in reachable and 'class_type' in value)
+
+
+interface_lock = threading.RLock()
+
+
+class LazyComponentType(type):
+    # Until the interface of a lazily loaded component is analyzed, the class only has a placeholder body.
+    # The first access to these attributes (or to INPUT_TYPES) triggers the analysis and fills them in.
+    def __getattr__(cls, name):
+        if name in ["RETURN_TYPES", "RETURN_NAMES", "OUTPUT_NODE"]:
+            cls.load_declaration()
+            return type.__getattribute__(cls, name)
+
+        raise AttributeError(name)
+
+
+def get_input_types_signature(class_def):
+    # The slot types and configs, which the cached input types are built from. The items of combo lists are excluded,
+    # because they are the file listings of model folders.
+    signature = []
+    input_types = class_def.INPUT_TYPES()
+    for section in ['required', 'optional']:
+        for key, slot in input_types.get(section, {}).items():
+            slot_type = "COMBO" if isinstance(slot[0], list) else str(slot[0])
+            signature.append((section, key, slot_type, repr(slot[1:])))
+
+    return hashlib.md5(repr(signature).encode()).hexdigest()
+
+
+def get_interface_signatures(interface):
+    signatures = {}
+    for _, _, node_type, _, _ in interface.node_config_map.values():
+        if node_type is not None and node_type not in signatures:
+            if node_type not in comfy_nodes.NODE_CLASS_MAPPINGS:
+                return None
+
+            signatures[node_type] = get_input_types_signature(comfy_nodes.NODE_CLASS_MAPPINGS[node_type])
+
+    return signatures
+
+
+def is_valid_signatures(signatures):
+    if signatures is None:
+        return False
+
+    try:
+        for node_type, signature in signatures.items():
+            if node_type not in comfy_nodes.NODE_CLASS_MAPPINGS:
+                return False
+
+            if get_input_types_signature(comfy_nodes.NODE_CLASS_MAPPINGS[node_type]) != signature:
+                return False
+    except Exception:
+        return False
+
+    return True
+
+
+# 'calls': number of INPUT_TYPES calls of components, 'slow_path': number of calls that actually built the input types
+input_types_stats = {'calls': 0, 'slow_path': 0}
+
+
+def get_registry_state(interface):
+    # The input types are affected by the installed node classes which are referenced through the widget-linked inputs.
+    node_types = {node_type for _, _, node_type, _, _ in interface.node_config_map.values() if node_type is not None}
+    return len(comfy_nodes.NODE_CLASS_MAPPINGS), tuple((node_type, id(comfy_nodes.NODE_CLASS_MAPPINGS.get(node_type))) for node_type in sorted(node_types))
+
 
-    input_nodes = [node for node in nodes if node['type'] == "ComponentInput"]
-    input_optional_nodes = [node for node in nodes if node['type'] == "ComponentInputOptional"]
-    output_nodes = [node for node in nodes if node['type'] == "ComponentOutput"]
+# None stands for the input directory, which LoadImage and the like list directly instead of through get_filename_list.
+def get_folder_dependencies(input_types):
+    combos = []
+    for section in ['required', 'optional']:
+        for slot in input_types.get(section, {}).values():
+            if isinstance(slot[0], list):
+                combos.append(slot[0])
 
-    input_mapping = {}
-    internal_id_name_map = {}
+    if len(combos) == 0:
+        return ()
 
-    for node in workflow['nodes']:
-        internal_id_name_map[str(node['id'])] = node['title'] if 'title' in node else node['type']
+    folder_names = []
+    matched = set()
+    for folder_name in folder_paths.folder_names_and_paths.keys():
+        try:
+            filenames = folder_paths.get_filename_list(folder_name)
+        except Exception:
+            continue
+
+        hits = {i for i, combo in enumerate(combos) if combo == filenames}
+        if len(hits) > 0:
+            folder_names.append(folder_name)
+            matched |= hits
+
+    if len(matched) < len(combos):
+        folder_names.append(None)
+
+    return tuple(folder_names)
+
+
+# The file lists come from the cache of folder_paths, which is invalidated by the changes in the subfolders too.
+# The input directory is listed without the subfolders, so its mtime is enough.
+def get_folder_state(folder_names):
+    state = []
+    for folder_name in folder_names:
+        if folder_name is not None:
+            try:
+                state.append(folder_paths.get_filename_list(folder_name))
+            except Exception:
+                state.append(None)
+        elif hasattr(folder_paths, 'get_input_directory'):
+            try:
+                state.append(os.path.getmtime(folder_paths.get_input_directory()))
+            except OSError:
+                state.append(None)
+
+    return state
+
+
+# The cached interface is plain JSON with the input and output types, which the frontend and the prompt validation ask for.
+# The combo lists aren't stored. They are taken from the inner node classes, because they are the file listings of model folders.
+def get_interface_summary(interface, input_types):
+    summary = {
+        'return_types': list(interface.return_types),
+        'return_names': list(interface.return_names),
+        'output_node': len(interface.output_mapping) == 0,
+        'input_types': {section: {label: [None] + list(slot[1:]) if label in interface.input_sources else list(slot) for label, slot in slots.items()}
+                        for section, slots in input_types.items() if section != 'hidden'},
+        'hidden': input_types['hidden'],
+        'input_sources': dict(interface.input_sources),
+    }
+
+    try:
+        json.dumps(summary)
+    except (TypeError, ValueError):
+        return None
+
+    return summary
+
+
+def get_input_types_from_summary(summary):
+    input_types = {}
+    for section, slots in summary['input_types'].items():
+        input_types[section] = {}
+        for label, slot in slots.items():
+            if label in summary['input_sources']:
+                node_type, input_slot = summary['input_sources'][label]
+                node_input_types = comfy_nodes.NODE_CLASS_MAPPINGS[node_type].INPUT_TYPES()
+                slot = [dict(node_input_types.get('required', {}), **node_input_types.get('optional', {}))[input_slot][0]] + slot[1:]
+
+            input_types[section][label] = tuple(slot)
+
+    input_types['hidden'] = dict(summary['hidden'])
+    return input_types
+
+
+# The sections are copied, so a caller can add or remove the slots. The slot specs and combo lists are shared with the memo.
+def copy_input_types(input_types):
+    return {section: dict(slots) for section, slots in input_types.items()}
 
-    # get widget config infos for auto recognition of input setting
-    node_config_map, spec_map = get_linked_slots_config(workflow)
 
-    sorted_input_nodes = sorted(input_nodes, key=lambda x: (x.get('title', ''), x.get('title') is None))
+def create_dynamic_class(component_name, workflow, category=None, lazy=False, cache_entry=None):
+    # 'workflow' can be a loader function. Then the .component.json is only parsed when it is required.
+    # raw_workflow is the workflow as saved, which is served to the frontend. 'workflow' is the optimized one for the execution.
+    raw_workflow = workflow
+    optimized = False
 
-    def get_input_types_dynamic():
+    def get_raw_workflow():
+        nonlocal raw_workflow
+        if callable(raw_workflow):
+            with interface_lock:
+                if callable(raw_workflow):
+                    raw_workflow = raw_workflow()
+
+        return raw_workflow
+
+    def get_workflow():
+        nonlocal workflow, optimized
+        if not optimized:
+            with interface_lock:
+                if not optimized:
+                    workflow = optimize_workflow(component_name, get_raw_workflow())
+                    optimized = True
+
+        return workflow
+
+    def get_input_types_dynamic(interface):
         try:
             input_types = {}
-            for i, node in enumerate(sorted_input_nodes):
-                build_input_types(i, input_mapping, input_types, node, node_config_map, spec_map)
+            for i, node in enumerate(interface.sorted_input_nodes):
+                build_input_types(i, interface.input_mapping, input_types, node, interface.node_config_map, interface.spec_map, interface.input_sources)
             return input_types
         except Exception as e:
             print(f"[Workflow-Component] '{component_name}' is broken. Maybe there are missing nodes. (INFO: {e})")
             traceback.print_exc()
             return {"BROKEN component": ("BROKEN component", )}
 
-    sorted_input_optional_nodes = sorted(input_optional_nodes, key=lambda x: (x.get('title', ''), x.get('title') is None))
-
-    def get_input_optional_types_dynamic():
+    def get_input_optional_types_dynamic(interface):
         try:
             input_optional_types = {}
-            for i, node in enumerate(sorted_input_optional_nodes):
-                build_input_types(i, input_mapping, input_optional_types, node, node_config_map, spec_map)
+            for i, node in enumerate(interface.sorted_input_optional_nodes):
+                build_input_types(i, interface.input_mapping, input_optional_types, node, interface.node_config_map, interface.spec_map, interface.input_sources)
             return input_optional_types
         except Exception as e:
             print(f"[Workflow-Component] BROKEN component - {e}")
             traceback.print_exc()
             return {"BROKEN component": ("BROKEN component", )}
 
-    return_types = []
-    return_names = []
-    output_mapping = {}
-    optional_inputs = {str(node['id']) for node in input_optional_nodes}
+    category = "Workflow/Temp" if category is None else f"Workflow/{category}"
 
-    sorted_nodes = sorted(output_nodes, key=lambda x: (x.get('title', ''), x.get('title') is None))
-    for i, node in enumerate(sorted_nodes):
-        build_output_types(i, node, node_config_map, output_mapping, return_names, return_types)
+    input_types_memo = None
+    summary_checked = False
 
-    category = "Workflow/Temp" if category is None else f"Workflow/{category}"
+    class DynamicClass(metaclass=LazyComponentType):
+        interface = None
+
+        # The summary of the cached interface is used until the workflow is analyzed for the execution.
+        @classmethod
+        def get_cached_summary(cls):
+            nonlocal summary_checked
+            if cache_entry is None or cls.interface is not None:
+                return None
+
+            if not summary_checked:
+                with interface_lock:
+                    if not summary_checked:
+                        summary = cache_entry['interface']
+                        if summary is not None and not is_valid_signatures(cache_entry['signatures']):
+                            component_cache_stats['invalidated'] += 1
+                            cache_entry['interface'] = summary = None
+
+                        if summary is not None:
+                            cls.RETURN_TYPES = tuple(summary['return_types'])
+                            cls.RETURN_NAMES = tuple(summary['return_names'])
+                            cls.OUTPUT_NODE = summary['output_node']
+
+                        summary_checked = True
+
+            return cache_entry['interface']
+
+        @classmethod
+        def load_declaration(cls):
+            if cls.get_cached_summary() is None:
+                cls.get_interface()
+
+        @classmethod
+        def get_interface(cls):
+            if cls.interface is None:
+                with interface_lock:
+                    if cls.interface is None:
+                        try:
+                            interface = ComponentInterface(get_workflow())
+
+                            # the input names were served from the cache, so they are mapped here
+                            if cache_entry is not None and cache_entry['interface'] is not None:
+                                get_input_types_dynamic(interface)
+                                get_input_optional_types_dynamic(interface)
+                        except Exception:
+                            if not lazy:
+                                raise
+
+                            print(f"[ERROR] Failed to load component '{component_name}'")
+                            traceback.print_exc()
+                            cls.RETURN_TYPES = ()
+                            cls.RETURN_NAMES = ()
+                            cls.OUTPUT_NODE = False
+                            return None
+
+                        cls.RETURN_TYPES = tuple(interface.return_types)
+                        cls.RETURN_NAMES = tuple(interface.return_names)
+                        cls.OUTPUT_NODE = len(interface.output_mapping) == 0
+                        cls.interface = interface
+
+            return cls.interface
 
-    class DynamicClass:
         @classmethod
         def INPUT_TYPES(s):
-            input_optional_types = get_input_optional_types_dynamic()
+            nonlocal input_types_memo
+
+            summary = s.get_cached_summary()
+            if summary is not None:
+                input_types_stats['calls'] += 1
+                return get_input_types_from_summary(summary)
+
+            interface = s.get_interface()
+            if interface is None:
+                return {"required": {"BROKEN component": ("BROKEN component", )}}
+
+            input_types_stats['calls'] += 1
+
+            # memoized result: (registry state, folder dependencies, folder state, input types)
+            registry_state = get_registry_state(interface)
+            if input_types_memo is not None and input_types_memo[0] == registry_state \
+                    and get_folder_state(input_types_memo[1]) == input_types_memo[2]:
+                return copy_input_types(input_types_memo[3])
+
+            input_types_stats['slow_path'] += 1
+
+            input_optional_types = get_input_optional_types_dynamic(interface)
             if len(input_optional_types) > 0:
-                return {
-                    "required": get_input_types_dynamic(),
+                input_types = {
+                    "required": get_input_types_dynamic(interface),
                     "optional": input_optional_types,
                     "hidden": {"unique_id": "UNIQUE_ID", "extra_pnginfo": "EXTRA_PNGINFO", "out_prompt": "PROMPT"},
                 }
             else:
-                return {
-                    "required": get_input_types_dynamic(),
+                input_types = {
+                    "required": get_input_types_dynamic(interface),
                     "hidden": {"unique_id": "UNIQUE_ID", "extra_pnginfo": "EXTRA_PNGINFO", "out_prompt": "PROMPT"},
                 }
 
-        RETURN_TYPES = tuple(return_types)
-        RETURN_NAMES = tuple(return_names)
+            # the memo is kept apart from the returned dict, so a caller which modifies the result doesn't change it
+            folder_names = get_folder_dependencies(input_types)
+            input_types_memo = registry_state, folder_names, get_folder_state(folder_names), copy_input_types(input_types)
 
-        OUTPUT_NODE = len(output_mapping) == 0
+            if cache_entry is not None and cache_entry['interface'] is None and "BROKEN component" not in input_types['required']:
+                cache_entry['interface'] = get_interface_summary(interface, input_types)
+                cache_entry['signatures'] = get_interface_signatures(interface)
+                mark_component_cache_dirty()
+
+            return input_types
 
         FUNCTION = "doit"
 
         CATEGORY = category
 
+        @classmethod
+        def get_workflow(cls):
+            return get_workflow()
+
+        @classmethod
+        def get_raw_workflow(cls):
+            return get_raw_workflow()
+
         def doit(self, *args, **kwargs):
-            return workflow_execution.execute(component_name, copy.deepcopy(prompt), workflow,
-                                              internal_id_name_map, optional_inputs, input_mapping, output_mapping,
+            interface = self.get_interface()
+            workflow = self.get_workflow()
+            return workflow_execution.execute(component_name, workflow['output'], workflow,
+                                              interface.internal_id_name_map, interface.optional_inputs,
+                                              interface.input_mapping, interface.output_mapping, interface.constant_nodes,
                                               *args, **kwargs)
 
         @classmethod
         def IS_CHANGED(cls, **kwargs):
-            return workflow_execution.is_changed(component_name, internal_id_name_map, output_mapping, **kwargs)
+            interface = cls.get_interface()
+            return workflow_execution.is_changed(component_name, interface.internal_id_name_map, interface.output_mapping, **kwargs)
+
+    if not lazy:
+        DynamicClass.get_interface()
 
     return DynamicClass
 
@@ -318,7 +819,7 @@ def flatten_INPUT_TYPES(data):
     return items
 
 
-def build_input_types(i, input_mapping, input_types, node, node_config_map, spec_map):
+def build_input_types(i, input_mapping, input_types, node, node_config_map, spec_map, input_sources=None):
     component_inputs = node['outputs']
     if len(component_inputs) > 0:
         input_links = component_inputs[0]['links']
@@ -443,18 +944,25 @@ def build_input_types(i, input_mapping, input_types, node, node_config_map, spec
 
                     input_types[input_label] = input_value
 
+                    if input_sources is not None and node_type is not None and isinstance(input_value[0], list):
+                        input_sources[input_label] = [node_type, input_slot]
+
+
+def get_node_types(workflow):
+    return [node['type'] for node in workflow['nodes']]
 
-def update_unresolved_map(node_name, workflow):
+
+def update_unresolved_map(node_name, node_types):
     global unresolved_map
 
     # add new unresolved
-    for node in workflow['nodes']:
-        if node['type'] not in comfy_nodes.NODE_CLASS_MAPPINGS and node['type'] not in ['ComponentInput', 'ComponentInputOptional', 'ComponentOutput']:
+    for node_type in node_types:
+        if node_type not in comfy_nodes.NODE_CLASS_MAPPINGS and node_type not in ['ComponentInput', 'ComponentInputOptional', 'ComponentOutput']:
             if node_name not in unresolved_map:
                 unresolved_map[node_name] = set()
 
             unresolved_nodes = unresolved_map[node_name]
-            unresolved_nodes.add(node['type'])
+            unresolved_nodes.add(node_type)
 
 
 def resolve_unresolved_map():
@@ -476,8 +984,10 @@ def get_workflow_hash(workflow):
     return hash_obj.hexdigest()[:6]
 
 
-def load_component(component_name, is_full_name, workflow, direct_reflect=False, category=None):
-    component_hash = get_workflow_hash(workflow)
+def load_component(component_name, is_full_name, workflow, direct_reflect=False, category=None, lazy=False, component_hash=None, cache_entry=None):
+    if component_hash is None:
+        component_hash = get_workflow_hash(workflow)
+
     if is_full_name:
         node_name = component_name
     else:
@@ -485,14 +995,17 @@ def load_component(component_name, is_full_name, workflow, direct_reflect=False,
 
     try:
         if node_name not in comfy_nodes.NODE_CLASS_MAPPINGS:
-            obj = create_dynamic_class(node_name, workflow, category)
+            obj = create_dynamic_class(node_name, workflow, category, lazy=lazy, cache_entry=cache_entry)
 
             if direct_reflect:
                 comfy_nodes.NODE_CLASS_MAPPINGS[node_name] = obj
             else:
                 NODE_CLASS_MAPPINGS[node_name] = obj
 
-            update_unresolved_map(node_name, workflow)
+            if cache_entry is not None:
+                update_unresolved_map(node_name, cache_entry['node_types'])
+            else:
+                update_unresolved_map(node_name, get_node_types(workflow))
 
             return (True, node_name)
         else:
@@ -503,25 +1016,123 @@ def load_component(component_name, is_full_name, workflow, direct_reflect=False,
         return (False, None)
 
 
-def load_all(directory):
+# The interfaces of the components are persisted across restarts as JSON in the user directory of ComfyUI.
+# Without the user directory, the components are loaded without the cache.
+# An entry is reused if the size and mtime of the file are the same, or if its content hash is the same.
+COMPONENT_CACHE_VERSION = 3
+COMPONENT_CACHE_KEYS = {'name', 'size', 'mtime_ns', 'digest', 'component_hash', 'node_types', 'interface', 'signatures'}
+component_cache = None
+component_cache_dirty = False
+component_cache_stats = {'hit': 0, 'miss': 0, 'invalidated': 0}
+
+
+def get_component_cache_path():
+    if not hasattr(folder_paths, 'get_user_directory'):
+        return None
+
+    return os.path.join(folder_paths.get_user_directory(), "workflow-component.cache.json")
+
+
+def load_component_cache():
+    global component_cache
+
+    if component_cache is not None:
+        return component_cache
+
+    component_cache = {}
+    try:
+        path = get_component_cache_path()
+        if path is not None and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+
+            if data.get('version') == COMPONENT_CACHE_VERSION:
+                component_cache = {file_path: entry for file_path, entry in data['entries'].items()
+                                   if isinstance(entry, dict) and entry.keys() == COMPONENT_CACHE_KEYS}
+    except Exception as e:
+        print(f"[WARN] Workflow-Component: Failed to read component cache. ({e})")
+
+    return component_cache
+
+
+def mark_component_cache_dirty():
+    global component_cache_dirty
+    component_cache_dirty = True
+
+
+def save_component_cache():
+    global component_cache_dirty
+
+    if component_cache is None or not component_cache_dirty:
+        return
+
+    try:
+        with interface_lock:
+            path = get_component_cache_path()
+            if path is None:
+                return
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump({'version': COMPONENT_CACHE_VERSION, 'entries': component_cache}, file)
+            os.replace(path + ".tmp", path)
+            component_cache_dirty = False
+    except Exception as e:
+        print(f"[WARN] Workflow-Component: Failed to write component cache. ({e})")
+
+
+atexit.register(save_component_cache)
+
+
+# LAZY_LOADING: register placeholder classes and defer the interface analysis until INPUT_TYPES is requested.
+# LOAD_WORKERS: number of threads used to read and parse the .component.json files.
+# USE_COMPONENT_CACHE: reuse the interfaces of the previous run for unchanged files.
+LAZY_LOADING = True
+LOAD_WORKERS = min(8, (os.cpu_count() or 1) + 4)
+USE_COMPONENT_CACHE = True
+
+# workflows of cached components, which are not parsed yet.
+pending_workflows = {}
+
+
+def read_component_file(file_path, digest=None):
+    with open(file_path, "rb") as file:
+        content = file.read()
+
+    content_digest = hashlib.md5(content).hexdigest()
+    if digest is not None and digest == content_digest:
+        return None, None, content_digest
+
+    data = json.loads(content.decode("utf-8"))
+
+    return data, get_workflow_hash(data), content_digest
+
+
+def get_workflow_components():
+    for component_full_name in list(pending_workflows.keys()):
+        workflow_components[component_full_name] = pending_workflows.pop(component_full_name)()
+
+    return workflow_components
+
+
+def load_all(directory, lazy=None, workers=None):
     global workflow_components
+    global component_cache
 
-    def doit(category, cur_dir, filename):
-        if filename.endswith(".component.json"):
-            file_path = os.path.join(cur_dir, filename)
+    if lazy is None:
+        lazy = LAZY_LOADING
 
-            component_name = os.path.basename(filename)[:-15]
+    if workers is None:
+        workers = LOAD_WORKERS
 
-            with open(file_path, "r", encoding="utf-8") as file:
-                try:
-                    data = json.load(file)
-                    _, component_full_name = load_component(component_name, False, data, category=category)
-                    # print(f"LOAD: {component_full_name}")
-                    workflow_components[component_full_name] = data
-                except Exception as ex:
-                    print(f"[ERROR] Workflow-Component: Failed to loading component '{component_name}'\n{ex}")
+    # the stats are of this load
+    component_cache_stats.update(hit=0, miss=0, invalidated=0)
 
+    use_cache = USE_COMPONENT_CACHE and get_component_cache_path() is not None
+    old_cache = load_component_cache() if use_cache else {}
+    new_cache = {}
 
+    items = []
     for root, dirs, files in os.walk(directory):
         relative_path = os.path.relpath(root, directory)
 
@@ -531,9 +1142,82 @@ def load_all(directory):
         category = None if relative_path == "." else relative_path
 
         for file in files:
-            doit(category, root, file)
+            if file.endswith(".component.json"):
+                file_path = os.path.abspath(os.path.join(root, file))
+                items.append((category, file_path, os.path.basename(file)[:-15]))
 
-    resolve_unresolved_map()
+    def read(item):
+        file_path = item[1]
+        try:
+            stat = os.stat(file_path)
+            entry = old_cache.get(file_path)
+
+            if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                return (None, None, entry), None
+
+            data, component_hash, digest = read_component_file(file_path, entry['digest'] if entry is not None else None)
+            if data is None:
+                entry = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                return (None, None, entry), None
+
+            entry = {
+                'name': item[2],
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'digest': digest,
+                'component_hash': component_hash,
+                'node_types': get_node_types(data),
+                'interface': None,
+                'signatures': None,
+            }
+
+            return (data, component_hash, entry), None
+        except Exception as ex:
+            return None, ex
+
+    if workers > 1 and len(items) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            loaded = list(pool.map(read, items))
+    else:
+        loaded = [read(item) for item in items]
+
+    def get_loader(file_path):
+        return lambda: read_component_file(file_path)[0]
 
+    # registration is kept serial and in walk order, so the result doesn't depend on the thread scheduling
+    for (category, file_path, component_name), (result, ex) in zip(items, loaded):
+        try:
+            if ex is not None:
+                raise ex
+
+            data, component_hash, entry = result
 
+            if use_cache:
+                new_cache[file_path] = entry
 
+            if data is None:
+                component_cache_stats['hit'] += 1
+                _, component_full_name = load_component(component_name, False, get_loader(file_path), category=category, lazy=lazy,
+                                                        component_hash=entry['component_hash'], cache_entry=entry)
+                if component_full_name is not None:
+                    pending_workflows[component_full_name] = NODE_CLASS_MAPPINGS[component_full_name].get_raw_workflow
+            else:
+                if use_cache:
+                    component_cache_stats['miss'] += 1
+                _, component_full_name = load_component(component_name, False, data, category=category, lazy=lazy,
+                                                        component_hash=component_hash, cache_entry=entry if use_cache else None)
+                # print(f"LOAD: {component_full_name}")
+                workflow_components[component_full_name] = data
+        except Exception as ex:
+            print(f"[ERROR] Workflow-Component: Failed to loading component '{component_name}'\n{ex}")
+
+    if use_cache:
+        if new_cache.keys() != old_cache.keys() or component_cache_stats['miss'] > 0:
+            mark_component_cache_dirty()
+
+        component_cache = new_cache
+        save_component_cache()
+
+        print(f"[Workflow-Component] component cache: {component_cache_stats['hit']} hit, {component_cache_stats['miss']} miss")
+
+    resolve_unresolved_map()
@@ -4,6 +4,10 @@ from aiohttp import web
 
 import workflow_component.component_loader as component_loader
 import workflow_component.workflow_execution as workflow_execution
+import workflow_component.metrics as metrics
+import workflow_component.cache_budget as cache_budget
+import workflow_component.shared_cache as shared_cache
+import workflow_component.reclaim as reclaim
 
 
 def onprompt(json_data):
@@ -66,7 +70,7 @@ async def load_component(request):
 
 @server.PromptServer.instance.routes.get("/component/get_workflows")
 async def get_workflows(request):
-    return web.json_response(component_loader.workflow_components, content_type='application/json')
+    return web.json_response(component_loader.get_workflow_components(), content_type='application/json')
 
 
 @server.PromptServer.instance.routes.get("/component/get_unresolved")
@@ -78,3 +82,24 @@ async def get_unresolved(request):
         unresolved_nodes.update(nodes)
 
     return web.json_response({'nodes': list(unresolved_nodes)}, content_type='application/json')
+
+
+@server.PromptServer.instance.routes.get("/component/metrics")
+async def get_metrics(request):
+    shared_stats = shared_cache.get_stats()
+    extra = [
+        ("workflow_component_executors", "gauge", "Live component executors.", [({}, len(workflow_execution.executor_dict))]),
+        ("workflow_component_output_bytes", "gauge", "Bytes held in the outputs of the component executors.",
+         [({'device': 'cpu'}, cache_budget.usage['cpu']), ({'device': 'gpu'}, cache_budget.usage['device'])]),
+        ("workflow_component_shared_cache_entries", "gauge", "Entries of the shared output cache.", [({}, shared_stats['entries'])]),
+        ("workflow_component_shared_cache_lookups_total", "counter", "Lookups of the shared output cache, by result.",
+         [({'result': 'hit'}, shared_stats['hit']), ({'result': 'miss'}, shared_stats['miss'])]),
+        ("workflow_component_reclaim_total", "counter", "Memory reclamations after the component executions, by trigger.",
+         [({'trigger': trigger}, count) for trigger, count in reclaim.stats.items() if trigger != 'deferred']),
+        ("workflow_component_reclaim_deferred_total", "counter", "Component executions which deferred the memory reclamation.",
+         [({}, reclaim.stats['deferred'])]),
+        ("workflow_component_lazy_pruned_total", "counter", "Nodes skipped by the lazy control nodes.",
+         [({}, workflow_execution.lazy_stats['pruned'])]),
+    ]
+
+    return web.Response(body=metrics.render(extra).encode('utf-8'), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
@@ -4,7 +4,6 @@
 import sys
 import copy
 import traceback
-import gc
 import time
 
 import torch
@@ -12,15 +11,20 @@ import nodes
 
 import comfy.model_management
 from execution import format_value, full_type_name
-from queue import Queue
-
-
-DEBUG_FLAG = True
-
-
-def print_dbg(x):
-    if DEBUG_FLAG:
-        print(f"[DBG] {x()}")
+import workflow_component.shared_cache as shared_cache
+import workflow_component.cache_budget as cache_budget
+from workflow_component.fingerprint import fingerprint
+import workflow_component.node_keys as node_keys_module
+import workflow_component.tracing as tracing
+import workflow_component.metrics as metrics
+import workflow_component.profiling as profiling
+import workflow_component.reclaim as reclaim
+from workflow_component.scheduler import Worklist, MemoryWorklist, get_priorities, get_strongly_connected_components, get_pending_consumers, \
+    simulate_peak, get_fifo_order, RANK_OUTPUT, RANK_DEFAULT, RANK_LOOP_CONTROL
+from concurrent.futures import ThreadPoolExecutor, wait
+from types import MappingProxyType
+from collections import ChainMap, OrderedDict
+from collections.abc import Mapping
 
 
 # To handling virtual node
@@ -41,6 +45,131 @@ class DummyNode:
             pass
 
 
+# Auto-batching: when a batch-safe node gets list inputs, the IMAGE/LATENT/MASK elements are concatenated along the batch dimension
+# and the node runs once per micro-batch instead of once per element. The outputs are split back per element.
+# A node class is marked as safe with 'BATCH_SAFE = True' or by listing it in BATCH_SAFE_NODES.
+# It must process the rows of a batch independently and return only IMAGE/LATENT/MASK outputs.
+# Off by default: a batched call can change the numerics and the peak VRAM of the node.
+ENABLE_AUTO_BATCHING = False
+AUTO_BATCH_MAX_SIZE = 16  # max rows of a micro-batch, bounds the VRAM of one call
+BATCH_SAFE_NODES = {"VAEDecode", "VAEEncode", "ImageInvert", "ImageScale", "ImageScaleBy"}
+BATCH_TYPES = {"IMAGE", "LATENT", "MASK"}
+
+batch_safe_classes = {}
+verified_batch_classes = set()  # classes which returned a well-formed batch at least once
+batching_stats = {'calls': 0, 'elements': 0, 'fallbacks': 0}
+
+
+def is_batch_safe(obj):
+    class_def = type(obj)
+    safe = batch_safe_classes.get(class_def)
+    if safe is None:
+        if any(getattr(class_def, "OUTPUT_IS_LIST", ())) or getattr(class_def, "OUTPUT_NODE", False):
+            safe = False
+        elif not (getattr(class_def, "BATCH_SAFE", False) or class_def.__name__ in BATCH_SAFE_NODES):
+            safe = False
+        else:
+            return_types = getattr(class_def, "RETURN_TYPES", ())
+            safe = len(return_types) > 0 and all(x in BATCH_TYPES for x in return_types)
+
+        batch_safe_classes[class_def] = safe
+
+    return safe
+
+
+# IMAGE/MASK: tensor, LATENT: {'samples': tensor}. Other latent keys (e.g. noise_mask) are not batched.
+def get_batch_rows(value):
+    if isinstance(value, torch.Tensor) and value.dim() > 0:
+        return value.shape[0]
+
+    if isinstance(value, dict) and value.keys() == {'samples'} and isinstance(value['samples'], torch.Tensor):
+        return value['samples'].shape[0]
+
+    return None
+
+
+def concat_batch(values):
+    if isinstance(values[0], dict):
+        return {'samples': torch.cat([x['samples'] for x in values])}
+
+    return torch.cat(values)
+
+
+def split_batch(value, sizes):
+    if get_batch_rows(value) != sum(sizes):
+        return None
+
+    if isinstance(value, dict):
+        return [{'samples': x} for x in torch.split(value['samples'], sizes)]
+
+    return list(torch.split(value, sizes))
+
+
+# Returns the results of the first 'done' elements. The rest is left to the per-element execution.
+# Until a class has returned a well-formed batch, its first group is a single element,
+# so a node which can't be batched still gets the result of that call and nothing is executed twice.
+def map_node_over_batches(obj, input_data_all, func, max_len_input, allow_interrupt):
+    varying = [k for k, v in input_data_all.items() if len(v) > 1]
+    constants = {k: v[0] for k, v in input_data_all.items() if len(v) == 1}
+
+    # the rows of each element, which must be the same for all of the varying inputs
+    sizes = []
+    for i in range(max_len_input):
+        rows = {get_batch_rows(input_data_all[k][i if len(input_data_all[k]) > i else -1]) for k in varying}
+        if len(rows) != 1 or None in rows:
+            return [], 0
+
+        sizes.append(rows.pop())
+
+    groups = []
+    for i, size in enumerate(sizes):
+        if len(groups) > 0 and sum(sizes[j] for j in groups[-1]) + size <= AUTO_BATCH_MAX_SIZE \
+                and (len(groups) > 1 or type(obj) in verified_batch_classes):
+            groups[-1].append(i)
+        else:
+            groups.append([i])
+
+    results = []
+    done = 0
+    for group in groups:
+        params = dict(constants)
+        try:
+            for k in varying:
+                v = input_data_all[k]
+                values = [v[i if len(v) > i else -1] for i in group]
+                params[k] = values[0] if len(values) == 1 else concat_batch(values)
+        except RuntimeError:
+            break  # different shapes, dtypes or devices
+
+        if allow_interrupt:
+            nodes.before_node_execution()
+
+        raw = getattr(obj, func)(**params)
+        r = raw
+        if isinstance(r, dict):
+            r = r.get('result') if 'ui' not in r else None
+
+        group_sizes = [sizes[i] for i in group]
+        outputs = [split_batch(x, group_sizes) for x in r] if r is not None else [None]
+        if any(x is None for x in outputs):
+            # the node doesn't keep the rows of the batch, so it isn't batched anymore
+            print(f"[Workflow-Component] WARN: '{type(obj).__name__}' can't be auto-batched, its outputs don't match the input batch.")
+            batch_safe_classes[type(obj)] = False
+            if len(group) == 1:
+                # a call with the element itself is the per-element result
+                results.append(raw)
+                done += 1
+            break
+
+        verified_batch_classes.add(type(obj))
+        batching_stats['calls'] += 1
+        batching_stats['elements'] += len(group)
+        results.extend(tuple(x[j] for x in outputs) for j in range(len(group)))
+        done += len(group)
+
+    return results, done
+
+
 def map_node_over_list(obj, input_data_all, func, allow_interrupt=False):
     # check if node wants the lists
     intput_is_list = False
@@ -69,7 +198,13 @@ def map_node_over_list(obj, input_data_all, func, allow_interrupt=False):
             nodes.before_node_execution()
         results.append(getattr(obj, func)(**input_data_all))
     else:
-        for i in range(max_len_input):
+        done = 0
+        if ENABLE_AUTO_BATCHING and max_len_input > 1 and func == getattr(obj, "FUNCTION", None) and is_batch_safe(obj):
+            results, done = map_node_over_batches(obj, input_data_all, func, max_len_input, allow_interrupt)
+            if done < max_len_input:
+                batching_stats['fallbacks'] += 1
+
+        for i in range(done, max_len_input):
             if allow_interrupt:
                 nodes.before_node_execution()
 
@@ -119,8 +254,37 @@ def get_output_data(obj, input_data_all):
     return output, ui
 
 
-def get_input_data(inputs, class_def, unique_id, outputs={}, prompt={}, extra_data={}):
-    valid_inputs = class_def.INPUT_TYPES()
+# INPUT_TYPES() may scan the model directories, so the executor reads it only once per class in a run.
+class_metadata_stats = {'input_types_calls': 0}
+
+
+class ClassMetadata:
+    def __init__(self, class_def):
+        input_types = class_def.INPUT_TYPES()
+        class_metadata_stats['input_types_calls'] += 1
+
+        self.name = class_def.__name__
+        self.required = frozenset(input_types.get("required", {}))
+        self.optional = frozenset(input_types.get("optional", {}))
+        self.hidden = dict(input_types.get("hidden", {}))
+        self.is_loop_control = self.name == "LoopControl"
+        self.is_one_of = self.name == "ExecutionOneOf"
+
+
+# 'cache' is a dict (class_def -> ClassMetadata) which lives during a run
+def get_class_metadata(class_def, cache=None):
+    if cache is None:
+        return ClassMetadata(class_def)
+
+    metadata = cache.get(class_def)
+    if metadata is None:
+        metadata = cache[class_def] = ClassMetadata(class_def)
+
+    return metadata
+
+
+def get_input_data(inputs, class_def, unique_id, outputs={}, prompt={}, extra_data={}, metadata_cache=None):
+    metadata = get_class_metadata(class_def, metadata_cache)
     input_data_all = {}
     for x in inputs:
         input_data = inputs[x]
@@ -130,7 +294,7 @@ def get_input_data(inputs, class_def, unique_id, outputs={}, prompt={}, extra_da
             if input_unique_id in outputs and len(outputs[input_unique_id]) == 0:
                 input_data_all[x] = []
             else:
-                if class_def.__name__ != "LoopControl" and class_def.__name__ != "ExecutionOneOf":
+                if not metadata.is_loop_control and not metadata.is_one_of:
                     if input_unique_id not in outputs or outputs[input_unique_id][input_data[1]] == [None]:
                         return None
 
@@ -138,19 +302,18 @@ def get_input_data(inputs, class_def, unique_id, outputs={}, prompt={}, extra_da
                     obj = outputs[input_unique_id][output_index]
                     input_data_all[x] = obj
         else:
-            if ("required" in valid_inputs and x in valid_inputs["required"]) or ("optional" in valid_inputs and x in valid_inputs["optional"]):
+            if x in metadata.required or x in metadata.optional:
                 input_data_all[x] = [input_data]
 
-    if "hidden" in valid_inputs:
-        h = valid_inputs["hidden"]
-        for x in h:
-            if h[x] == "PROMPT":
-                input_data_all[x] = [prompt]
-            if h[x] == "EXTRA_PNGINFO":
-                if "extra_pnginfo" in extra_data:
-                    input_data_all[x] = [extra_data['extra_pnginfo']]
-            if h[x] == "UNIQUE_ID":
-                input_data_all[x] = [unique_id]
+    h = metadata.hidden
+    for x in h:
+        if h[x] == "PROMPT":
+            input_data_all[x] = [prompt.materialize() if isinstance(prompt, PromptOverlay) else prompt]
+        if h[x] == "EXTRA_PNGINFO":
+            if "extra_pnginfo" in extra_data:
+                input_data_all[x] = [extra_data['extra_pnginfo']]
+        if h[x] == "UNIQUE_ID":
+            input_data_all[x] = [unique_id]
     return input_data_all
 
 
@@ -194,14 +357,14 @@ def exception_helper(unique_id, input_data_all, executed, outputs, task):
         return executed, False, error_details, ex
 
 
-def is_incomplete_input_slots(class_def, inputs, outputs):
-    required_inputs = set(class_def.INPUT_TYPES().get("required", []))
+def is_incomplete_input_slots(class_def, inputs, outputs, metadata_cache=None):
+    metadata = get_class_metadata(class_def, metadata_cache)
 
-    if len(required_inputs - inputs.keys()) > 0:
+    if len(metadata.required - inputs.keys()) > 0:
         return True
 
     # "ExecutionOneof" node is a special node that allows only one of the multiple execution paths to be reached and passed through.
-    if class_def.__name__ == "ExecutionOneOf":
+    if metadata.is_one_of:
         for x in inputs:
             input_data = inputs[x]
 
@@ -213,7 +376,7 @@ def is_incomplete_input_slots(class_def, inputs, outputs):
         return True
 
     # The "LoopControl" is a special node that can be executed even without loopback_input.
-    if class_def.__name__ == "LoopControl":
+    if metadata.is_loop_control:
         inputs = {
                     'loop_condition': inputs['loop_condition'],
                     'initial_input': inputs['initial_input'],
@@ -251,6 +414,10 @@ def get_class_type(prompt, unique_id):
     return class_type
 
 
+def get_input_sources(prompt, unique_id):
+    return list(dict.fromkeys(input_data[0] for input_data in prompt[unique_id]['inputs'].values() if isinstance(input_data, list)))
+
+
 def get_next_nodes_map(prompt):
     next_nodes = {}
     for key, value in prompt.items():
@@ -266,149 +433,860 @@ def get_next_nodes_map(prompt):
     return next_nodes
 
 
-def worklist_execute(server, prompt, outputs, extra_data, prompt_id, outputs_ui, to_execute, next_nodes, object_storage):
-    worklist = Queue()
-    executed = set()
-    will_execute = {}
+def get_topological_levels(prompt, next_nodes):
+    in_degree = {unique_id: 0 for unique_id in prompt}
+    for unique_id, next_ids in next_nodes.items():
+        if unique_id in prompt:
+            for next_id in next_ids:
+                in_degree[next_id] += 1
 
-    def add_work_high(item):
-        worklist.put(item)
-        cnt = will_execute.get(item, 0)
-        will_execute[item] = cnt + 1
+    levels = {}
+    level = 0
+    current = sorted(unique_id for unique_id, degree in in_degree.items() if degree == 0)
+    while current:
+        next_level = []
+        for unique_id in current:
+            levels[unique_id] = level
+            for next_id in next_nodes.get(unique_id, []):
+                in_degree[next_id] -= 1
+                if in_degree[next_id] == 0:
+                    next_level.append(next_id)
 
-    def add_work(item):
-        worklist.put(item)
-        cnt = will_execute.get(item, 0)
+        current = sorted(next_level)
+        level += 1
 
-        if item in outputs:
-            del outputs[item]
+    # nodes in a loop never reach in-degree 0. They are placed after the acyclic part.
+    for unique_id in prompt:
+        if unique_id not in levels:
+            levels[unique_id] = level
 
-        will_execute[item] = cnt + 1
+    return levels
 
-    def get_work():
-        item = worklist.get()
-        cnt = will_execute.get(item, 0)
-        if cnt <= 0:
-            del will_execute[item]
-        else:
-            will_execute[item] = cnt - 1
 
-        return str(item)
+# id -> node index of the workflow in extra_pnginfo.
+# It is built on the first use in a prompt and shared by the execution paths of all components.
+class WorkflowNodeIndex:
+    def __init__(self, extra_pnginfo):
+        self.extra_pnginfo = extra_pnginfo
+        self.nodes = {}
+        for node in extra_pnginfo.get('workflow', {}).get('nodes', []):
+            self.nodes[node['id']] = node
+
+        self.node_ids = frozenset(str(node_id) for node_id in self.nodes)
+
+    def get(self, node_id):
+        return self.nodes.get(int(node_id))
+
+    # nodes in the workflow that are not in the prompt (muted nodes)
+    def get_muted_nodes(self, prompt):
+        return self.node_ids - prompt.keys()
+
+
+NODE_INDEX_LIMIT = 16
+node_indexes = OrderedDict()
+
+
+def get_node_index(extra_pnginfo):
+    key = id(extra_pnginfo)
+    index = node_indexes.get(key)
+
+    # the index keeps a reference of extra_pnginfo, so the id can't be reused while it is in the table
+    if index is None or index.extra_pnginfo is not extra_pnginfo:
+        index = WorkflowNodeIndex(extra_pnginfo)
+        node_indexes[key] = index
+        while len(node_indexes) > NODE_INDEX_LIMIT:
+            node_indexes.popitem(last=False)
+
+    return index
+
+
+# Per-invocation view of the immutable plan prompt.
+# A node is a ChainMap whose first map holds only the fields of this invocation ('inputs', 'is_changed').
+class PromptOverlay(Mapping):
+    def __init__(self, base, inputs):
+        self.base = base
+        self.inputs = inputs
+        self.nodes = {}
+        self.materialized = None
+
+    def __getitem__(self, key):
+        node = self.nodes.get(key)
+        if node is None:
+            node = ChainMap({'inputs': self.inputs[key]}, self.base[key])
+            self.nodes[key] = node
+
+        return node
+
+    def __contains__(self, key):
+        return key in self.base
+
+    def __iter__(self):
+        return iter(self.base)
 
-    def apply_priority(items):
-        high_priority = []
-        low_priority = []
+    def __len__(self):
+        return len(self.base)
 
-        for cur_id, cur_class_def in items:
-            if cur_class_def.__name__ == "LoopControl":
-                low_priority.append(cur_id)
-            elif cur_class_def.RETURN_TYPES == ():
-                high_priority.append(cur_id)
+    # plain dict copy for the nodes which receive the prompt through the hidden 'PROMPT' input
+    def materialize(self):
+        if self.materialized is None:
+            self.materialized = {}
+            for key in self.base:
+                node = self[key]
+                self.materialized[key] = {name: dict(value) if name == 'inputs' else value for name, value in node.items()}
+
+        return self.materialized
+
+
+def freeze_prompt(prompt):
+    return MappingProxyType({key: MappingProxyType(dict(value, inputs=MappingProxyType(value['inputs']))) for key, value in prompt.items()})
+
+
+# Static analysis of a component prompt. It is compiled once after the node classes are resolved and shared by all executions.
+# Nodes which don't depend on the component inputs are evaluated once per process and reused by every instance.
+ENABLE_CONSTANT_FOLDING = True
+
+# Outputs which are recomputed on every invocation anyway (downstream of a frequently changing component input)
+# are released as soon as their last consumer has been executed.
+ENABLE_LIVENESS = True
+liveness_stats = {'released': 0}
+
+PRINT_MEMORY_SCHEDULE = False  # print the estimated peak of every memory-first run
+
+
+class ExecutionPlan:
+    def __init__(self, prompt, workflow, optional_inputs=frozenset(), constant_nodes=frozenset()):
+        self.prompt = freeze_prompt(copy.deepcopy(prompt))
+        self.optional_inputs = frozenset(optional_inputs)
+
+        self.class_types = MappingProxyType({unique_id: get_class_type(self.prompt, unique_id) for unique_id in self.prompt})
+        self.class_defs = MappingProxyType({unique_id: get_class_def(self.prompt, unique_id) for unique_id in self.prompt})
+
+        self.next_nodes = MappingProxyType({key: frozenset(value) for key, value in get_next_nodes_map(self.prompt).items()})
+
+        self.levels = MappingProxyType(get_topological_levels(self.prompt, self.next_nodes))
+        self.topological_order = tuple(sorted(self.prompt.keys(), key=lambda x: (self.levels[x], x)))
+
+        output_nodes = set()
+        for node in workflow['nodes']:
+            class_type = node['type']
+            if class_type in ["ComponentInput", "ComponentInputOptional", "ComponentOutput", "Reroute", "Note", "PrimitiveNode"]:
+                pass
+            elif class_type:
+                class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
+                if hasattr(class_def, "OUTPUT_NODE") and class_def.OUTPUT_NODE and str(node['id']) in self.prompt:
+                    output_nodes.add(str(node['id']))
+
+        self.output_nodes = frozenset(output_nodes)
+
+        # the nodes of the component workflow which are muted (not in the prompt). They don't change for a plan.
+        self.muted_nodes = frozenset(str(node['id']) for node in workflow['nodes']) - self.prompt.keys()
+
+        self.priorities = MappingProxyType(get_scheduling_priorities(self.prompt, self.next_nodes, lambda x: self.class_defs[x]))
+
+        # A constant node is foldable only if all of its upstream nodes are foldable.
+        foldable = set()
+        if ENABLE_CONSTANT_FOLDING:
+            for unique_id in self.topological_order:
+                if unique_id not in constant_nodes or not shared_cache.is_reusable(self.class_defs[unique_id], self.class_types[unique_id]):
+                    continue
+
+                inputs = self.prompt[unique_id]['inputs']
+                if all(input_data[0] in foldable for input_data in inputs.values() if isinstance(input_data, list)):
+                    foldable.add(unique_id)
+
+        self.constant_nodes = frozenset(foldable)
+
+        # unique_id -> (output, output_ui, node key), shared by all executors of this plan
+        self.constant_outputs = {}
+
+        # liveness: the outputs which must stay in the executor
+        # (component inputs, sources of ComponentOutput, loops, inputs of nodes which read them out of the normal order)
+        cycle_nodes = set()
+        for component in get_strongly_connected_components(self.topological_order, self.next_nodes):
+            if len(component) > 1 or component[0] in self.next_nodes.get(component[0], ()):
+                cycle_nodes.update(component)
+
+        keep = set(self.constant_nodes) | cycle_nodes
+        keep.update(str(node['id']) for node in workflow['nodes'] if node['type'] in ["ComponentInput", "ComponentInputOptional"])
+        for unique_id, value in self.prompt.items():
+            class_def = self.class_defs[unique_id]
+            if class_def is DummyNode or class_def.__name__ in ["LoopControl", "ExecutionOneOf"] or hasattr(class_def, 'IS_CHANGED') or unique_id in cycle_nodes:
+                keep.update(input_data[0] for input_data in value['inputs'].values() if isinstance(input_data, list))
+
+        self.liveness_keep = frozenset(keep)
+        self.releasable = {}
+
+        # output size estimates for the memory-first schedule, updated on every run in that mode
+        self.output_sizes = {}
+
+        # pruning table: unprovided optional inputs -> (pruned node inputs, next_nodes)
+        self.pruned = {}
+
+    def is_valid(self):
+        for unique_id, class_type in self.class_types.items():
+            if class_type != "DummyNode" and nodes.NODE_CLASS_MAPPINGS.get(class_type) is not self.class_defs[unique_id]:
+                return False
+
+        return True
+
+    def get_pruned(self, given_inputs):
+        empty_option_prompts = frozenset(key for key in self.optional_inputs if key not in given_inputs)
+
+        pruned = self.pruned.get(empty_option_prompts)
+        if pruned is None:
+            # unlink unprovided option prompt
+            if len(empty_option_prompts) == 0:
+                pruned_inputs = {key: value['inputs'] for key, value in self.prompt.items()}
+                next_nodes = self.next_nodes
             else:
-                low_priority.append(cur_id)
+                pruned_inputs = {}
+                for key, value in self.prompt.items():
+                    pruned_inputs[key] = MappingProxyType({name: input_value for name, input_value in value['inputs'].items() if
+                                                           not isinstance(input_value, list) or input_value[0] not in empty_option_prompts})
+
+                next_nodes = MappingProxyType({key: frozenset(value) for key, value in
+                                               get_next_nodes_map({key: {'inputs': value} for key, value in pruned_inputs.items()}).items()})
+
+            pruned = MappingProxyType(pruned_inputs), next_nodes
+            self.pruned[empty_option_prompts] = pruned
+
+        return pruned
+
+    def new_prompt(self, given_inputs):
+        pruned_inputs, _ = self.get_pruned(given_inputs)
+        return PromptOverlay(self.prompt, pruned_inputs)
+
+    def get_next_nodes(self, given_inputs):
+        return self.get_pruned(given_inputs)[1]
+
+    # the nodes downstream of the volatile inputs, except the ones which must be kept
+    def get_releasable(self, volatile_inputs):
+        volatile_inputs = frozenset(volatile_inputs)
+        releasable = self.releasable.get(volatile_inputs)
+        if releasable is None:
+            reachable = set()
+            worklist = list(volatile_inputs)
+            while worklist:
+                unique_id = worklist.pop()
+                if unique_id not in reachable:
+                    reachable.add(unique_id)
+                    worklist.extend(self.next_nodes.get(unique_id, ()))
+
+            releasable = frozenset(reachable - self.liveness_keep)
+            self.releasable[volatile_inputs] = releasable
+
+        return releasable
+
+    # Seed the outputs of an executor with the folded constants.
+    # The keys of the dependents don't change, so their cached outputs stay valid.
+    def seed_constants(self, outputs, outputs_ui, node_keys, muted_nodes):
+        for unique_id in self.topological_order:
+            entry = self.constant_outputs.get(unique_id)
+            if entry is None or unique_id in muted_nodes:
+                continue
+
+            output, output_ui, key = entry
+            if outputs.get(unique_id) is output:
+                continue
+
+            outputs[unique_id] = output
+            if len(output_ui) > 0:
+                outputs_ui[unique_id] = output_ui
+            node_keys[unique_id] = key
+
+    def store_constants(self, executed, outputs, outputs_ui, keys):
+        stale = []
+        for unique_id in executed:
+            if unique_id in self.constant_nodes and unique_id in outputs and unique_id in keys:
+                self.constant_outputs[unique_id] = outputs[unique_id], outputs_ui.get(unique_id, {}), keys[unique_id]
+                stale.extend(x for x in self.next_nodes.get(unique_id, []) if x not in executed)
+
+        # the constants computed from the replaced outputs are outdated
+        while stale:
+            unique_id = stale.pop()
+            if self.constant_outputs.pop(unique_id, None) is not None:
+                stale.extend(self.next_nodes.get(unique_id, []))
+
+
+# Independent nodes which are safe to run concurrently can be executed on a thread pool. (opt-in)
+# A node class is marked as safe with 'PARALLEL_SAFE = True' or by listing it in PARALLEL_SAFE_NODES.
+# The outputs are committed in the worklist order, so the results are the same as the serial execution.
+PARALLEL_EXECUTION = False
+PARALLEL_WORKERS = 4
+PARALLEL_SAFE_NODES = {"CannyEdgePreprocessor", "LeReS-DepthMapPreprocessor"}
+
+parallel_safe_classes = {}
+parallel_pool = None
+
+
+def is_parallel_safe(class_def, class_type):
+    safe = parallel_safe_classes.get(class_def)
+    if safe is None:
+        if class_type == "DummyNode" or class_type in shared_cache.SHARED_CACHE_EXCLUDED:
+            safe = False
+        elif getattr(class_def, "OUTPUT_NODE", False) or class_def.RETURN_TYPES == ():
+            safe = False  # output nodes keep their priority in the worklist
+        else:
+            safe = getattr(class_def, "PARALLEL_SAFE", False) or class_type in PARALLEL_SAFE_NODES
+
+        parallel_safe_classes[class_def] = safe
+
+    return safe
+
+
+def get_parallel_pool():
+    global parallel_pool
+    if parallel_pool is None:
+        parallel_pool = ThreadPoolExecutor(max_workers=PARALLEL_WORKERS, thread_name_prefix="workflow-component")
+
+    return parallel_pool
+
+
+def get_output_data_in_worker(obj, input_data_all):
+    # inference mode is thread local
+    with torch.inference_mode():
+        return get_output_data(obj, input_data_all)
+
+
+# Demand-driven inputs of the control nodes.
+#   ExecutionSwitch: 'select' is resolved first, and then only the selected input is demanded.
+#   ExecutionOneOf: the linked inputs are demanded one by one in order, until one of them provides a value.
+# The nodes which only feed the inputs that are not demanded are not executed. (pruned)
+ENABLE_LAZY_CONTROL = True
+lazy_stats = {'pruned': 0}
+
+SWITCH_INPUTS = ["input1", "input2_opt", "input3_opt", "input4_opt", "input5_opt"]
+ONEOF_INPUTS = ["input1", "input2", "input3", "input4", "input5"]
+
+
+class LazyControl:
+    def __init__(self, prompt, outputs, lookup_class_def, metadata_cache=None):
+        self.prompt = prompt
+        self.outputs = outputs
+        self.lookup_class_def = lookup_class_def
+        self.metadata_cache = metadata_cache
+        self.candidates = {}  # ExecutionOneOf -> index of the last demanded linked input
+        self.waiting = {}  # source of 'select' -> ExecutionSwitch nodes waiting for it
+        self.visited = set()
+        self.demanded = set()  # the nodes to execute, maintained by worklist_execute
+
+    def get_kind(self, unique_id):
+        name = self.lookup_class_def(unique_id).__name__
+        return name if name in ["ExecutionSwitch", "ExecutionOneOf"] else None
+
+    # -> (resolved, selected input name)
+    def get_selected_input(self, unique_id):
+        select = self.prompt[unique_id]['inputs'].get('select')
+        if isinstance(select, list):
+            output = self.outputs.get(select[0])
+            if output is None or len(output) <= select[1] or len(output[select[1]]) == 0:
+                return False, None
+            select = output[select[1]][0]
+
+        try:
+            index = int(select)
+        except (TypeError, ValueError):
+            return True, None
 
-        return (high_priority, low_priority)
+        if 1 <= index <= len(SWITCH_INPUTS):
+            return True, SWITCH_INPUTS[index-1]
+
+        return True, None
+
+    def get_linked_candidates(self, unique_id):
+        inputs = self.prompt[unique_id]['inputs']
+        return [x for x in ONEOF_INPUTS if isinstance(inputs.get(x), list)]
+
+    # None: all inputs are demanded
+    def get_demanded_inputs(self, unique_id):
+        kind = self.get_kind(unique_id)
+        if kind is None:
+            return None
+
+        self.visited.add(unique_id)
+        inputs = self.prompt[unique_id]['inputs']
+
+        if kind == "ExecutionSwitch":
+            resolved, name = self.get_selected_input(unique_id)
+            if not resolved:
+                self.waiting.setdefault(inputs['select'][0], set()).add(unique_id)
+                return ['select']
+
+            return ['select'] if name is None else ['select', name]
+        else:
+            index = self.candidates.setdefault(unique_id, 0)
+            return self.get_linked_candidates(unique_id)[:index+1]
+
+    def get_effective_inputs(self, unique_id, inputs):
+        demanded = self.get_demanded_inputs(unique_id)
+        if demanded is None:
+            return inputs
+
+        return {name: value for name, value in inputs.items() if not isinstance(value, list) or name in demanded}
+
+    def is_incomplete(self, unique_id, class_def, inputs):
+        if self.get_kind(unique_id) == "ExecutionSwitch":
+            resolved, _ = self.get_selected_input(unique_id)
+            if not resolved:
+                return True
+
+            # the required 'input1' may not be demanded
+            for input_data in self.get_effective_inputs(unique_id, inputs).values():
+                if isinstance(input_data, list):
+                    output = self.outputs.get(input_data[0])
+                    if output is None or len(output) == 0 or output[input_data[1]] == [None]:
+                        return True
+
+            return False
+
+        return is_incomplete_input_slots(class_def, self.get_effective_inputs(unique_id, inputs), self.outputs, self.metadata_cache)
+
+    def get_input_data(self, inputs, class_def, unique_id, prompt, extra_data):
+        input_data_all = get_input_data(self.get_effective_inputs(unique_id, inputs), class_def, unique_id, self.outputs, prompt, extra_data,
+                                        self.metadata_cache)
+        if input_data_all is not None and self.get_kind(unique_id) == "ExecutionSwitch":
+            for name in SWITCH_INPUTS:
+                if name in inputs and name not in input_data_all:
+                    input_data_all[name] = [None]
+
+        return input_data_all
+
+    # the ExecutionOneOf nodes which can demand their next input
+    def advance_candidates(self, executed):
+        advanced = []
+        for unique_id in sorted(self.visited):
+            if self.get_kind(unique_id) != "ExecutionOneOf" or unique_id in executed or unique_id not in self.demanded:
+                continue
+
+            candidates = self.get_linked_candidates(unique_id)
+            index = self.candidates.get(unique_id, 0)
+            if index + 1 < len(candidates):
+                self.candidates[unique_id] = index + 1
+                advanced.append((unique_id, self.prompt[unique_id]['inputs'][candidates[index+1]][0]))
+
+        return advanced
+
+
+def get_scheduling_rank(class_def):
+    if class_def.__name__ == "LoopControl":
+        return RANK_LOOP_CONTROL
+    elif class_def.RETURN_TYPES == ():
+        return RANK_OUTPUT
+    else:
+        return RANK_DEFAULT
+
+
+def get_scheduling_priorities(prompt, next_nodes, lookup_class_def):
+    ranks = {unique_id: get_scheduling_rank(lookup_class_def(unique_id)) for unique_id in prompt}
+    return get_priorities(prompt.keys(), next_nodes, ranks)
+
+
+def worklist_execute(server, prompt, outputs, extra_data, prompt_id, outputs_ui, to_execute, next_nodes, object_storage, class_defs=None, shared_refs=None,
+                     priorities=None, releasable=frozenset(), released=None, output_sizes=None, execution_order=None, lazy=None,
+                     metadata_cache=None):
+    def lookup_class_def(unique_id):
+        if class_defs is None:
+            return get_class_def(prompt, unique_id)
+        else:
+            return class_defs[unique_id]
+
+    if metadata_cache is None:
+        metadata_cache = {}
+
+    trace = tracing.get_trace()
+    queued_at = {}
+    node_hooks = profiling.get_node_hooks()
+
+    def is_incomplete(unique_id, class_def):
+        if lazy is None:
+            return is_incomplete_input_slots(class_def, prompt[unique_id]['inputs'], outputs, metadata_cache)
+        else:
+            return lazy.is_incomplete(unique_id, class_def, prompt[unique_id]['inputs'])
+
+    def get_node_input_data(unique_id, class_def):
+        if lazy is None:
+            return get_input_data(prompt[unique_id]['inputs'], class_def, unique_id, outputs, prompt, extra_data, metadata_cache)
+        else:
+            return lazy.get_input_data(prompt[unique_id]['inputs'], class_def, unique_id, prompt, extra_data)
+
+    to_execute = list(to_execute)
+    pending_nodes = set(to_execute)
+    if lazy is not None:
+        lazy.demanded = pending_nodes
+
+    if priorities is None:
+        priorities = get_scheduling_priorities(prompt, next_nodes, lookup_class_def)
+
+    # memory-first mode when output size estimates are given
+    if output_sizes is not None:
+        input_sources = {}
+
+        def inputs_of(unique_id):
+            sources = input_sources.get(unique_id)
+            if sources is None:
+                sources = input_sources[unique_id] = get_input_sources(prompt, unique_id)
+            return sources
+
+        worklist = MemoryWorklist(priorities, output_sizes, inputs_of, get_pending_consumers(to_execute, inputs_of))
+    else:
+        worklist = Worklist(priorities)
+
+    executed = set()
+
+    def add_work(item):
+        # the outputs of the output nodes are not erased
+        if priorities.get(item, (RANK_DEFAULT,))[0] != RANK_OUTPUT and item in outputs:
+            del outputs[item]
+
+        if trace is not None and item not in queued_at:
+            queued_at[item] = trace.now()
+
+        worklist.put(item)
+
+    def get_work():
+        return str(worklist.get())
 
     def get_progress():
-        total = len(executed)+len(will_execute.keys())
+        # the node being executed was already taken out of the worklist
+        total = len(executed) + worklist.pending() + 1
         return len(executed)/total
 
+    # liveness: the number of the pending consumer links of each releasable output
+    remaining_consumers = {}
+    if released is not None:
+        for unique_id in to_execute:
+            for input_data in prompt[unique_id]['inputs'].values():
+                if isinstance(input_data, list) and input_data[0] in releasable:
+                    remaining_consumers[input_data[0]] = remaining_consumers.get(input_data[0], 0) + 1
+
+    def release_dead_inputs(unique_id):
+        for input_data in prompt[unique_id]['inputs'].values():
+            if isinstance(input_data, list) and input_data[0] in remaining_consumers:
+                input_unique_id = input_data[0]
+                remaining_consumers[input_unique_id] -= 1
+                if remaining_consumers[input_unique_id] == 0 and input_unique_id in outputs:
+                    if trace is not None:
+                        trace.instant(f"release #{input_unique_id}", 'liveness')
+                    del outputs[input_unique_id]
+                    released.add(input_unique_id)
+                    liveness_stats['released'] += 1
+
     # init seeds: the nodes that have their output not erased in the input slot are the seeds.
-    for unique_id in to_execute:
-        inputs = prompt[unique_id]['inputs']
-        class_def = get_class_def(prompt, unique_id)
+    def seed(unique_ids):
+        for unique_id in unique_ids:
+            class_def = lookup_class_def(unique_id)
 
-        if unique_id in outputs:
-            continue
+            if unique_id in outputs:
+                continue
 
-        if is_incomplete_input_slots(class_def, inputs, outputs):
-            continue
+            if is_incomplete(unique_id, class_def):
+                continue
 
-        input_data_all = None
+            input_data_all = None
 
-        def task():
-            nonlocal input_data_all
-            input_data_all = get_input_data(inputs, class_def, unique_id, outputs, prompt, extra_data)
+            def task():
+                nonlocal input_data_all
+                input_data_all = get_node_input_data(unique_id, class_def)
+
+                if input_data_all is None:
+                    return
+
+                if not is_incomplete(unique_id, class_def):
+                    add_work(unique_id)  # add to seed if all input is properly provided
+
+            result = exception_helper(unique_id, input_data_all, executed, outputs, task)
 
             if input_data_all is None:
-                return
+                continue
 
-            if not is_incomplete_input_slots(class_def, prompt[unique_id]['inputs'], outputs):
-                add_work(unique_id)  # add to seed if all input is properly provided
+            if result is not None:
+                return result  # error state
 
-        result = exception_helper(unique_id, input_data_all, executed, outputs, task)
+        return None
+
+    result = seed(to_execute)
+    if result is not None:
+        return result  # error state
+
+    # add the upstream nodes of a newly demanded input of a control node
+    def demand(source_id):
+        new_nodes = [x for x in worklist_will_execute(prompt, outputs, [source_id], lazy) if x not in pending_nodes]
+        if trace is not None:
+            trace.instant(f"demand #{source_id}", 'lazy', {'nodes': new_nodes})
+
+        to_execute.extend(new_nodes)
+        pending_nodes.update(new_nodes)
+        for unique_id in new_nodes:
+            for input_data in prompt[unique_id]['inputs'].values():
+                if isinstance(input_data, list) and input_data[0] in releasable:
+                    remaining_consumers[input_data[0]] = remaining_consumers.get(input_data[0], 0) + 1
+
+        return seed(new_nodes)
+
+    def notify_executing(unique_id):
+        if server.client_id is not None:
+            server.last_node_id = unique_id
+            server.send_sync("executing", {"node": unique_id, "prompt_id": prompt_id, "progress": get_progress()},
+                             server.client_id)
+
+    # start, inputs_done, end: time.perf_counter()
+    def trace_node(unique_id, class_type, start, inputs_done, end, shared_key, shared, output_data, parallel=False):
+        queued = queued_at.pop(unique_id, None)
+        sizes = cache_budget.get_output_size(output_data)
+        trace.span(f"{class_type} #{unique_id}", 'node', trace.to_us(start), (end - start) * 1e6, {
+            'node': unique_id,
+            'class_type': class_type,
+            'queue_wait_ms': (trace.to_us(start) - queued) / 1e3 if queued is not None else None,
+            'input_ms': (inputs_done - start) * 1e3,
+            'exec_ms': (end - inputs_done) * 1e3,
+            'cache': 'none' if shared_key is None else ('hit' if shared is not None else 'miss'),
+            'output_bytes': sizes['cpu'] + sizes['device'],
+            'parallel': parallel,
+        })
+
+    # returns (shared_key, shared output) if the output can be taken from the shared cache
+    def acquire_shared(class_type, class_def, input_data_all, is_changed):
+        if shared_refs is not None and input_data_all is not None and shared_cache.is_shareable(class_def, class_type):
+            shared_key = shared_cache.get_key(class_type, input_data_all, is_changed)
+            return shared_key, shared_cache.acquire(shared_key)
+
+        return None, None
+
+    def get_node_object(unique_id, class_type, class_def):
+        obj = object_storage.get((unique_id, class_type), None)
+        if obj is None:
+            obj = class_def()
+            object_storage[(unique_id, class_type)] = obj
+
+        return obj
+
+    def commit(unique_id, input_data_all, output_data, output_ui, shared_key, computed):
+        if computed and shared_key is not None and not shared_cache.publish(shared_key, output_data, output_ui, input_data_all):
+            shared_key = None
+
+        if shared_refs is not None:
+            old_key = shared_refs.pop(unique_id, None)
+            if old_key is not None:
+                shared_cache.release(old_key)
+
+            if shared_key is not None:
+                shared_refs[unique_id] = shared_key
+
+        outputs[unique_id] = output_data
+        if len(output_ui) > 0:
+            outputs_ui[unique_id] = output_ui
+            if server.client_id is not None:
+                server.send_sync("executed", {"node": unique_id, "output": output_ui, "prompt_id": prompt_id},
+                                 server.client_id)
+        executed.add(unique_id)
+
+        if output_sizes is not None:
+            sizes = cache_budget.get_output_size(output_data)
+            output_sizes[unique_id] = sizes['cpu'] + sizes['device']
+            worklist.done(unique_id)
+
+        if execution_order is not None:
+            execution_order.append(unique_id)
+
+        if released is not None:
+            released.discard(unique_id)
+            release_dead_inputs(unique_id)
+
+    def schedule_next_nodes(unique_id, class_def):
+        # the switches waiting for this node can demand the selected input now
+        if lazy is not None:
+            for switch_id in sorted(lazy.waiting.pop(unique_id, ())):
+                _, name = lazy.get_selected_input(switch_id)
+                selected = prompt[switch_id]['inputs'].get(name)
+                if isinstance(selected, list):
+                    result = demand(selected[0])
+                    if result is not None:
+                        return result  # error state
+
+        if unique_id in next_nodes:
+            if class_def.__name__ == "LoopControl" and outputs[unique_id] == [[None]]:
+                return None
+
+            for next_node in sorted(next_nodes[unique_id]):
+                if next_node in pending_nodes:
+                    # If all input slots are not completed, do not add to the work.
+                    # This prevents duplicate entries of the same work in the worklist.
+                    # For loop support, it is important to fire only once when the input slot is completed.
+                    next_class_def = lookup_class_def(next_node)
+                    if not is_incomplete(next_node, next_class_def):
+                        add_work(next_node)
+
+        return None
+
+    # The longest prefix of the worklist which consists of independent parallel-safe nodes.
+    # Running the prefix concurrently and committing it in the worklist order gives the same result as the serial execution.
+    def get_parallel_batch():
+        batch = []
+        blocked = set()
+
+        for unique_id in worklist.peek(PARALLEL_WORKERS):
+            unique_id = str(unique_id)
+            if unique_id in blocked or unique_id in batch:
+                break
+
+            if not is_parallel_safe(lookup_class_def(unique_id), get_class_type(prompt, unique_id)):
+                break
+
+            inputs = prompt[unique_id]['inputs']
+            if any(isinstance(input_data, list) and input_data[0] in blocked for input_data in inputs.values()):
+                break
+
+            batch.append(unique_id)
+            blocked.update(next_nodes.get(unique_id, []))
+
+        return batch
+
+    def execute_batch(batch):
+        works = []
+
+        def release_uncommitted():
+            for work in works:
+                if work['shared_key'] is not None and work['unique_id'] not in executed:
+                    shared_cache.release(work['shared_key'])
+
+        # The nodes of a batch are started in the dispatch order, so they are ended in the reverse order to keep the ranges nested.
+        def end_profiling(works):
+            if node_hooks is not None:
+                for x in reversed(works):
+                    profiling.node_end(node_hooks, x['unique_id'], x['class_type'], x['profiling_start'], x['failed'])
+
+        for _ in batch:
+            unique_id = get_work()
+            class_type = get_class_type(prompt, unique_id)
+            class_def = lookup_class_def(unique_id)
+            work = {'unique_id': unique_id, 'class_type': class_type, 'class_def': class_def, 'input_data_all': None, 'shared_key': None, 'shared': None,
+                    'future': None, 'start': time.perf_counter(), 'inputs_done': None, 'failed': True}
+
+            def task():
+                work['input_data_all'] = get_node_input_data(unique_id, class_def)
+                work['inputs_done'] = time.perf_counter()
+                notify_executing(unique_id)
+                work['shared_key'], work['shared'] = acquire_shared(class_type, class_def, work['input_data_all'], prompt[unique_id].get('is_changed'))
+
+                if work['shared'] is None:
+                    obj = get_node_object(unique_id, class_type, class_def)
+                    work['future'] = get_parallel_pool().submit(get_output_data_in_worker, obj, work['input_data_all'])
+
+            works.append(work)
+            if node_hooks is not None:
+                work['profiling_start'] = profiling.node_start(node_hooks, unique_id, class_type)
+
+            result = exception_helper(unique_id, work['input_data_all'], executed, outputs, task)
+            if result is not None:
+                end_profiling(works)
+                wait([x['future'] for x in works if x['future'] is not None])
+                release_uncommitted()
+                return result  # error state
+
+        if trace is not None:
+            trace.instant("parallel batch", 'parallel', {'nodes': batch})
+        wait([x['future'] for x in works if x['future'] is not None])
+        end = time.perf_counter()
+
+        for work in works:
+            unique_id = work['unique_id']
+
+            def task():
+                if work['shared'] is not None:
+                    output_data, output_ui = work['shared']
+                    commit(unique_id, work['input_data_all'], output_data, output_ui, work['shared_key'], False)
+                else:
+                    output_data, output_ui = work['future'].result()
+                    commit(unique_id, work['input_data_all'], output_data, output_ui, work['shared_key'], True)
+
+                if trace is not None:
+                    trace_node(unique_id, work['class_type'], work['start'], work['inputs_done'], end, work['shared_key'], work['shared'], output_data, True)
+
+            result = exception_helper(unique_id, work['input_data_all'], executed, outputs, task)
+            work['failed'] = result is not None
+
+            if result is None:
+                result = schedule_next_nodes(unique_id, work['class_def'])
+
+            if result is not None:
+                end_profiling(works)
+                release_uncommitted()
+                return result  # error state
+
+        end_profiling(works)
+        return None
+
+    while True:
+        if worklist.empty():
+            # the demanded input of an ExecutionOneOf didn't provide a value: demand the next one
+            if lazy is None:
+                break
+
+            advanced = lazy.advance_candidates(executed)
+            if len(advanced) == 0:
+                break
+
+            for oneof_id, source_id in advanced:
+                result = demand(source_id)
+                if result is not None:
+                    return result  # error state
+
+                if oneof_id not in worklist.queued and not is_incomplete(oneof_id, lookup_class_def(oneof_id)):
+                    add_work(oneof_id)
 
-        if input_data_all is None:
             continue
 
-        if result is not None:
-            return result  # error state
+        if PARALLEL_EXECUTION:
+            batch = get_parallel_batch()
+            if len(batch) > 1:
+                result = execute_batch(batch)
+                if result is not None:
+                    return result  # error state
+                continue
 
-    while not worklist.empty():
         unique_id = get_work()
 
-        inputs = prompt[unique_id]['inputs']
         class_type = get_class_type(prompt, unique_id)
-        class_def = get_class_def(prompt, unique_id)
-
-        print_dbg(lambda: f"work: {unique_id} ({class_def.__name__}) / worklist: {list(worklist.queue)}")
+        class_def = lookup_class_def(unique_id)
 
         input_data_all = None
 
         def task():
             nonlocal input_data_all
-            input_data_all = get_input_data(inputs, class_def, unique_id, outputs, prompt, extra_data)
-
-            if server.client_id is not None:
-                server.last_node_id = unique_id
-                server.send_sync("executing", {"node": unique_id, "prompt_id": prompt_id, "progress": get_progress()},
-                                 server.client_id)
+            start = time.perf_counter()
+            input_data_all = get_node_input_data(unique_id, class_def)
+            inputs_done = time.perf_counter()
+            notify_executing(unique_id)
+
+            shared_key, shared = acquire_shared(class_type, class_def, input_data_all, prompt[unique_id].get('is_changed'))
+            if shared is not None:
+                output_data, output_ui = shared
+            else:
+                obj = get_node_object(unique_id, class_type, class_def)
+                output_data, output_ui = get_output_data(obj, input_data_all)
 
-            obj = object_storage.get((unique_id, class_type), None)
-            if obj is None:
-                obj = class_def()
-                object_storage[(unique_id, class_type)] = obj
+            commit(unique_id, input_data_all, output_data, output_ui, shared_key, shared is None)
 
-            output_data, output_ui = get_output_data(obj, input_data_all)
+            if trace is not None:
+                trace_node(unique_id, class_type, start, inputs_done, time.perf_counter(), shared_key, shared, output_data)
 
-            outputs[unique_id] = output_data
-            if len(output_ui) > 0:
-                outputs_ui[unique_id] = output_ui
-                if server.client_id is not None:
-                    server.send_sync("executed", {"node": unique_id, "output": output_ui, "prompt_id": prompt_id},
-                                     server.client_id)
-            executed.add(unique_id)
+        if node_hooks is not None:
+            profiling_start = profiling.node_start(node_hooks, unique_id, class_type)
 
         result = exception_helper(unique_id, input_data_all, executed, outputs, task)
-        if result is not None:
-            return result  # error state
-        else:
-            if unique_id in next_nodes:
-                if class_def.__name__ == "LoopControl" and outputs[unique_id] == [[None]]:
-                    continue
-
-                candidates = []
-                for next_node in next_nodes[unique_id]:
-                    if next_node in to_execute:
-                        # If all input slots are not completed, do not add to the work.
-                        # This prevents duplicate entries of the same work in the worklist.
-                        # For loop support, it is important to fire only once when the input slot is completed.
-                        next_class_def = get_class_def(prompt, next_node)
-                        if not is_incomplete_input_slots(next_class_def, prompt[next_node]['inputs'], outputs):
-                            candidates.append((next_node, next_class_def))
-
-                high_priority_works, low_priority_works = apply_priority(candidates)
+        if node_hooks is not None:
+            profiling.node_end(node_hooks, unique_id, class_type, profiling_start, result is not None)
 
-                for next_node in high_priority_works:
-                    add_work_high(next_node)
+        if result is None:
+            result = schedule_next_nodes(unique_id, class_def)
 
-                for next_node in low_priority_works:
-                    add_work(next_node)
+        if result is not None:
+            return result  # error state
 
     return executed, True, None, None
 
 
-def worklist_will_execute(prompt, outputs, worklist):
+def worklist_will_execute(prompt, outputs, worklist, lazy=None):
     visited = set()
 
     will_execute = []
@@ -426,6 +1304,9 @@ def worklist_will_execute(prompt, outputs, worklist):
         if unique_id in outputs:
             continue
 
+        if lazy is not None:
+            inputs = lazy.get_effective_inputs(unique_id, inputs)
+
         for x in inputs:
             input_data = inputs[x]
             if isinstance(input_data, list):
@@ -439,10 +1320,54 @@ def worklist_will_execute(prompt, outputs, worklist):
     return will_execute
 
 
-def worklist_output_delete_if_changed(prompt, old_prompt, outputs, next_nodes, muted_nodes, extra_data, object_storage):
-    worklist = []
-    deleted = set()
+# 'released' is the set of the outputs which were dropped by the liveness analysis. They are treated as cached.
+# Nodes which the requested outputs don't depend on aren't checked. Their outputs are checked when they are requested.
+is_changed_stats = {'calls': 0, 'cached': 0, 'skipped': 0}
 
+
+def get_required_nodes(prompt, execute_outputs):
+    required = set()
+    worklist = [x for x in execute_outputs if x in prompt]
+    while worklist:
+        unique_id = worklist.pop()
+        if unique_id in required:
+            continue
+
+        required.add(unique_id)
+        worklist.extend(x for x in get_input_sources(prompt, unique_id) if x in prompt and x not in required)
+
+    return required
+
+
+# is_changed_cache: (class_type, unique_id, identity fingerprint of the inputs) -> [IS_CHANGED result, inputs]
+# The inputs are compared by identity, like the shared cache does. (see shared_cache.get_key)
+# They are kept in the entry, so the ids in the fingerprint can't be reused while the entry exists.
+def get_is_changed(obj, class_type, unique_id, input_data_all, is_changed_cache=None):
+    if is_changed_cache is None:
+        is_changed_stats['calls'] += 1
+        return map_node_over_list(obj, input_data_all, "IS_CHANGED")
+
+    key = class_type, unique_id, fingerprint(input_data_all, 'identity')
+    entry = is_changed_cache.get(key)
+    if entry is not None:
+        is_changed_stats['cached'] += 1
+        return entry[0]
+
+    is_changed_stats['calls'] += 1
+    is_changed = map_node_over_list(obj, input_data_all, "IS_CHANGED")
+    is_changed_cache[key] = [is_changed, input_data_all]
+    return is_changed
+
+
+# Outputs are invalidated by the node keys. (see node_keys.py)
+# A node whose key changed gets the output of the new key back from the key history, if there is one.
+# A released node with an unchanged key stays released, so it is treated as cached.
+# key_pins: unique_id -> the component input values of the run which set its key.
+#           The key of an input value can be its id, so the values are kept alive while the key (or its history entry) exists.
+# input_values: the component input values of this run
+def worklist_output_delete_if_changed(prompt, node_keys, key_history, outputs, outputs_ui, muted_nodes, extra_data, object_storage, class_defs=None,
+                                      released=None, metadata_cache=None, required_nodes=None, is_changed_cache=None, input_keys={},
+                                      key_pins=None, input_values=None):
     def has_muted_input(inputs):
         for item in inputs.values():
             if isinstance(item, list):
@@ -451,81 +1376,92 @@ def worklist_output_delete_if_changed(prompt, old_prompt, outputs, next_nodes, m
 
         return False
 
-    # init seeds
-    for unique_id, value in prompt.items():
-        inputs = value['inputs']
+    def get_class(unique_id):
+        value = prompt[unique_id]
         if 'class_type' not in value:
-            class_type = 'DummyNode'  # HOTFIX: todo
-            class_def = DummyNode
-        else:
-            class_type = value['class_type']
-            class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
+            return 'DummyNode', DummyNode  # HOTFIX: todo
+
+        class_type = value['class_type']
+        return class_type, nodes.NODE_CLASS_MAPPINGS[class_type] if class_defs is None else class_defs[unique_id]
 
-        is_changed_old = ''
-        is_changed = ''
-        to_delete = False
+    def evaluate_is_changed(unique_id):
+        value = prompt[unique_id]
+        class_type, class_def = get_class(unique_id)
 
         obj = object_storage.get((unique_id, class_type), None)
         if obj is None:
             obj = class_def()
             object_storage[(unique_id, class_type)] = obj
 
-        if hasattr(class_def, 'IS_CHANGED'):
-            if unique_id in old_prompt and 'is_changed' in old_prompt[unique_id]:
-                is_changed_old = old_prompt[unique_id]['is_changed']
-            if 'is_changed' not in value:
-                input_data_all = get_input_data(inputs, class_def, unique_id, outputs, prompt=prompt, extra_data=extra_data)
-                if input_data_all is not None:
-                    try:
-                        is_changed = map_node_over_list(obj, input_data_all, "IS_CHANGED")
-                        value['is_changed'] = is_changed
-                    except:
-                        to_delete = True
-            else:
-                is_changed = value['is_changed']
+        if not hasattr(class_def, 'IS_CHANGED'):
+            return ''
 
-        if unique_id not in outputs:
-            to_delete = True
-        else:
-            if not to_delete:
-                if is_changed != is_changed_old:
-                    to_delete = True
-                elif unique_id in muted_nodes or (unique_id in old_prompt and has_muted_input(old_prompt[unique_id]['inputs'])):
-                    continue
-                elif unique_id not in old_prompt:
-                    to_delete = True
-                elif inputs == old_prompt[unique_id]['inputs']:
-                    for x in inputs:
-                        input_data = inputs[x]
-
-                        if isinstance(input_data, list):
-                            input_unique_id = input_data[0]
-
-                            if input_unique_id not in outputs:
-                                to_delete = True
-                                break
-                else:
-                    to_delete = True
+        if 'is_changed' in value:
+            return value['is_changed']
 
-        if to_delete:
-            worklist.append(unique_id)
+        input_data_all = get_input_data(value['inputs'], class_def, unique_id, outputs, prompt=prompt, extra_data=extra_data, metadata_cache=metadata_cache)
+        if input_data_all is None:
+            return ''
 
-    # cascade removing
-    while worklist:
-        unique_id = worklist.pop()
+        trace = tracing.get_trace()
+        start = time.perf_counter()
+        try:
+            is_changed = get_is_changed(obj, class_type, unique_id, input_data_all, is_changed_cache)
+            value['is_changed'] = is_changed
+            return is_changed
+        except:
+            return float('nan')
+        finally:
+            if trace is not None:
+                trace.span(f"IS_CHANGED {class_type} #{unique_id}", 'is_changed', trace.to_us(start), (time.perf_counter() - start) * 1e6, {'node': unique_id})
+
+    if required_nodes is None:
+        required_nodes = prompt.keys()
+    else:
+        is_changed_stats['skipped'] += len(prompt) - len(required_nodes)
+
+    if released is None:
+        released = set()
+
+    if key_pins is None:
+        key_pins = {}
+
+    keys = {}
+    for unique_id, key in node_keys_module.iter_node_keys(prompt, required_nodes, evaluate_is_changed, input_keys):
+        keys[unique_id] = key
+
+        if unique_id in input_keys and unique_id in outputs:
+            node_keys[unique_id] = key
+            continue
+
+        if unique_id in muted_nodes or has_muted_input(prompt[unique_id]['inputs']):
+            continue
 
-        if unique_id in deleted:
+        old_key = node_keys.get(unique_id)
+        if old_key == key and (unique_id in outputs or unique_id in released):
             continue
 
         if unique_id in outputs:
+            class_type, class_def = get_class(unique_id)
             d = outputs.pop(unique_id)
+            if old_key is not None and shared_cache.is_reusable(class_def, class_type):
+                node_keys_module.stash(key_history, unique_id, old_key, d, outputs_ui.get(unique_id, {}), key_pins.get(unique_id))
             del d
 
-        new_works = next_nodes.get(unique_id, [])
-        worklist.extend(new_works)
-        deleted.add(unique_id)
+        outputs_ui.pop(unique_id, None)
+        released.discard(unique_id)
+        node_keys.pop(unique_id, None)
+        key_pins.pop(unique_id, None)
 
-    return outputs
+        entry = node_keys_module.restore(key_history, unique_id, key)
+        if entry is not None:
+            outputs[unique_id] = entry[0]
+            if len(entry[1]) > 0:
+                outputs_ui[unique_id] = entry[1]
+            node_keys[unique_id] = key
+            key_pins[unique_id] = input_values
+
+    return keys
 
 
 class ExpPromptExecutor:
@@ -533,9 +1469,27 @@ class ExpPromptExecutor:
         self.outputs = {}
         self.object_storage = {}
         self.outputs_ui = {}
-        self.old_prompt = {}
+        self.node_keys = {}
+        self.key_pins = {}
+        self.key_history = {}
         self.server = server
         self.prev_muted_nodes = set()
+        self.shared_refs = {}
+        self.released = set()
+        self.memory_report = None
+
+    # release the references of the shared cache entries that are no longer held in outputs
+    def sync_shared_refs(self):
+        for unique_id, key in list(self.shared_refs.items()):
+            if unique_id not in self.outputs or not shared_cache.is_held(key, self.outputs[unique_id]):
+                del self.shared_refs[unique_id]
+                shared_cache.release(key)
+
+    def release_shared_refs(self):
+        for key in self.shared_refs.values():
+            shared_cache.release(key)
+
+        self.shared_refs = {}
 
     def handle_execution_error(self, prompt_id, prompt, current_outputs, executed, error, ex):
         node_id = error["node_id"]
@@ -575,9 +1529,8 @@ class ExpPromptExecutor:
         for o in self.outputs:
             if (o not in current_outputs) and (o not in executed):
                 to_delete += [o]
-                if o in self.old_prompt:
-                    d = self.old_prompt.pop(o)
-                    del d
+                self.node_keys.pop(o, None)
+                self.key_pins.pop(o, None)
         for o in to_delete:
             d = self.outputs.pop(o)
             del d
@@ -594,11 +1547,26 @@ class ExpPromptExecutor:
             d = self.object_storage.pop(o)
             del d
 
-    def execute(self, prompt, prompt_id, extra_data={}, execute_outputs=[]):
+    # Estimated from the output size estimates. Only the releasable outputs are freed after their last consumer, as the executor does.
+    def report_memory_schedule(self, prompt, execution_order, output_sizes, releasable):
+        def inputs_of(unique_id):
+            return get_input_sources(prompt, unique_id)
+
+        peak = simulate_peak(execution_order, inputs_of, output_sizes, releasable)
+        fifo_peak = simulate_peak(get_fifo_order(execution_order, inputs_of), inputs_of, output_sizes, releasable)
+        self.memory_report = {'estimated_peak': peak, 'estimated_fifo_peak': fifo_peak}
+        if PRINT_MEMORY_SCHEDULE:
+            print(f"[Workflow-Component] memory-first schedule: estimated peak {peak / 1024**2:.1f} MB (FIFO {fifo_peak / 1024**2:.1f} MB)")
+
+    def execute(self, prompt, prompt_id, extra_data={}, execute_outputs=[], plan=None, given_inputs=(), volatile_inputs=(), schedule_mode='default',
+                is_changed_cache=None, input_keys={}):
         nodes.interrupt_processing(False)
 
-        if 'extra_pnginfo' in extra_data:
-            muted_nodes = set([str(node['id']) for node in extra_data['extra_pnginfo']['workflow']['nodes']]) - set(prompt.keys())
+        if plan is not None:
+            muted_nodes = plan.muted_nodes
+            unmuted_nodes = self.prev_muted_nodes - muted_nodes
+        elif 'extra_pnginfo' in extra_data:
+            muted_nodes = get_node_index(extra_data['extra_pnginfo']).get_muted_nodes(prompt)
             unmuted_nodes = self.prev_muted_nodes - muted_nodes
         else:
             muted_nodes = set()
@@ -623,10 +1591,41 @@ class ExpPromptExecutor:
                 d = self.outputs.pop(o)
                 del d
 
-            next_nodes = get_next_nodes_map(prompt)
-            worklist_output_delete_if_changed(prompt, self.old_prompt, self.outputs, next_nodes, muted_nodes, extra_data, self.object_storage)
+            self.released = {x for x in self.released if x in prompt and x not in unmuted_nodes}
+            self.node_keys = {x: key for x, key in self.node_keys.items() if x in prompt and x not in unmuted_nodes}
+            self.key_pins = {x: pins for x, pins in self.key_pins.items() if x in self.node_keys}
+            self.key_history = {x: history for x, history in self.key_history.items() if x in prompt}
+
+            if plan is not None:
+                next_nodes = plan.get_next_nodes(given_inputs)
+                class_defs = plan.class_defs
+                priorities = plan.priorities
+                releasable = plan.get_releasable(volatile_inputs) if ENABLE_LIVENESS and len(volatile_inputs) > 0 else frozenset()
+                output_sizes = plan.output_sizes if schedule_mode == 'memory' else None
+                plan.seed_constants(self.outputs, self.outputs_ui, self.node_keys, muted_nodes)
+            else:
+                next_nodes = get_next_nodes_map(prompt)
+                class_defs = None
+                priorities = None
+                releasable = frozenset()
+                output_sizes = None
+
+            trace = tracing.get_trace()
+            invalidation_start = time.perf_counter()
+
+            metadata_cache = {}
+            required_nodes = get_required_nodes(prompt, execute_outputs) if len(execute_outputs) > 0 else None
+            input_values = {x: self.outputs[x] for x in input_keys if x in self.outputs}
+            keys = worklist_output_delete_if_changed(prompt, self.node_keys, self.key_history, self.outputs, self.outputs_ui, muted_nodes, extra_data,
+                                                     self.object_storage, class_defs, self.released, metadata_cache, required_nodes, is_changed_cache,
+                                                     input_keys, self.key_pins, input_values)
 
             current_outputs = set(self.outputs.keys())
+            cached_nodes = sum(1 for x in keys if x in current_outputs or x in self.released)
+            if trace is not None:
+                trace.span("invalidate", 'executor', trace.to_us(invalidation_start), (time.perf_counter() - invalidation_start) * 1e6,
+                           {'cached': len(current_outputs), 'checked': len(keys)})
+
             for x in list(self.outputs_ui.keys()):
                 if x not in current_outputs:
                     d = self.outputs_ui.pop(x)
@@ -636,18 +1635,64 @@ class ExpPromptExecutor:
                 self.server.send_sync("execution_cached", {"nodes": list(current_outputs), "prompt_id": prompt_id},
                                       self.server.client_id)
 
-            to_execute = worklist_will_execute(prompt, self.outputs, execute_outputs)
+            if ENABLE_LAZY_CONTROL:
+                lazy = LazyControl(prompt, self.outputs, (lambda x: class_defs[x]) if class_defs is not None else (lambda x: get_class_def(prompt, x)),
+                                   metadata_cache)
+            else:
+                lazy = None
+
+            to_execute = worklist_will_execute(prompt, self.outputs, list(execute_outputs), lazy)
+
+            # the nodes which would be executed without the lazy control nodes
+            if lazy is not None and len(lazy.visited) > 0:
+                eager_to_execute = worklist_will_execute(prompt, self.outputs, list(execute_outputs))
+            else:
+                eager_to_execute = []
+
+            execution_order = [] if output_sizes is not None else None
+            execution_start = time.perf_counter()
 
             # This call shouldn't raise anything if there's an error deep in
             # the actual SD code, instead it will report the node where the
             # error was raised
             executed, success, error, ex = worklist_execute(self.server, prompt, self.outputs, extra_data, prompt_id,
-                                                            self.outputs_ui, to_execute, next_nodes, self.object_storage)
+                                                            self.outputs_ui, to_execute, next_nodes, self.object_storage, class_defs,
+                                                            self.shared_refs, priorities, releasable, self.released,
+                                                            output_sizes, execution_order, lazy, metadata_cache)
+            metrics.observe_node_cache(cached_nodes, len(executed))
+            if trace is not None:
+                trace.span("execute", 'executor', trace.to_us(execution_start), (time.perf_counter() - execution_start) * 1e6,
+                           {'executed': len(executed), 'success': success is True})
             if success is not True:
                 self.handle_execution_error(prompt_id, prompt, current_outputs, executed, error, ex)
+            else:
+                if execution_order:
+                    self.report_memory_schedule(prompt, execution_order, output_sizes, releasable)
+
+                # pruned nodes are treated as cached, so the control nodes which skipped them stay cached
+                pruned = [x for x in eager_to_execute if x not in lazy.demanded and x not in self.outputs]
+                if len(pruned) > 0:
+                    lazy_stats['pruned'] += len(pruned)
+                    self.released.update(pruned)
+                    for x in pruned:
+                        if x in keys:
+                            self.node_keys[x] = keys[x]
+                            self.key_pins[x] = input_values
+                    if trace is not None:
+                        trace.instant("pruned", 'lazy', {'nodes': pruned})
+
+            self.sync_shared_refs()
+
+            if plan is not None:
+                plan.store_constants(executed, self.outputs, self.outputs_ui, keys)
 
             for x in executed:
-                self.old_prompt[x] = copy.deepcopy(prompt[x])
+                if x in keys:
+                    self.node_keys[x] = keys[x]
+                    self.key_pins[x] = input_values
+                else:
+                    self.node_keys.pop(x, None)
+                    self.key_pins.pop(x, None)
             self.server.last_node_id = None
             if self.server.client_id is not None:
                 self.server.send_sync("executing", {"node": None, "prompt_id": prompt_id}, self.server.client_id)
@@ -655,8 +1700,8 @@ class ExpPromptExecutor:
         self.prev_muted_nodes = muted_nodes
 
         print("Prompt executed in {:.2f} seconds".format(time.perf_counter() - execution_start_time))
-        gc.collect()
-        comfy.model_management.soft_empty_cache()
+
+        reclaim.after_execution()
 
 
 def validate_prompt(prompt):
@@ -0,0 +1,53 @@
+import torch
+
+
+# How a tensor is identified.
+#   'storage': data pointer + version counter + shape/stride/dtype/device. It doesn't read the content.
+#              In-place modifications are detected through the version counter.
+#   'identity': the tensor object itself. The caller must keep the tensor alive together with the fingerprint.
+# Inference tensors don't track the version counter, so they always use 'identity'.
+# The content is never sampled: two tensors which agree on a sample would compare equal.
+TENSOR_FINGERPRINT_MODE = 'storage'
+
+fingerprinters = []
+
+
+# func(value) -> hashable and comparable fingerprint
+# Later registrations take precedence.
+def register_fingerprint(value_type, func):
+    fingerprinters.insert(0, (value_type, func))
+
+
+def tensor_fingerprint(tensor, mode=None):
+    if mode is None:
+        mode = TENSOR_FINGERPRINT_MODE
+
+    try:
+        if mode == 'storage' and not tensor.is_inference():
+            return 'tensor', tensor.data_ptr(), tensor._version, tuple(tensor.shape), tuple(tensor.stride()), str(tensor.dtype), str(tensor.device)
+    except Exception:
+        pass
+
+    return 'tensor-id', id(tensor), tuple(tensor.shape), str(tensor.dtype)
+
+
+def fingerprint(value, tensor_mode=None):
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return value
+
+    for value_type, func in fingerprinters:
+        if isinstance(value, value_type):
+            return func(value)
+
+    if isinstance(value, torch.Tensor):
+        return tensor_fingerprint(value, tensor_mode)
+
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__, tuple(fingerprint(x, tensor_mode) for x in value)
+
+    if isinstance(value, dict):
+        return 'dict', tuple((key, fingerprint(x, tensor_mode)) for key, x in value.items())
+
+    # Objects like MODEL, CLIP, VAE are compared by identity.
+    # The caller keeps the value alive together with its fingerprint, so the id can't be reused meanwhile.
+    return 'id', type(value).__name__, id(value)
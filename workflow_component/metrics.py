@@ -0,0 +1,141 @@
+import threading
+
+
+# Execution metrics, served in the Prometheus text format on /component/metrics. (see custom_server.py)
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+        self.sum += value
+        self.count += 1
+
+
+# component name -> count / Histogram
+component_invocations = {}
+component_errors = {}
+component_latency = {}
+
+# inner nodes on the requested output path: hit = taken from the executor cache, miss = executed
+node_cache = {'hit': 0, 'miss': 0}
+
+# memory reclamation at the end of the component executions
+reclaim = {'gc_seconds': 0.0, 'gc_count': 0, 'empty_cache_seconds': 0.0, 'empty_cache_count': 0}
+
+refiner_latency = Histogram()
+
+
+def observe_component(component_name, seconds, error=False):
+    with lock:
+        component_invocations[component_name] = component_invocations.get(component_name, 0) + 1
+        if error:
+            component_errors[component_name] = component_errors.get(component_name, 0) + 1
+
+        histogram = component_latency.get(component_name)
+        if histogram is None:
+            histogram = component_latency[component_name] = Histogram()
+
+        histogram.observe(seconds)
+
+
+def observe_node_cache(hits, misses):
+    with lock:
+        node_cache['hit'] += hits
+        node_cache['miss'] += misses
+
+
+def observe_gc(seconds):
+    with lock:
+        reclaim['gc_seconds'] += seconds
+        reclaim['gc_count'] += 1
+
+
+def observe_empty_cache(seconds):
+    with lock:
+        reclaim['empty_cache_seconds'] += seconds
+        reclaim['empty_cache_count'] += 1
+
+
+def observe_refiner(seconds):
+    with lock:
+        refiner_latency.observe(seconds)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + '}'
+
+
+def format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def write_metric(lines, name, kind, help_text, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{format_labels(labels)} {format_number(value)}")
+
+
+def write_histogram(lines, name, help_text, histograms):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in histograms:
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f"{name}_bucket{format_labels({**labels, 'le': format_number(bound)})} {count}")
+
+        lines.append(f"{name}_bucket{format_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+        lines.append(f"{name}_sum{format_labels(labels)} {format_number(histogram.sum)}")
+        lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+
+# extra: [(name, kind, help, [(labels, value)])], the values which are read from the other modules at scrape time
+def render(extra=()):
+    lines = []
+    with lock:
+        write_metric(lines, "workflow_component_invocations_total", "counter", "Component invocations.",
+                     [({'component': name}, count) for name, count in sorted(component_invocations.items())])
+        write_metric(lines, "workflow_component_errors_total", "counter", "Component invocations which failed.",
+                     [({'component': name}, count) for name, count in sorted(component_errors.items())])
+        write_histogram(lines, "workflow_component_latency_seconds", "Latency of the component invocations.",
+                        [({'component': name}, histogram) for name, histogram in sorted(component_latency.items())])
+
+        total = node_cache['hit'] + node_cache['miss']
+        write_metric(lines, "workflow_component_node_cache_total", "counter", "Inner nodes on the requested output path, by cache result.",
+                     [({'result': 'hit'}, node_cache['hit']), ({'result': 'miss'}, node_cache['miss'])])
+        write_metric(lines, "workflow_component_node_cache_hit_ratio", "gauge", "Ratio of the inner nodes taken from the cache.",
+                     [({}, node_cache['hit'] / total if total > 0 else 0.0)])
+
+        write_metric(lines, "workflow_component_gc_seconds_total", "counter", "Time spent in gc.collect.", [({}, reclaim['gc_seconds'])])
+        write_metric(lines, "workflow_component_gc_total", "counter", "gc.collect calls.", [({}, reclaim['gc_count'])])
+        write_metric(lines, "workflow_component_empty_cache_seconds_total", "counter", "Time spent in soft_empty_cache.",
+                     [({}, reclaim['empty_cache_seconds'])])
+        write_metric(lines, "workflow_component_empty_cache_total", "counter", "soft_empty_cache calls.", [({}, reclaim['empty_cache_count'])])
+
+        write_histogram(lines, "workflow_component_refiner_generate_seconds", "Latency of the image refiner generation.", [({}, refiner_latency)])
+
+    for name, kind, help_text, samples in extra:
+        write_metric(lines, name, kind, help_text, samples)
+
+    return '\n'.join(lines) + '\n'
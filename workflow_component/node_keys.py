@@ -0,0 +1,108 @@
+import hashlib
+import itertools
+from collections import OrderedDict
+
+from workflow_component.fingerprint import fingerprint
+from workflow_component.scheduler import get_strongly_connected_components
+
+
+# Merkle-style cache keys of the nodes.
+#   key = hash(class_type, constant inputs, IS_CHANGED result, keys of the upstream nodes)
+# A cached output is valid while the key of its node doesn't change.
+# The nodes of a loop share one hash over all of the members, since their keys can't be computed one by one.
+# A node whose IS_CHANGED returns NaN or raises gets a new key on every run.
+
+# The outputs of the earlier keys kept per node, so toggling a value back re-hits them. 0 disables it.
+KEY_HISTORY_SIZE = 2
+
+stats = {'hit': 0, 'miss': 0}
+
+volatile_counter = itertools.count()
+
+
+def is_always_changed(is_changed):
+    if isinstance(is_changed, (list, tuple)):
+        return any(is_always_changed(x) for x in is_changed)
+
+    return is_changed != is_changed
+
+
+def digest(material):
+    return hashlib.blake2b(repr(material).encode(), digest_size=16).hexdigest()
+
+
+def get_local_material(prompt, unique_id, is_changed, keys, members=()):
+    value = prompt[unique_id]
+    inputs = []
+    for name, input_data in sorted(value['inputs'].items()):
+        if isinstance(input_data, list):
+            source_id = input_data[0]
+            if source_id in members:
+                inputs.append((name, 'loop', source_id, input_data[1]))
+            else:
+                inputs.append((name, 'link', keys.get(source_id), input_data[1]))
+        else:
+            inputs.append((name, 'value', fingerprint(input_data)))
+
+    if is_always_changed(is_changed):
+        is_changed = 'volatile', next(volatile_counter)
+
+    return value.get('class_type', 'DummyNode'), tuple(inputs), fingerprint(is_changed)
+
+
+# Yields (unique_id, key), the upstream nodes first.
+# get_is_changed(unique_id) is called right before the key of the node is computed,
+# so the caller has already handled the upstream nodes when the node's IS_CHANGED is evaluated.
+# node_ids: the nodes to compute, including all of their upstream nodes
+# input_keys: unique_id -> fingerprint of the value given to a component input. It replaces the material of the node.
+def iter_node_keys(prompt, node_ids, get_is_changed, input_keys):
+    node_ids = [x for x in node_ids if x in prompt]
+    node_set = set(node_ids)
+
+    next_nodes = {}
+    for unique_id in node_ids:
+        for input_data in prompt[unique_id]['inputs'].values():
+            if isinstance(input_data, list) and input_data[0] in node_set:
+                next_nodes.setdefault(input_data[0], []).append(unique_id)
+
+    keys = {}
+    # sinks come first, so the reversed order starts from the sources
+    for component in reversed(get_strongly_connected_components(node_ids, next_nodes)):
+        if len(component) == 1 and component[0] not in next_nodes.get(component[0], ()):
+            unique_id = component[0]
+            if unique_id in input_keys:
+                keys[unique_id] = digest(('input', input_keys[unique_id]))
+            else:
+                keys[unique_id] = digest(get_local_material(prompt, unique_id, get_is_changed(unique_id), keys))
+
+            yield unique_id, keys[unique_id]
+        else:
+            members = frozenset(component)
+            loop_key = digest(tuple((x,) + get_local_material(prompt, x, get_is_changed(x), keys, members) for x in sorted(component)))
+            for unique_id in component:
+                keys[unique_id] = digest((loop_key, unique_id))
+                yield unique_id, keys[unique_id]
+
+
+# key_history: unique_id -> OrderedDict(key -> (output, output_ui, inputs)), least recently used first
+# inputs: the objects whose ids went into the key. The entry keeps them alive, so a new object can't get the same key.
+def stash(key_history, unique_id, key, output, output_ui, inputs=None):
+    if KEY_HISTORY_SIZE <= 0:
+        return
+
+    history = key_history.setdefault(unique_id, OrderedDict())
+    history[key] = output, output_ui, inputs
+    history.move_to_end(key)
+    while len(history) > KEY_HISTORY_SIZE:
+        history.popitem(last=False)
+
+
+def restore(key_history, unique_id, key):
+    history = key_history.get(unique_id)
+    entry = history.pop(key, None) if history is not None else None
+    if entry is None:
+        stats['miss'] += 1
+    else:
+        stats['hit'] += 1
+
+    return entry
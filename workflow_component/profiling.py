@@ -0,0 +1,245 @@
+import cProfile
+import itertools
+import os
+import re
+import time
+import tracemalloc
+import traceback
+
+import folder_paths
+
+
+# Profiling hooks around the component invocations and their inner nodes.
+# A hook implements any of:
+#   on_component_start(component_name, node_id)
+#   on_component_end(component_name, node_id, seconds, error)
+#   on_node_start(component_name, unique_id, class_type)
+#   on_node_end(component_name, unique_id, class_type, seconds, error)
+# register_profiler(hook, component_name) limits a hook to one component, including the components nested in it.
+# The node events between on_component_start and on_component_end belong to that invocation.
+# A nested component reuses the inner node ids, so a hook keeps the state of its nodes per invocation. (a stack)
+# Nothing is called when no hook is registered.
+hooks = []  # (hook, component_name or None)
+
+# the running component invocations: [(component_name, [active hooks])]
+stack = []
+
+dump_counter = itertools.count(1)
+
+
+def register_profiler(hook, component_name=None):
+    hooks.append((hook, component_name))
+    return hook
+
+
+def unregister_profiler(hook):
+    hooks[:] = [x for x in hooks if x[0] is not hook]
+
+
+def call_hook(hook, method, *args):
+    func = getattr(hook, method, None)
+    if func is None:
+        return
+
+    try:
+        func(*args)
+    except Exception:
+        print(f"[Workflow-Component] WARN: profiling hook '{type(hook).__name__}.{method}' failed.")
+        traceback.print_exc()
+
+
+def get_hooks_for(component_name):
+    parent_hooks = stack[-1][1] if stack else []
+    return [hook for hook, target in hooks if target is None or target == component_name or hook in parent_hooks]
+
+
+def component_start(component_name, node_id):
+    if not hooks:
+        return None
+
+    active = get_hooks_for(component_name)
+    stack.append((component_name, active))
+    for hook in active:
+        call_hook(hook, 'on_component_start', component_name, node_id)
+
+    return time.perf_counter()
+
+
+def component_end(component_name, node_id, start, error=False):
+    if start is None:
+        return
+
+    _, active = stack.pop()
+    seconds = time.perf_counter() - start
+    for hook in reversed(active):
+        call_hook(hook, 'on_component_end', component_name, node_id, seconds, error)
+
+
+# the hooks for the inner nodes of the running component, or None
+def get_node_hooks():
+    if not stack or not stack[-1][1]:
+        return None
+
+    return stack[-1]
+
+
+def node_start(node_hooks, unique_id, class_type):
+    component_name, active = node_hooks
+    for hook in active:
+        call_hook(hook, 'on_node_start', component_name, unique_id, class_type)
+
+    return time.perf_counter()
+
+
+def node_end(node_hooks, unique_id, class_type, start, error=False):
+    component_name, active = node_hooks
+    seconds = time.perf_counter() - start
+    for hook in reversed(active):
+        call_hook(hook, 'on_node_end', component_name, unique_id, class_type, seconds, error)
+
+
+def get_profile_dir():
+    if hasattr(folder_paths, 'get_output_directory'):
+        return os.path.join(folder_paths.get_output_directory(), "component_profiles")
+
+    return os.path.join(os.path.dirname(os.path.dirname(__file__)), "component_profiles")
+
+
+def get_dump_path(output_dir, component_name, node_id, extension):
+    output_dir = output_dir or get_profile_dir()
+    os.makedirs(output_dir, exist_ok=True)
+    name = re.sub(r'[^0-9A-Za-z_.-]+', '_', component_name).strip('_')
+    return os.path.join(output_dir, f"{name}-{node_id}-{next(dump_counter)}.{extension}")
+
+
+# Built-in adapters. A nested component is profiled as a part of the outermost one.
+
+# cProfile: one .prof dump per component invocation (snakeviz, pstats)
+class CProfileHook:
+    def __init__(self, output_dir=None):
+        self.output_dir = output_dir
+        self.profile = None
+        self.depth = 0
+        self.last_path = None
+
+    def on_component_start(self, component_name, node_id):
+        self.depth += 1
+        if self.depth == 1:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def on_component_end(self, component_name, node_id, seconds, error):
+        self.depth -= 1
+        if self.depth == 0 and self.profile is not None:
+            self.profile.disable()
+            self.last_path = get_dump_path(self.output_dir, component_name, node_id, "prof")
+            self.profile.dump_stats(self.last_path)
+            self.profile = None
+            print(f"[Workflow-Component] cProfile: '{component_name}' ({seconds:.2f}s) -> {self.last_path}")
+
+
+# tracemalloc: the allocation growth of each component invocation, and of each inner node (per_node=True).
+# The snapshot at the end of the invocation is dumped. (tracemalloc.Snapshot.load)
+class TracemallocHook:
+    def __init__(self, output_dir=None, top=10, per_node=False):
+        self.output_dir = output_dir
+        self.top = top
+        self.per_node = per_node
+        self.depth = 0
+        self.started = False
+        self.snapshot = None
+        self.node_snapshots = []  # per running invocation: {unique_id: snapshot}
+        self.last_path = None
+
+    def on_component_start(self, component_name, node_id):
+        self.depth += 1
+        if self.depth == 1:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started = True
+
+            self.snapshot = tracemalloc.take_snapshot()
+
+        self.node_snapshots.append({})
+
+    def on_node_start(self, component_name, unique_id, class_type):
+        if self.per_node and self.node_snapshots:
+            self.node_snapshots[-1][unique_id] = tracemalloc.take_snapshot()
+
+    def on_node_end(self, component_name, unique_id, class_type, seconds, error):
+        snapshot = self.node_snapshots[-1].pop(unique_id, None) if self.node_snapshots else None
+        if snapshot is not None:
+            growth = sum(x.size_diff for x in tracemalloc.take_snapshot().compare_to(snapshot, 'filename'))
+            print(f"[Workflow-Component] tracemalloc: {class_type} #{unique_id} {growth / 1024:+.1f} KiB")
+
+    def on_component_end(self, component_name, node_id, seconds, error):
+        self.depth -= 1
+        if self.node_snapshots:
+            self.node_snapshots.pop()
+
+        if self.depth > 0 or self.snapshot is None:
+            return
+
+        snapshot = tracemalloc.take_snapshot()
+        self.last_path = get_dump_path(self.output_dir, component_name, node_id, "tracemalloc")
+        snapshot.dump(self.last_path)
+
+        print(f"[Workflow-Component] tracemalloc: '{component_name}' -> {self.last_path}")
+        for stat in snapshot.compare_to(self.snapshot, 'lineno')[:self.top]:
+            print(f"    {stat}")
+
+        self.snapshot = None
+        if self.started:
+            tracemalloc.stop()
+            self.started = False
+
+
+# torch.profiler on CPU: the inner nodes are recorded as labeled ranges. One Chrome trace per component invocation.
+class TorchProfilerHook:
+    def __init__(self, output_dir=None, top=10, record_shapes=True):
+        self.output_dir = output_dir
+        self.top = top
+        self.record_shapes = record_shapes
+        self.depth = 0
+        self.profiler = None
+        self.ranges = []  # per running invocation: {unique_id: range}
+        self.last_path = None
+
+    def on_component_start(self, component_name, node_id):
+        self.depth += 1
+        if self.depth == 1:
+            import torch.profiler
+            self.profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=self.record_shapes)
+            self.profiler.__enter__()
+
+        self.ranges.append({})
+
+    def on_node_start(self, component_name, unique_id, class_type):
+        if self.profiler is not None and self.ranges:
+            import torch.profiler
+            node_range = torch.profiler.record_function(f"{class_type} #{unique_id}")
+            node_range.__enter__()
+            self.ranges[-1][unique_id] = node_range
+
+    def on_node_end(self, component_name, unique_id, class_type, seconds, error):
+        node_range = self.ranges[-1].pop(unique_id, None) if self.ranges else None
+        if node_range is not None:
+            node_range.__exit__(None, None, None)
+
+    def on_component_end(self, component_name, node_id, seconds, error):
+        self.depth -= 1
+        if self.ranges:
+            # the ranges which were left open (e.g. by an error), the innermost first
+            for node_range in reversed(list(self.ranges.pop().values())):
+                node_range.__exit__(None, None, None)
+
+        if self.depth > 0 or self.profiler is None:
+            return
+
+        self.profiler.__exit__(None, None, None)
+        self.last_path = get_dump_path(self.output_dir, component_name, node_id, "json")
+        self.profiler.export_chrome_trace(self.last_path)
+
+        print(f"[Workflow-Component] torch.profiler: '{component_name}' -> {self.last_path}")
+        print(self.profiler.key_averages().table(sort_by="cpu_time_total", row_limit=self.top))
+        self.profiler = None
@@ -0,0 +1,86 @@
+import gc
+import sys
+import time
+
+import comfy.model_management
+
+import workflow_component.metrics as metrics
+
+
+# Memory reclamation (gc.collect + soft_empty_cache) after the component executions.
+#   'always': after every component execution (default, as before the reclaim modes)
+#   'adaptive' (opt-in): right away when the allocations since the last collection pass RECLAIM_ALLOCATED_BLOCKS
+#               or the free memory falls below RECLAIM_FREE_MEMORY_RATIO, otherwise at the beginning of the next outer prompt
+#   'next-prompt': at the beginning of the next outer prompt, right away only on low free memory
+# A custom node isn't notified when the outer prompt finishes, so a deferred collection waits for the next one.
+# Until then the garbage is held. ComfyUI collects periodically between the prompts too, so a deferred collection is mostly cheap.
+RECLAIM_MODES = ('always', 'adaptive', 'next-prompt')
+RECLAIM_MODE = 'always'
+
+RECLAIM_ALLOCATED_BLOCKS = 1_000_000  # growth of sys.getallocatedblocks()
+RECLAIM_FREE_MEMORY_RATIO = 0.1  # free / total memory of the torch device
+
+state = {'prompt': None, 'pending': False, 'blocks': sys.getallocatedblocks()}
+stats = {'always': 0, 'allocation': 0, 'pressure': 0, 'next_prompt': 0, 'deferred': 0}
+
+
+def set_reclaim_mode(mode):
+    global RECLAIM_MODE
+    if mode not in RECLAIM_MODES:
+        raise ValueError(f"unknown reclaim mode '{mode}' (expected one of {RECLAIM_MODES})")
+
+    RECLAIM_MODE = mode
+
+
+def is_memory_low():
+    if not hasattr(comfy.model_management, 'get_free_memory') or not hasattr(comfy.model_management, 'get_total_memory'):
+        return False
+
+    try:
+        total = comfy.model_management.get_total_memory()
+        return total > 0 and comfy.model_management.get_free_memory() < total * RECLAIM_FREE_MEMORY_RATIO
+    except Exception:
+        return False
+
+
+def collect(reason):
+    stats[reason] += 1
+    state['pending'] = False
+
+    start = time.perf_counter()
+    gc.collect()
+    metrics.observe_gc(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    comfy.model_management.soft_empty_cache()
+    metrics.observe_empty_cache(time.perf_counter() - start)
+
+    state['blocks'] = sys.getallocatedblocks()
+
+
+# called at the end of every component execution
+def after_execution():
+    if RECLAIM_MODE == 'always':
+        collect('always')
+    elif RECLAIM_MODE == 'adaptive' and sys.getallocatedblocks() - state['blocks'] >= RECLAIM_ALLOCATED_BLOCKS:
+        collect('allocation')
+    elif is_memory_low():
+        collect('pressure')
+    else:
+        stats['deferred'] += 1
+        state['pending'] = True
+
+
+# The deferred collection runs when a new outer prompt begins.
+# A nested component gets the prompt of its parent component, so it doesn't start a new one.
+def begin_prompt(prompt):
+    if prompt is None or state['prompt'] is prompt:
+        return
+
+    state['prompt'] = prompt
+    if state['pending']:
+        collect('next_prompt')
+
+
+def get_stats():
+    return dict(stats, mode=RECLAIM_MODE, pending=state['pending'])
@@ -0,0 +1,297 @@
+import heapq
+from collections import deque
+
+
+# The worklist of the component executor.
+# The priority of a node is computed once from the graph. The worklist is used from the executing thread only, so no lock is taken.
+#
+# priority (smaller runs first):
+#   rank: 0 for output nodes, 1 for the others, 2 for LoopControl
+#   loop depth: the nodes inside a loop are finished before the nodes outside of it
+#   frees memory: the node is the last consumer of one of its inputs
+#   critical path: the length of the longest path to a sink
+#   consumers: the number of the nodes waiting for its output
+RANK_OUTPUT = 0
+RANK_DEFAULT = 1
+RANK_LOOP_CONTROL = 2
+
+
+def get_prev_nodes_map(next_nodes):
+    prev_nodes = {}
+    for unique_id, next_ids in next_nodes.items():
+        for next_id in next_ids:
+            prev_nodes.setdefault(next_id, set()).add(unique_id)
+
+    return prev_nodes
+
+
+# iterative Tarjan. The components are returned in reverse topological order. (sinks first)
+def get_strongly_connected_components(node_ids, next_nodes):
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+    counter = 0
+
+    for root in node_ids:
+        if root in index:
+            continue
+
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(next_nodes.get(root, ())))]
+
+        while work:
+            unique_id, it = work[-1]
+            advanced = False
+
+            for next_id in it:
+                if next_id not in index:
+                    index[next_id] = lowlink[next_id] = counter
+                    counter += 1
+                    stack.append(next_id)
+                    on_stack.add(next_id)
+                    work.append((next_id, iter(next_nodes.get(next_id, ()))))
+                    advanced = True
+                    break
+                elif next_id in on_stack:
+                    lowlink[unique_id] = min(lowlink[unique_id], index[next_id])
+
+            if advanced:
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[unique_id])
+
+            if lowlink[unique_id] == index[unique_id]:
+                component = []
+                while True:
+                    x = stack.pop()
+                    on_stack.discard(x)
+                    component.append(x)
+                    if x == unique_id:
+                        break
+
+                components.append(component)
+
+    return components
+
+
+def get_priorities(node_ids, next_nodes, ranks=None):
+    node_ids = list(node_ids)
+    node_set = set(node_ids)
+    next_nodes = {key: [x for x in value if x in node_set] for key, value in next_nodes.items() if key in node_set}
+    prev_nodes = get_prev_nodes_map(next_nodes)
+
+    loop_depth = {}
+    critical_path = {}
+
+    for component in get_strongly_connected_components(node_ids, next_nodes):
+        members = set(component)
+        is_loop = len(component) > 1 or any(x in next_nodes.get(x, ()) for x in component)
+
+        # sinks come first, so the successors outside of the component are already computed
+        length = 0
+        for unique_id in component:
+            for next_id in next_nodes.get(unique_id, ()):
+                if next_id not in members:
+                    length = max(length, critical_path[next_id])
+
+        for unique_id in component:
+            loop_depth[unique_id] = 1 if is_loop else 0
+            critical_path[unique_id] = length + len(component)
+
+    priorities = {}
+    for unique_id in node_ids:
+        frees = any(len(next_nodes.get(x, ())) == 1 for x in prev_nodes.get(unique_id, ()))
+        rank = RANK_DEFAULT if ranks is None else ranks.get(unique_id, RANK_DEFAULT)
+        priorities[unique_id] = (rank, -loop_depth[unique_id], 0 if frees else 1, -critical_path[unique_id], -len(next_nodes.get(unique_id, ())))
+
+    return priorities
+
+
+class Worklist:
+    def __init__(self, priorities):
+        self.priorities = priorities
+        self.heap = []
+        self.counter = 0
+        self.queued = {}
+
+    def put(self, unique_id):
+        # insertion order breaks ties, so the order is deterministic
+        priority = self.priorities.get(unique_id, (RANK_DEFAULT,))
+        heapq.heappush(self.heap, (priority, self.counter, unique_id))
+        self.counter += 1
+        self.queued[unique_id] = self.queued.get(unique_id, 0) + 1
+
+    def get(self):
+        _, _, unique_id = heapq.heappop(self.heap)
+        count = self.queued[unique_id] - 1
+        if count == 0:
+            del self.queued[unique_id]
+        else:
+            self.queued[unique_id] = count
+
+        return unique_id
+
+    def empty(self):
+        return len(self.heap) == 0
+
+    def peek(self, n):
+        return [unique_id for _, _, unique_id in heapq.nsmallest(n, self.heap)]
+
+    # the number of distinct nodes in the worklist
+    def pending(self):
+        return len(self.queued)
+
+    def items(self):
+        return [unique_id for _, _, unique_id in sorted(self.heap)]
+
+
+# Memory-first worklist: among the ready nodes of the best rank, the one with the smallest estimated memory growth runs first.
+# growth = estimated size of its output - sizes of the inputs it is the last pending consumer of
+# The sizes are estimates taken from the previous runs. Unknown sizes count as 0.
+# The growth is a part of the heap key. It only changes when an input gets down to its last pending consumer,
+# then done() pushes that consumer again with the new key and the old entries are skipped. (lazy deletion)
+class MemoryWorklist(Worklist):
+    def __init__(self, priorities, sizes, inputs_of, pending_consumers):
+        super().__init__(priorities)
+        self.sizes = sizes
+        self.inputs_of = inputs_of
+        self.pending_consumers = pending_consumers
+        self.consumers = {}  # input -> queued consumers
+        self.entries = {}  # unique_id -> live heap entries
+        self.stale = set()  # the replaced entries
+
+    def get_growth(self, unique_id):
+        freed = sum(self.sizes.get(x, 0) for x in self.inputs_of(unique_id) if self.pending_consumers.get(x, 0) == 1)
+        return self.sizes.get(unique_id, 0) - freed
+
+    # a pushed again entry keeps its counter, so the ties are broken by the insertion order
+    def push(self, unique_id, counter):
+        priority = self.priorities.get(unique_id, (RANK_DEFAULT,))
+        entry = (priority[0], self.get_growth(unique_id), priority[1:], counter, unique_id)
+        heapq.heappush(self.heap, entry)
+        self.entries.setdefault(unique_id, []).append(entry)
+
+    def put(self, unique_id):
+        self.push(unique_id, self.counter)
+        self.counter += 1
+        self.queued[unique_id] = self.queued.get(unique_id, 0) + 1
+        for x in self.inputs_of(unique_id):
+            self.consumers.setdefault(x, set()).add(unique_id)
+
+    def get(self):
+        entry = heapq.heappop(self.heap)
+        while entry in self.stale:
+            self.stale.discard(entry)
+            entry = heapq.heappop(self.heap)
+
+        unique_id = entry[4]
+        self.entries[unique_id].remove(entry)
+        count = self.queued[unique_id] - 1
+        if count == 0:
+            del self.queued[unique_id]
+            del self.entries[unique_id]
+        else:
+            self.queued[unique_id] = count
+
+        return unique_id
+
+    def empty(self):
+        return len(self.queued) == 0
+
+    def live_entries(self):
+        return (entry for entry in self.heap if entry not in self.stale)
+
+    def peek(self, n):
+        return [entry[4] for entry in heapq.nsmallest(n, self.live_entries())]
+
+    def items(self):
+        return [entry[4] for entry in sorted(self.live_entries())]
+
+    # must be called when a node is executed
+    def done(self, unique_id):
+        for x in self.inputs_of(unique_id):
+            if x not in self.pending_consumers:
+                continue
+
+            self.pending_consumers[x] -= 1
+            if self.pending_consumers[x] == 1:
+                # the growth of the last consumer changed
+                for consumer in self.consumers.get(x, ()):
+                    entries = self.entries.get(consumer)
+                    if entries and entries[0][1] != self.get_growth(consumer):
+                        self.stale.update(entries)
+                        self.entries[consumer] = []
+                        for entry in entries:
+                            self.push(consumer, entry[3])
+
+
+def get_pending_consumers(node_ids, inputs_of):
+    pending_consumers = {}
+    for unique_id in node_ids:
+        for x in inputs_of(unique_id):
+            pending_consumers[x] = pending_consumers.get(x, 0) + 1
+
+    return pending_consumers
+
+
+# Peak of the estimated live bytes when the nodes run in 'order'.
+# An output is alive from its execution until its last consumer in the order. Outputs without a consumer stay alive.
+# When 'releasable' is given, only those outputs are freed after their last consumer, like the liveness release of the executor.
+def simulate_peak(order, inputs_of, sizes, releasable=None):
+    last_use = {}
+    for i, unique_id in enumerate(order):
+        for x in inputs_of(unique_id):
+            last_use[x] = i
+
+    alive = set()
+    live = 0
+    peak = 0
+    for i, unique_id in enumerate(order):
+        if unique_id not in alive:
+            alive.add(unique_id)
+            live += sizes.get(unique_id, 0)
+
+        peak = max(peak, live)
+
+        for x in inputs_of(unique_id):
+            if last_use[x] == i and x in alive and (releasable is None or x in releasable):
+                alive.discard(x)
+                live -= sizes.get(x, 0)
+
+    return peak
+
+
+# The order in which a FIFO worklist would run the same nodes. The nodes in a loop keep their order in 'order'.
+def get_fifo_order(order, inputs_of):
+    nodes = list(dict.fromkeys(order))
+    node_set = set(nodes)
+
+    in_degree = {}
+    next_nodes = {}
+    for unique_id in nodes:
+        inputs = [x for x in inputs_of(unique_id) if x in node_set]
+        in_degree[unique_id] = len(inputs)
+        for x in inputs:
+            next_nodes.setdefault(x, []).append(unique_id)
+
+    worklist = deque(x for x in nodes if in_degree[x] == 0)
+    fifo_order = []
+    while worklist:
+        unique_id = worklist.popleft()
+        fifo_order.append(unique_id)
+        for next_id in next_nodes.get(unique_id, ()):
+            in_degree[next_id] -= 1
+            if in_degree[next_id] == 0:
+                worklist.append(next_id)
+
+    visited = set(fifo_order)
+    fifo_order.extend(x for x in nodes if x not in visited)
+    return fifo_order
@@ -0,0 +1,80 @@
+from workflow_component.fingerprint import fingerprint
+
+
+# Output cache shared by all component executors.
+# Two executors running the same node class with the same inputs share one output object.
+# An entry lives as long as at least one executor holds its output in 'outputs'.
+ENABLE_SHARED_CACHE = True
+
+# Nodes which keep state in their outputs or have side effects.
+# A node class can also opt out with 'NOT_SHAREABLE = True'.
+SHARED_CACHE_EXCLUDED = {"LoopControl", "LoopCounterCondition", "ExecutionBlocker", "PreviewBridge"}
+
+# key -> [output, output_ui, inputs, refs]
+entries = {}
+stats = {'hit': 0, 'miss': 0}
+
+
+shareable_classes = {}
+
+
+# whether an output of the node can be reused by other nodes with the same inputs
+def is_reusable(class_def, class_type):
+    shareable = shareable_classes.get(class_def)
+    if shareable is None:
+        if class_type == "DummyNode" or class_type in SHARED_CACHE_EXCLUDED:
+            shareable = False
+        elif getattr(class_def, "NOT_SHAREABLE", False) or getattr(class_def, "OUTPUT_NODE", False):
+            shareable = False
+        else:
+            # the output may depend on the node itself (e.g. UNIQUE_ID, PROMPT)
+            shareable = len(class_def.INPUT_TYPES().get("hidden", {})) == 0
+
+        shareable_classes[class_def] = shareable
+
+    return shareable
+
+
+def is_shareable(class_def, class_type):
+    return ENABLE_SHARED_CACHE and is_reusable(class_def, class_type)
+
+
+# The input objects are compared by identity. The entry keeps them alive, so an id can't be reused while the key exists.
+def get_key(class_type, input_data_all, is_changed=None):
+    return class_type, fingerprint(is_changed, 'identity'), tuple((name, fingerprint(values, 'identity')) for name, values in sorted(input_data_all.items()))
+
+
+def acquire(key):
+    entry = entries.get(key)
+    if entry is None:
+        stats['miss'] += 1
+        return None
+
+    stats['hit'] += 1
+    entry[3] += 1
+    return entry[0], entry[1]
+
+
+def publish(key, output, output_ui, inputs):
+    if key in entries:
+        return False
+
+    entries[key] = [output, output_ui, inputs, 1]
+    return True
+
+
+def release(key):
+    entry = entries.get(key)
+    if entry is not None:
+        entry[3] -= 1
+        if entry[3] <= 0:
+            del entries[key]
+
+
+def is_held(key, output):
+    entry = entries.get(key)
+    return entry is not None and entry[0] is output
+
+
+def get_stats():
+    return {'entries': len(entries), 'hit': stats['hit'], 'miss': stats['miss']}
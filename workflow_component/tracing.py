@@ -0,0 +1,144 @@
+import itertools
+import json
+import os
+import threading
+import time
+
+import folder_paths
+
+
+# Per-node execution tracing. (off by default)
+# For every inner node of every component invocation it records the queue wait, the get_input_data time, the execution time,
+# the IS_CHANGED time, the cache hit/miss and the output tensor bytes.
+# The events of one outer prompt are written to TRACE_DIR in the Chrome trace JSON array format (chrome://tracing, https://ui.perfetto.dev).
+# A custom node isn't notified when the outer prompt finishes, so the new events are appended after each top-level component invocation.
+# The closing ']' is left out until then, which the trace viewers accept.
+# When tracing is off, get_trace() returns None and the executor skips all of the recording.
+ENABLE_TRACING = False
+TRACE_DIR = None  # None: <output directory>/component_traces
+
+current = None
+trace_counter = itertools.count(1)
+
+
+def set_tracing(enabled, trace_dir=None):
+    global ENABLE_TRACING, TRACE_DIR, current
+    ENABLE_TRACING = enabled
+    if trace_dir is not None:
+        TRACE_DIR = trace_dir
+
+    if not enabled:
+        current = None
+
+
+def get_trace_dir():
+    if TRACE_DIR is not None:
+        return TRACE_DIR
+
+    if hasattr(folder_paths, 'get_output_directory'):
+        return os.path.join(folder_paths.get_output_directory(), "component_traces")
+
+    return os.path.join(os.path.dirname(os.path.dirname(__file__)), "component_traces")
+
+
+class Trace:
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.name = f"trace-{time.strftime('%Y%m%d-%H%M%S')}-{next(trace_counter)}"
+        self.origin = time.perf_counter()
+        self.events = []
+        self.lock = threading.Lock()
+        self.pids = {}
+        self.tids = {}
+        self.stack = []  # pids of the running component invocations
+        self.path = None
+
+    # microseconds since the beginning of the trace
+    def now(self):
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def to_us(self, perf_counter_time):
+        return (perf_counter_time - self.origin) * 1e6
+
+    def get_pid(self, node_id, component_name):
+        pid = self.pids.get(node_id)
+        if pid is None:
+            pid = self.pids[node_id] = len(self.pids) + 1
+            self.events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': f"{component_name} (id={node_id})"}})
+
+        return pid
+
+    def get_tid(self):
+        ident = threading.get_ident()
+        tid = self.tids.get(ident)
+        if tid is None:
+            tid = self.tids[ident] = len(self.tids) + 1
+
+        return tid
+
+    def pid(self):
+        return self.stack[-1] if self.stack else 0
+
+    def span(self, name, cat, start, duration, args=None):
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'ts': start, 'dur': duration, 'pid': self.pid(), 'tid': self.get_tid()}
+        if args:
+            event['args'] = args
+
+        with self.lock:
+            self.events.append(event)
+
+    def instant(self, name, cat, args=None):
+        event = {'name': name, 'cat': cat, 'ph': 'i', 's': 't', 'ts': self.now(), 'pid': self.pid(), 'tid': self.get_tid()}
+        if args:
+            event['args'] = args
+
+        with self.lock:
+            self.events.append(event)
+
+    def begin_component(self, node_id, component_name):
+        self.stack.append(self.get_pid(node_id, component_name))
+        return self.now()
+
+    def end_component(self, component_name, start, args=None):
+        self.span(component_name, 'component', start, self.now() - start, args)
+        self.stack.pop()
+
+        if len(self.stack) == 0:
+            self.export()
+
+    # appends the events recorded since the last export, which are dropped from memory
+    def export(self):
+        if self.path is None:
+            self.path = os.path.join(get_trace_dir(), f"{self.name}.json")
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        with self.lock:
+            events = self.events
+            self.events = []
+
+        if len(events) == 0:
+            return self.path
+
+        with open(self.path, 'a') as f:
+            for event in events:
+                f.write("[\n" if f.tell() == 0 else ",\n")
+                f.write(json.dumps(event, default=str))
+
+        return self.path
+
+
+# The trace of the outer prompt. A new trace begins when the outer prompt changes.
+# A nested component gets the prompt of its parent component, so the trace is kept while a component is running.
+def begin_prompt(prompt):
+    global current
+    if not ENABLE_TRACING:
+        return None
+
+    if current is None or (current.prompt is not prompt and len(current.stack) == 0):
+        current = Trace(prompt)
+
+    return current
+
+
+def get_trace():
+    return current if ENABLE_TRACING else None
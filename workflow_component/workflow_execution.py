@@ -1,4 +1,13 @@
 from workflow_component.execution_experimental import *
+from workflow_component.fingerprint import fingerprint
+import workflow_component.cache_budget as cache_budget
+import workflow_component.tracing as tracing
+import workflow_component.metrics as metrics
+import workflow_component.profiling as profiling
+import workflow_component.reclaim as reclaim
+from workflow_component.profiling import register_profiler, unregister_profiler, CProfileHook, TracemallocHook, TorchProfilerHook
+from workflow_component.reclaim import set_reclaim_mode
+import time
 from server import PromptServer
 
 class VirtualServer:
@@ -58,6 +67,12 @@ executor_dict = {}
 
 def garbage_collect(keys):
     global executor_dict
+
+    for key, value in executor_dict.items():
+        if key not in keys:
+            cache_budget.forget_executor(key)
+            value[1].release_shared_refs()
+
     executor_dict = {key: value for key, value in executor_dict.items() if key in keys}
 
 
@@ -66,12 +81,16 @@ def get_executor(component_name, internal_id_name_map, node_id):
     node_id = str(node_id)
     if node_id in executor_dict:
         if executor_dict[node_id][0] != component_name:
+            executor_dict[node_id][1].release_shared_refs()
             del executor_dict[node_id]
+            cache_budget.forget_executor(node_id)
 
     if node_id not in executor_dict:
         vs = VirtualServer(component_name, internal_id_name_map, node_id)
         executor = ExpPromptExecutor(vs)
         executor.calculated_outputs = set()
+        executor.input_fingerprints = {}
+        executor.input_changes = {}
         executor_dict[node_id] = (component_name, executor)
 
     return executor_dict[node_id][1]
@@ -95,15 +114,13 @@ def is_changed(component_name, internal_id_name_map, output_mapping, **kwargs):
     if node_id not in change_map:
         change_map[node_id] = 0
 
-    nodes = extra_pnginfo['workflow']['nodes']   # ComfyUI doesn't provide extra_pnginfo on validate
-    current_component_node = [node for node in nodes if node['id'] == node_id]
+    # ComfyUI doesn't provide extra_pnginfo on validate
+    current_component_node = get_node_index(extra_pnginfo).get(node_id)
 
-    if len(current_component_node) == 0:
+    if current_component_node is None:
         print(f"MISSING NODE: {node_id}")
         change_map[node_id] += 1
         return change_map[node_id]
-    else:
-        current_component_node = current_component_node[0]
 
     pe = get_executor(component_name, internal_id_name_map, node_id)
 
@@ -122,8 +139,79 @@ def is_changed(component_name, internal_id_name_map, output_mapping, **kwargs):
     return change_map[node_id]
 
 
-def execute(component_name, prompt, workflow, internal_id_name_map, optional_inputs, input_mapping, output_mapping,
+# A component input is volatile if it changed in at least VOLATILE_INPUT_RATIO of the invocations.
+# The intermediate outputs downstream of the volatile inputs are not kept after their last use.
+VOLATILE_INPUT_RATIO = 0.5
+VOLATILE_MIN_INVOCATIONS = 3
+
+
+def update_input_changes(pe, input_node_id, changed):
+    if input_node_id not in pe.input_changes:
+        pe.input_changes[input_node_id] = [0, 0]  # the first invocation is not counted
+    else:
+        stats = pe.input_changes[input_node_id]
+        stats[1] += 1
+        if changed:
+            stats[0] += 1
+
+
+def get_volatile_inputs(pe):
+    return [key for key, (changes, invocations) in pe.input_changes.items()
+            if invocations >= VOLATILE_MIN_INVOCATIONS and changes >= invocations * VOLATILE_INPUT_RATIO]
+
+
+# 'default': static priorities, 'memory': the ready node with the smallest estimated memory growth first
+SCHEDULE_MODE = 'default'
+component_schedule_modes = {}
+
+
+# component_name: the full name ('## name [hash]') or the name without the hash. None sets the global mode.
+def set_schedule_mode(mode, component_name=None):
+    if component_name is None:
+        global SCHEDULE_MODE
+        SCHEDULE_MODE = mode
+    else:
+        component_schedule_modes[component_name] = mode
+
+
+def get_schedule_mode(component_name):
+    mode = component_schedule_modes.get(component_name)
+    if mode is None:
+        mode = component_schedule_modes.get(component_name.rsplit(' [', 1)[0])
+
+    return SCHEDULE_MODE if mode is None else mode
+
+
+execution_plans = {}
+
+
+# IS_CHANGED results of the internal nodes, shared by all the component executions of one outer prompt
+is_changed_cache = {'prompt': None, 'entries': {}}
+
+
+def get_is_changed_cache(out_prompt):
+    if out_prompt is None:
+        return None
+
+    if is_changed_cache['prompt'] is not out_prompt:
+        is_changed_cache['prompt'] = out_prompt
+        is_changed_cache['entries'] = {}
+
+    return is_changed_cache['entries']
+
+
+def get_execution_plan(component_name, prompt, workflow, optional_inputs, constant_nodes=frozenset()):
+    plan = execution_plans.get(component_name)
+    if plan is None or not plan.is_valid():
+        plan = ExecutionPlan(prompt, workflow, optional_inputs, constant_nodes)
+        execution_plans[component_name] = plan
+
+    return plan
+
+
+def execute(component_name, base_prompt, workflow, internal_id_name_map, optional_inputs, input_mapping, output_mapping, constant_nodes,
             *args, **kwargs):
+    invocation_start = time.perf_counter()
     node_id = kwargs['unique_id']
     pe = get_executor(component_name, internal_id_name_map, node_id)
     pe.server.occurred_event = None
@@ -134,18 +222,14 @@ def execute(component_name, prompt, workflow, internal_id_name_map, optional_inp
 
     given_inputs = set()
 
-    for node in kwargs['extra_pnginfo']['workflow']['nodes']:
-        if node['id'] == int(node_id):
-            current_component_node = node
-            given_input_names = kwargs['out_prompt'][node_id]['inputs'].keys()
-            given_inputs = set([str(input_mapping[name]['id']) for name in given_input_names])
-            break
+    current_component_node = get_node_index(kwargs['extra_pnginfo']).get(node_id)
+    if current_component_node is not None:
+        given_input_names = kwargs['out_prompt'][node_id]['inputs'].keys()
+        given_inputs = set([str(input_mapping[name]['id']) for name in given_input_names])
 
-    def not_equal(a, b):
-        try:
-            return a != b
-        except:
-            return True
+    # this must be calculated on-demand due to custom node loading order
+    plan = get_execution_plan(component_name, base_prompt, workflow, optional_inputs, constant_nodes)
+    prompt = plan.new_prompt(given_inputs)
 
     excluded_keys = ["unique_id", "prompt", "extra_pnginfo", 'used_output_names', 'out_prompt']
 
@@ -155,30 +239,14 @@ def execute(component_name, prompt, workflow, internal_id_name_map, optional_inp
             input_node = input_mapping[key]
             input_node_id = str(input_node['id'])
 
-            if input_node_id not in pe.outputs.keys() or not_equal(pe.outputs[input_node_id], [[value]]):
+            # The previous value is still held in pe.outputs here, so an identity fingerprint can't be reused by the new value.
+            value_fingerprint = fingerprint(value)
+            if input_node_id not in pe.outputs.keys() or pe.input_fingerprints.get(input_node_id) != value_fingerprint:
                 pe.outputs[input_node_id] = [[value]]  # TODO: check
+                pe.input_fingerprints[input_node_id] = value_fingerprint
                 changed_inputs.add(input_node_id)
 
-            pe.old_prompt[input_node_id] = prompt[input_node_id]  # prevent erasing of output cache
-
-    # get empty prompt option
-    empty_option_prompts = [key for key, value in prompt.items() if key in optional_inputs and key not in given_inputs]
-
-    # unlink unprovided option prompt
-    for key, value in prompt.items():
-        new_value = {name: input_value for name, input_value in value['inputs'].items() if
-                     not isinstance(input_value, list) or input_value[0] not in empty_option_prompts}
-        prompt[key]['inputs'] = new_value
-
-    # remove output's old_prompt for regeneration of changed
-    for key, value in prompt.items():
-        inputs = value['inputs']
-        for x in inputs:
-            input_data = inputs[x]
-            if isinstance(input_data, list):
-                input_unique_id = input_data[0]
-                if input_unique_id in changed_inputs and key in pe.old_prompt:
-                    del pe.old_prompt[key]
+            update_input_changes(pe, input_node_id, input_node_id in changed_inputs)
 
     prompt_id = get_virtual_prompt_id(node_id)
 
@@ -199,21 +267,26 @@ def execute(component_name, prompt, workflow, internal_id_name_map, optional_inp
                     output_node_id = str(output_node['id'])
                     execute_outputs.append(output_node_id)
 
-    # this must be calculated on-demand due to custom node loading order
-    for node in workflow['nodes']:
-        class_type = node['type']
-        if class_type in ["ComponentInput", "ComponentInputOptional", "ComponentOutput", "Reroute", "Note", "PrimitiveNode"]:
-            pass
-        elif class_type:
-            class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
-            if hasattr(class_def, "OUTPUT_NODE") and class_def.OUTPUT_NODE:
-                execute_outputs.append(node['id'])
+    execute_outputs.extend(plan.output_nodes)
 
     workflow['client_id'] = pe.server.client_id
-    pe.execute(prompt, prompt_id, workflow, execute_outputs=execute_outputs)
+
+    reclaim.begin_prompt(kwargs.get('out_prompt'))
+    trace = tracing.begin_prompt(kwargs.get('out_prompt'))
+    trace_start = trace.begin_component(node_id, component_name) if trace is not None else None
+    profiling_start = profiling.component_start(component_name, node_id)
+    try:
+        pe.execute(prompt, prompt_id, workflow, execute_outputs=execute_outputs, plan=plan, given_inputs=given_inputs,
+                   volatile_inputs=get_volatile_inputs(pe), schedule_mode=get_schedule_mode(component_name),
+                   is_changed_cache=get_is_changed_cache(kwargs.get('out_prompt')), input_keys=pe.input_fingerprints)
+    finally:
+        profiling.component_end(component_name, node_id, profiling_start, pe.server.occurred_event is not None)
+        if trace is not None:
+            trace.end_component(component_name, trace_start, {'node_id': node_id, 'error': pe.server.occurred_event is not None})
 
     if pe.server.occurred_event is not None:
         pe.server.update_node_status("Error", None)
+        metrics.observe_component(component_name, time.perf_counter() - invocation_start, error=True)
         if pe.server.occurred_event[0] == "execution_interrupted":
             raise comfy.model_management.InterruptProcessingException()
         else:
@@ -236,7 +309,7 @@ def execute(component_name, prompt, workflow, internal_id_name_map, optional_inp
 
         input_data_all = get_input_data(inputs, class_def, output_node_id, pe.outputs, prompt, workflow)
 
-        if input_data_all is None:
+        if not input_data_all:  # the input may be pruned as a dead branch
             print(f"ERROR: Output slot '{key}' in '{component_name}[{node_id}]' doesn't provide any value.")
             unboxed_value = None
         else:
@@ -248,4 +321,13 @@ def execute(component_name, prompt, workflow, internal_id_name_map, optional_inp
 
     results.sort(key=lambda x: x[0])
 
+    # component inputs are owned by the outer workflow, and the folded constants are counted once for the plan
+    cache_budget.update_executor(str(node_id), component_name, pe.outputs, {str(x['id']) for x in input_mapping.values()} | plan.constant_nodes,
+                                 pe.key_history)
+    cache_budget.update_constants(component_name, plan.constant_outputs)
+    if len(cache_budget.enforce_budget()) > 0:
+        for _, executor in executor_dict.values():
+            executor.sync_shared_refs()
+
+    metrics.observe_component(component_name, time.perf_counter() - invocation_start)
     return tuple(value for order, value in results)